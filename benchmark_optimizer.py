@@ -0,0 +1,217 @@
+"""
+Offline optimizer benchmark.
+
+Generates seeded synthetic manifests around a depot (uniform and clustered,
+10 to 10k stops), runs every optimize_route strategy and reports wall time,
+peak memory and tour length relative to a minimum-spanning-tree lower bound.
+Results are written as JSON so runs can be compared between versions.
+
+    python benchmark_optimizer.py --output bench.json
+    python benchmark_optimizer.py --sizes 10 100 --baseline bench.json
+    python benchmark_optimizer.py --crossover
+"""
+import argparse
+import json
+import math
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+from services.optimizer import haversine_pairs, leg_distances, optimize_route
+
+# Depot used for the synthetic manifests (Obelisco, CABA)
+DEPOT = {"id": 0, "name": "DEPÓSITO / INICIO", "address": "Depot", "lat": -34.6037, "lon": -58.3816}
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+DEFAULT_LAYOUTS = ["uniform", "clustered"]
+DEFAULT_STRATEGIES = ["nearest", "furthest", "nearest+2opt", "nearest+2opt+oropt"]
+
+# Local search budget per run, so 10k-stop cases stay bounded
+IMPROVE_TIME_LIMIT = 2.0
+
+def synthetic_stops(count, seed, spread_deg=0.08, layout="uniform"):
+    """
+    Seeded stops around DEPOT. "clustered" puts them in a handful of
+    neighbourhood-sized gaussian blobs, like real consolidated manifests.
+    """
+    rng = random.Random(seed)
+    if layout == "clustered":
+        centers = [
+            (DEPOT["lat"] + rng.uniform(-spread_deg, spread_deg), DEPOT["lon"] + rng.uniform(-spread_deg, spread_deg))
+            for _ in range(max(2, int(math.sqrt(count) / 2)))
+        ]
+    stops = []
+    for i in range(count):
+        if layout == "clustered":
+            lat, lon = rng.choice(centers)
+            lat, lon = lat + rng.gauss(0, spread_deg / 15), lon + rng.gauss(0, spread_deg / 15)
+        else:
+            lat = DEPOT["lat"] + rng.uniform(-spread_deg, spread_deg)
+            lon = DEPOT["lon"] + rng.uniform(-spread_deg, spread_deg)
+        stops.append({
+            "id": i + 1,
+            "name": f"Cliente {i + 1}",
+            "address": f"Synthetic {i + 1}",
+            "lat": lat,
+            "lon": lon,
+        })
+    return stops
+
+def mst_length(points):
+    """
+    Length (km) of the minimum spanning tree over the points (Prim, one
+    distance row per step so memory stays O(n)). Any route visiting every
+    point is at least this long, which makes it the reference bound.
+    """
+    lats = np.array([p["lat"] for p in points], dtype=float)
+    lons = np.array([p["lon"] for p in points], dtype=float)
+    n = len(points)
+    if n < 2:
+        return 0.0
+    in_tree = np.zeros(n, dtype=bool)
+    best = np.full(n, np.inf)
+    current, total = 0, 0.0
+    for _ in range(n - 1):
+        in_tree[current] = True
+        best = np.minimum(best, haversine_pairs(lats[current], lons[current], lats, lons))
+        best[in_tree] = np.inf
+        current = int(np.argmin(best))
+        total += best[current]
+    return float(total)
+
+def run_case(stops, round_trip, strategy, exact_max_stops=None, measure_memory=True):
+    """Runs one optimization. Returns wall time, peak traced memory and route length."""
+    stats = {}
+    started = time.perf_counter()
+    route = optimize_route(stops, DEPOT, None, round_trip, strategy, improve_time_limit=IMPROVE_TIME_LIMIT,
+                           stats=stats, exact_max_stops=exact_max_stops)
+    elapsed = time.perf_counter() - started
+
+    peak = None
+    if measure_memory:
+        # Separate traced run: tracing slows Python code down and would skew the timing
+        tracemalloc.start()
+        optimize_route(stops, DEPOT, None, round_trip, strategy, improve_time_limit=IMPROVE_TIME_LIMIT,
+                       exact_max_stops=exact_max_stops)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        "wall_time_s": elapsed,
+        "peak_memory_bytes": peak,
+        "length_km": float(leg_distances(route).sum()),
+        "solver": stats.get("strategy", strategy),
+    }
+
+def run_suite(sizes=DEFAULT_SIZES, layouts=DEFAULT_LAYOUTS, strategies=DEFAULT_STRATEGIES,
+              seed=42, round_trip=True, measure_memory=True):
+    results = []
+    for layout in layouts:
+        for size in sizes:
+            stops = synthetic_stops(size, seed + size, layout=layout)
+            bound = mst_length([DEPOT] + stops)
+            for strategy in strategies:
+                result = run_case(stops, round_trip, strategy, measure_memory=measure_memory)
+                result.update({
+                    "layout": layout,
+                    "stops": size,
+                    "strategy": strategy,
+                    "round_trip": round_trip,
+                    "mst_km": bound,
+                    "ratio_to_mst": result["length_km"] / bound if bound else None,
+                })
+                results.append(result)
+                print(
+                    f"{layout:>9} {size:>6} {strategy:>20} "
+                    f"{result['wall_time_s'] * 1000:>10.1f} ms "
+                    f"{(result['peak_memory_bytes'] or 0) / 2**20:>8.1f} MiB "
+                    f"x{result['ratio_to_mst']:.3f} MST"
+                )
+    return results
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+def compare_with_baseline(results, baseline_path):
+    """Prints time and quality deltas against a previous JSON report."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(r["layout"], r["stops"], r["strategy"]): r for r in baseline["results"]}
+
+    print(f"\nvs {baseline_path} ({baseline.get('revision')})")
+    for r in results:
+        old = previous.get((r["layout"], r["stops"], r["strategy"]))
+        if not old:
+            continue
+        time_delta = (r["wall_time_s"] / old["wall_time_s"] - 1) * 100 if old["wall_time_s"] else 0.0
+        quality_delta = (r["ratio_to_mst"] / old["ratio_to_mst"] - 1) * 100 if old["ratio_to_mst"] else 0.0
+        print(f"{r['layout']:>9} {r['stops']:>6} {r['strategy']:>20} time {time_delta:+7.1f}%  length {quality_delta:+6.2f}%")
+
+def held_karp_crossover(sizes=range(4, 19), seeds=range(5), round_trip=True):
+    """
+    Compares the exact solver with the heuristics for small manifests.
+    The crossover is where exact time stops being negligible next to the
+    heuristic path, while the heuristic gap to the optimum is still visible.
+    """
+    print(f"{'stops':>5} {'exact ms':>9} {'nn ms':>7} {'nn+ls ms':>9} {'nn gap %':>9} {'nn+ls gap %':>12}")
+    for size in sizes:
+        totals = {"exact": [0.0, 0.0], "nearest": [0.0, 0.0], "nearest+2opt+oropt": [0.0, 0.0]}
+        for seed in seeds:
+            stops = synthetic_stops(size, seed)
+            for strategy, limit in (("exact", size), ("nearest", 0), ("nearest+2opt+oropt", 0)):
+                result = run_case(stops, round_trip, "nearest" if strategy == "exact" else strategy, limit,
+                                  measure_memory=False)
+                totals[strategy][0] += result["wall_time_s"]
+                totals[strategy][1] += result["length_km"]
+
+        runs = len(seeds)
+        exact_len = totals["exact"][1]
+        print(
+            f"{size:>5} "
+            f"{totals['exact'][0] / runs * 1000:>9.2f} "
+            f"{totals['nearest'][0] / runs * 1000:>7.2f} "
+            f"{totals['nearest+2opt+oropt'][0] / runs * 1000:>9.2f} "
+            f"{(totals['nearest'][1] / exact_len - 1) * 100:>9.2f} "
+            f"{(totals['nearest+2opt+oropt'][1] / exact_len - 1) * 100:>12.2f}"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline optimize_route benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--layouts", nargs="+", default=DEFAULT_LAYOUTS, choices=DEFAULT_LAYOUTS)
+    parser.add_argument("--strategies", nargs="+", default=DEFAULT_STRATEGIES)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--open", action="store_true", help="Open routes instead of round trips")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the traced run for peak memory")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Previous JSON report to compare against")
+    parser.add_argument("--crossover", action="store_true", help="Only print the Held-Karp crossover table")
+    args = parser.parse_args()
+
+    if args.crossover:
+        held_karp_crossover()
+    else:
+        results = run_suite(args.sizes, args.layouts, args.strategies, args.seed,
+                            round_trip=not args.open, measure_memory=not args.no_memory)
+        report = {
+            "generated_at": datetime.utcnow().isoformat(),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "seed": args.seed,
+            "improve_time_limit_s": IMPROVE_TIME_LIMIT,
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {len(results)} results to {args.output}")
+
+        if args.baseline:
+            compare_with_baseline(results, args.baseline)
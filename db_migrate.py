@@ -64,6 +64,102 @@ def migrate():
         """)
         print("Tabla configurations lista.")
 
+        # Shared geocode cache (models.GeocodeCacheEntry)
+        print("Creando tabla geocode_cache si no existe...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS geocode_cache (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                key_hash VARCHAR(40) UNIQUE NOT NULL,
+                address_key VARCHAR(500) NOT NULL,
+                lat DOUBLE NOT NULL,
+                lon DOUBLE NOT NULL,
+                details TEXT,
+                updated_at DATETIME NOT NULL,
+                INDEX ( key_hash )
+            ) CHARACTER SET utf8mb4
+        """)
+        print("Tabla geocode_cache lista.")
+
+        # Addresses no query variant could resolve (models.GeocodeNegativeEntry)
+        print("Creando tabla geocode_negative_cache si no existe...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS geocode_negative_cache (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                key_hash VARCHAR(40) UNIQUE NOT NULL,
+                address_key VARCHAR(500) NOT NULL,
+                created_at DATETIME NOT NULL,
+                INDEX ( key_hash )
+            ) CHARACTER SET utf8mb4
+        """)
+        print("Tabla geocode_negative_cache lista.")
+
+        # Success counts of the geocoder query variants (models.GeocodeVariantStat)
+        print("Creando tabla geocode_variant_stats si no existe...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS geocode_variant_stats (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                key_hash VARCHAR(40) UNIQUE NOT NULL,
+                region_bias VARCHAR(255) NOT NULL,
+                pattern VARCHAR(100) NOT NULL,
+                variant VARCHAR(20) NOT NULL,
+                tried INT NOT NULL,
+                succeeded INT NOT NULL,
+                updated_at DATETIME NOT NULL,
+                INDEX ( key_hash )
+            ) CHARACTER SET utf8mb4
+        """)
+        print("Tabla geocode_variant_stats lista.")
+
+        # Road legs between rounded coordinate pairs (models.OSRMLegCacheEntry)
+        print("Creando tabla osrm_leg_cache si no existe...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS osrm_leg_cache (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                key_hash VARCHAR(40) UNIQUE NOT NULL,
+                leg_key VARCHAR(100) NOT NULL,
+                distance DOUBLE NOT NULL,
+                duration DOUBLE NOT NULL,
+                geometry MEDIUMTEXT,
+                updated_at DATETIME NOT NULL,
+                INDEX ( key_hash ),
+                INDEX ( updated_at )
+            ) CHARACTER SET utf8mb4
+        """)
+        print("Tabla osrm_leg_cache lista.")
+
+        # Background optimization jobs (models.OptimizationJob)
+        print("Creando tabla optimization_jobs si no existe...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS optimization_jobs (
+                id VARCHAR(32) PRIMARY KEY,
+                user_id INT NOT NULL,
+                status VARCHAR(20) NOT NULL,
+                filename VARCHAR(255) NOT NULL,
+                options TEXT NOT NULL,
+                file_data LONGBLOB,
+                result LONGTEXT,
+                error TEXT,
+                error_status INT,
+                worker VARCHAR(100),
+                attempts INT NOT NULL DEFAULT 0,
+                heartbeat_at DATETIME,
+                created_at DATETIME NOT NULL,
+                started_at DATETIME,
+                finished_at DATETIME,
+                INDEX ( user_id ),
+                INDEX ( status ),
+                INDEX ( created_at )
+            ) CHARACTER SET utf8mb4
+        """)
+        for col_name, col_type in [("attempts", "INT NOT NULL DEFAULT 0"), ("heartbeat_at", "DATETIME")]:
+            try:
+                cursor.execute(f"ALTER TABLE optimization_jobs ADD COLUMN {col_name} {col_type}")
+                print(f"Columna optimization_jobs.{col_name} agregada.")
+            except pymysql.err.InternalError as e:
+                if e.args[0] != 1060: # Column already exists
+                    raise e
+        print("Tabla optimization_jobs lista.")
+
         # Ensure existing admin is active and verified
         cursor.execute("UPDATE users SET is_active = 1, email_verified = 1 WHERE role = 'admin'")
 
@@ -1,8 +1,8 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Depends, status
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Depends, Query, status
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional, Union
 import shutil
 import os
 import json
@@ -11,8 +11,8 @@ import schemas
 import auth
 import database
 from services.parser import parse_pdf
-from services.geocoder import geocode_addresses
-from services.optimizer import optimize_route
+from services.geocoder import geocode_addresses, cache_stats, invalidate_negative, provider_stats, region_bias_from_details, strategy_stats
+from services.optimizer import optimize_route, parse_strategy
 from services.email_service import EmailService
 from datetime import datetime, timedelta
 
@@ -288,6 +288,104 @@ def update_email_config(config_data: schemas.EmailConfigUpdate, db: Session = De
     db.commit()
     return {"message": "Configuración de email actualizada con éxito"}
 
+# --- GEOCODING CACHE (ADMIN ONLY) ---
+
+@app.get("/api/geocode-cache/stats")
+def get_geocode_cache_stats(current_user: models.User = Depends(auth.check_admin_role)):
+    return cache_stats()
+
+@app.get("/api/geocode-strategies/stats")
+def get_geocode_strategy_stats(current_user: models.User = Depends(auth.check_admin_role)):
+    return strategy_stats()
+
+@app.get("/api/geocode-providers/stats")
+def get_geocode_provider_stats(current_user: models.User = Depends(auth.check_admin_role)):
+    return provider_stats()
+
+@app.delete("/api/geocode-cache/negative")
+def clear_negative_geocode_cache(address: Optional[List[str]] = Query(None), region_bias: Optional[str] = None,
+                                 current_user: models.User = Depends(auth.check_admin_role)):
+    # Without addresses every cached failure is forgotten
+    removed = invalidate_negative(address, region_bias)
+    return {"message": f"{removed} direcciones eliminadas de la caché de fallos", "removed": removed}
+
+@app.get("/api/osrm-cache/stats")
+def get_osrm_cache_stats(current_user: models.User = Depends(auth.check_admin_role)):
+    from services.osrm_service import leg_cache_stats
+    return leg_cache_stats()
+
+@app.get("/api/circuit-breakers")
+def get_circuit_breakers(current_user: models.User = Depends(auth.check_admin_role)):
+    from services.circuit_breaker import breaker_states
+    # Breakers live in each worker process: this is the state seen by the one answering
+    return {"pid": os.getpid(), "breakers": breaker_states()}
+
+@app.post("/api/circuit-breakers/{name}/reset")
+def reset_circuit_breaker(name: str, current_user: models.User = Depends(auth.check_admin_role)):
+    from services.circuit_breaker import reset_breaker
+    if not reset_breaker(name):
+        raise HTTPException(status_code=404, detail="Circuit breaker no encontrado")
+    return {"message": f"Circuit breaker {name} cerrado", "pid": os.getpid()}
+
+@app.post("/api/geocode-cache/warmup")
+def start_geocode_cache_warmup(
+    file: UploadFile = File(...),
+    start_row: int = Form(1),
+    address_col: str = Form("A"),
+    csv_column: str = Form(None), # header name or 0-based index (CSV only)
+    region_bias: str = Form(None),
+    start_address: str = Form(None), # derive the region bias like /api/optimize-route does
+    current_user: models.User = Depends(auth.check_admin_role)
+):
+    from services.cache_warmer import WarmupJob, read_addresses, resolve_region_bias, start_in_background
+    from services.circuit_breaker import CircuitOpenError
+
+    if not file.filename.lower().endswith(('.xlsx', '.xls', '.csv')):
+        raise HTTPException(status_code=400, detail="File must be Excel (.xlsx) or CSV")
+
+    temp_file = f"temp_{file.filename}"
+    try:
+        with open(temp_file, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+        addresses = read_addresses(temp_file, start_row, address_col, csv_column)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+    if not addresses:
+        raise HTTPException(status_code=400, detail="No addresses found in file")
+
+    try:
+        region_bias = resolve_region_bias(region_bias, start_address)
+    except CircuitOpenError:
+        raise HTTPException(status_code=503, detail="Geocoding unavailable, try again later")
+    job = WarmupJob.create(addresses, region_bias, source=file.filename)
+    start_in_background(job)
+    return job.progress()
+
+@app.get("/api/geocode-cache/warmup/{job_id}")
+def get_geocode_cache_warmup(job_id: str, current_user: models.User = Depends(auth.check_admin_role)):
+    from services.cache_warmer import WarmupJob
+    job = WarmupJob.load(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Tarea de precarga no encontrada")
+    return job.progress()
+
+@app.post("/api/geocode-cache/warmup/{job_id}/resume")
+def resume_geocode_cache_warmup(job_id: str, current_user: models.User = Depends(auth.check_admin_role)):
+    from services.cache_warmer import WarmupJob, is_running_here, start_in_background
+    job = WarmupJob.load(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Tarea de precarga no encontrada")
+    if job.state["status"] == "completed":
+        return job.progress()
+    # "running" in the file with no thread here means the process that ran it is gone
+    if is_running_here(job_id) or not start_in_background(job):
+        raise HTTPException(status_code=409, detail="La tarea de precarga ya está en ejecución")
+    return job.progress()
+
 @app.delete("/api/users/{user_id}")
 def delete_user(user_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.check_admin_role)):
     user = db.query(models.User).filter(models.User.id == user_id).first()
@@ -306,6 +404,8 @@ class Location(BaseModel):
     address: str
     lat: float
     lon: float
+    quantity: Optional[int] = None # Package count (Bultos) when the file has it
+    match_confidence: Optional[float] = None # Set when the address was matched to a known one with a typo
     distance_stop: float = 0.0 # km from previous
     duration_stop: float = 0.0 # seconds from previous
 
@@ -313,168 +413,456 @@ class SkippedItem(BaseModel):
     name: str
     address: str
     error: str
+    from_cache: bool = False # Known failure from the negative geocode cache, no lookup was made
+
+class OptimizationStats(BaseModel):
+    strategy: str # "exact" when the Held-Karp solver was used
+    cost_unit: str = "km" # "km" (straight line or OSRM distance) or "s" (OSRM duration)
+    initial_cost: float # greedy tour, in cost_unit
+    final_cost: float # after local search / exact solve, in cost_unit
+    improvement_pct: float
+    improvement_time: float # seconds spent improving the greedy tour
+    iterations: int # improving moves applied
 
 class OptimizedRoute(BaseModel):
     locations: List[Location]
     skipped: List[SkippedItem]
     total_distance: float = 0.0
     total_duration: float = 0.0 # seconds
-    geometry: str = None # Encoded polyline or GeoJSON string
+    geometry: Optional[Union[dict, str]] = None # GeoJSON LineString object, or encoded polyline string
+    geometry_format: str = "geojson" # "geojson", "polyline" (precision 5) or "polyline6"
+    optimization: Optional[OptimizationStats] = None # Only when local search or the exact solver ran
+    vehicle: Optional[int] = None # Multi-vehicle mode: 1-based vehicle number
+    load: Optional[int] = None # Multi-vehicle mode: packages assigned to this vehicle
+
+def build_route_response(optimized_locations, skipped, optimization_stats=None,
+                         geometry_format="geojson", geometry_tolerance=None, **extra):
+    """
+    Fills per-leg and total distance/duration for an ordered route (OSRM,
+    or a 30 km/h straight-line estimate if OSRM fails) and wraps it in an
+    OptimizedRoute, with the geometry in geometry_format and simplified to
+    geometry_tolerance meters when given.
+    """
+    from services.geometry import format_geometry
+    total_dist = 0.0
+    total_time = 0.0
+    route_geometry = None
+    
+    # Prepare Coords for OSRM: List of (lon, lat)
+    path_coords = [(loc['lon'], loc['lat']) for loc in optimized_locations]
+    
+    if len(path_coords) >= 2:
+        from services.osrm_service import get_osrm_route
+        osrm_data = get_osrm_route(path_coords)
+        
+        if osrm_data:
+             route_geometry = format_geometry(osrm_data['geometry']['coordinates'], geometry_format, geometry_tolerance)
+             total_time = osrm_data['duration'] # seconds
+             total_dist = osrm_data['distance'] / 1000.0 # meters to km (OSRM returns meters)
+             
+             # Assign stats per leg
+             legs = osrm_data.get('legs', [])
+             # Legs connect points. Leg 0 connects Point 0 (Start) to Point 1.
+             # So Optimized Location 1 (index 1) gets stats from Leg 0.
+             # Start location (index 0) has 0 dist/time.
+             
+             for i, leg in enumerate(legs):
+                 # Guard against index out of bounds
+                 if i + 1 < len(optimized_locations):
+                     opt_loc = optimized_locations[i+1]
+                     # Convert OSRM meters/seconds to km/seconds for consistency
+                     opt_loc['distance_stop'] = leg['distance'] / 1000.0
+                     opt_loc['duration_stop'] = leg['duration']
+                     
+        else:
+             # Fallback: Calculate straight line distance (all legs at once)
+             from services.optimizer import leg_distances
+             legs_km = leg_distances(optimized_locations)
+             for i, dist_km in enumerate(legs_km):
+                 # Est time
+                 time_s = (dist_km / 30.0) * 3600
+                 
+                 optimized_locations[i+1]['distance_stop'] = float(dist_km)
+                 optimized_locations[i+1]['duration_stop'] = float(time_s)
+                 
+             total_dist = float(legs_km.sum())
+             total_time = (total_dist / 30.0) * 3600
+
+    return OptimizedRoute(
+        locations=optimized_locations, 
+        skipped=skipped,
+        total_distance=total_dist,
+        total_duration=total_time,
+        geometry=route_geometry,
+        geometry_format=geometry_format,
+        optimization=optimization_stats or None,
+        **extra
+    )
 
-@app.post("/api/optimize-route", response_model=OptimizedRoute)
-async def optimize_route_endpoint(
-    file: UploadFile = File(...),
+class StopInsert(BaseModel):
+    name: str
+    address: str
+    lat: Optional[float] = None # Geocoded by the server when missing
+    lon: Optional[float] = None
+    quantity: Optional[int] = None
+
+class RouteEditRequest(BaseModel):
+    route: OptimizedRoute # As returned by /api/optimize-route
+    remove_ids: List[int] = []
+    insert: List[StopInsert] = []
+    region_bias: Optional[str] = "Argentina"
+    geometry_format: Optional[str] = None # Defaults to the format of route.geometry
+    geometry_tolerance: Optional[float] = None # meters, Douglas-Peucker simplification
+
+@app.post("/api/optimize-route/edit", response_model=OptimizedRoute)
+def edit_route_endpoint(edit: RouteEditRequest, current_user: models.User = Depends(auth.get_current_user)):
+    """
+    Inserts or removes stops on an already optimized route without
+    re-optimizing it: cheapest insertion for new stops, and only the legs
+    touched by the edit are refreshed through OSRM.
+    """
+    from services.circuit_breaker import CircuitOpenError
+    from services.geocoder import geocode_single
+    from services.geometry import GEOMETRY_FORMATS, format_geometry, parse_geometry
+    from services.route_editor import edit_route
+
+    route = edit.route
+    if not route.locations:
+        raise HTTPException(status_code=400, detail="The route has no locations")
+
+    geometry_format = edit.geometry_format or route.geometry_format
+    if geometry_format not in GEOMETRY_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown geometry_format: {geometry_format}")
+
+    skipped = [item.dict() for item in route.skipped]
+    new_stops = []
+    for stop in edit.insert:
+        lat, lon = stop.lat, stop.lon
+        if lat is None or lon is None:
+            try:
+                result = geocode_single(stop.address, edit.region_bias)
+            except CircuitOpenError:
+                skipped.append({"name": stop.name, "address": stop.address, "error": "Geocoding Unavailable"})
+                continue
+            if not result:
+                skipped.append({"name": stop.name, "address": stop.address, "error": "Not Found"})
+                continue
+            lat, lon, _ = result
+        new_stop = {"name": stop.name, "address": stop.address, "lat": lat, "lon": lon}
+        if stop.quantity is not None:
+            new_stop["quantity"] = stop.quantity
+        new_stops.append(new_stop)
+
+    geometry_coords = parse_geometry(route.geometry, route.geometry_format)
+
+    locations, _, (total_dist, total_time, coords) = edit_route(
+        [loc.dict() for loc in route.locations], geometry_coords,
+        remove_ids=edit.remove_ids, insert=new_stops
+    )
+
+    return OptimizedRoute(
+        locations=locations,
+        skipped=skipped,
+        total_distance=total_dist,
+        total_duration=total_time,
+        geometry=format_geometry(coords, geometry_format, edit.geometry_tolerance),
+        geometry_format=geometry_format,
+        vehicle=route.vehicle,
+        load=sum(loc.get("quantity") or 0 for loc in locations) if route.load is not None else None
+    )
+
+def optimize_form(
     start_address: str = Form(None),
     max_distance: float = Form(None),
     excel_start_row: int = Form(1),
     excel_address_col: str = Form("A"),
+    excel_quantity_col: str = Form(None), # column with the package count (Bultos), e.g. "D"
     round_trip: bool = Form(False),
-    strategy: str = Form("nearest"),
-    current_user: models.User = Depends(auth.get_current_user)
+    strategy: str = Form("nearest"), # e.g. "nearest", "furthest", "nearest+2opt", "nearest+2opt+oropt"
+    improve_time_limit: float = Form(None), # seconds for the local search stage
+    improve_max_iterations: int = Form(None),
+    exact_max_stops: int = Form(None), # solve exactly up to this many stops (0 disables)
+    vehicles: int = Form(1), # > 1 returns one OptimizedRoute per vehicle
+    vehicle_capacity: int = Form(None), # packages per vehicle (multi-vehicle mode)
+    cost_source: str = Form("haversine"), # "haversine", "osrm_duration" or "osrm_distance"
+    geometry_format: str = Form("geojson"), # "geojson", "polyline" (precision 5) or "polyline6"
+    geometry_tolerance: float = Form(None), # meters, Douglas-Peucker simplification of the geometry
 ):
-    is_pdf = file.filename.lower().endswith('.pdf')
-    is_excel = file.filename.lower().endswith(('.xlsx', '.xls'))
+    """Form options shared by /api/optimize-route and /api/optimize-route/jobs, as optimize_manifest kwargs."""
+    return {
+        "start_address": start_address,
+        "max_distance": max_distance,
+        "excel_start_row": excel_start_row,
+        "excel_address_col": excel_address_col,
+        "excel_quantity_col": excel_quantity_col,
+        "round_trip": round_trip,
+        "strategy": strategy,
+        "improve_time_limit": improve_time_limit,
+        "improve_max_iterations": improve_max_iterations,
+        "exact_max_stops": exact_max_stops,
+        "vehicles": vehicles,
+        "vehicle_capacity": vehicle_capacity,
+        "cost_source": cost_source,
+        "geometry_format": geometry_format,
+        "geometry_tolerance": geometry_tolerance,
+    }
 
-    if not (is_pdf or is_excel):
+def validate_optimize_request(filename, options):
+    """Rejects uploads and options the pipeline cannot handle, before any work is done."""
+    if not filename.lower().endswith(('.pdf', '.xlsx', '.xls')):
         raise HTTPException(status_code=400, detail="File must be PDF or Excel (.xlsx)")
-    
-    temp_file = f"temp_{file.filename}"
+
+    if options["vehicles"] < 1:
+        raise HTTPException(status_code=400, detail="vehicles must be at least 1")
+
     try:
-        with open(temp_file, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        raw_addresses = []
-        
-        # 1. Parse File based on type
-        if is_pdf:
-             raw_addresses = parse_pdf(temp_file)
-        elif is_excel:
-             from services.excel_parser import parse_excel
-             raw_addresses = parse_excel(temp_file, excel_start_row, excel_address_col)
-
-        if not raw_addresses:
-            raise HTTPException(status_code=400, detail="No addresses found in file")
-
-        # 2. Geocode Start Address FIRST to get Context
-        start_location = None
-        region_bias = "Argentina" # Default bias
-        
-        if start_address:
-            # Import here to avoid circular dependencies if any, or just use the geocoder import
-            from services.geocoder import geocode_single
+        parse_strategy(options["strategy"])
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    if options["cost_source"] not in ("haversine", "osrm_duration", "osrm_distance"):
+        raise HTTPException(status_code=400, detail=f"Unknown cost_source: {options['cost_source']}")
+
+    from services.geometry import GEOMETRY_FORMATS
+    if options["geometry_format"] not in GEOMETRY_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown geometry_format: {options['geometry_format']}")
+
+def optimize_manifest(file_path, filename, start_address=None, max_distance=None, excel_start_row=1,
+                      excel_address_col="A", excel_quantity_col=None, round_trip=False, strategy="nearest",
+                      improve_time_limit=None, improve_max_iterations=None, exact_max_stops=None, vehicles=1,
+                      vehicle_capacity=None, cost_source="haversine", geometry_format="geojson",
+                      geometry_tolerance=None):
+    """
+    Parse -> geocode -> optimize -> OSRM pipeline for an uploaded manifest
+    (PDF or Excel at file_path). Returns an OptimizedRoute, or one per vehicle.
+    Raises HTTPException for bad input, like the endpoints that call it.
+    """
+    raw_addresses = []
+    
+    # 1. Parse File based on type
+    if filename.lower().endswith('.pdf'):
+         raw_addresses = parse_pdf(file_path)
+    else:
+         from services.excel_parser import parse_excel
+         raw_addresses = parse_excel(file_path, excel_start_row, excel_address_col, excel_quantity_col)
+
+    if not raw_addresses:
+        raise HTTPException(status_code=400, detail="No addresses found in file")
+
+    # 2. Geocode Start Address FIRST to get Context
+    start_location = None
+    region_bias = "Argentina" # Default bias
+    
+    if start_address:
+        # Import here to avoid circular dependencies if any, or just use the geocoder import
+        from services.circuit_breaker import CircuitOpenError
+        from services.geocoder import geocode_single
+        try:
             result = geocode_single(start_address)
+        except CircuitOpenError:
+            raise HTTPException(status_code=503, detail="Geocoding unavailable, try again later")
+        
+        if result:
+            lat, lon, details = result
+            start_location = {
+                "id": 0,
+                "name": "DEPÓSITO / INICIO",
+                "address": start_address,
+                "lat": lat,
+                "lon": lon
+            }
             
-            if result:
-                lat, lon, details = result
-                start_location = {
-                    "id": 0,
-                    "name": "DEPÓSITO / INICIO",
-                    "address": start_address,
-                    "lat": lat,
-                    "lon": lon
-                }
-                
-                # Extract context from details
-                components = []
-                if 'city' in details: components.append(details['city'])
-                elif 'town' in details: components.append(details['town'])
+            # Extract context from details
+            detected = region_bias_from_details(details)
+            if detected:
+                region_bias = detected
+                print(f"Detected Region Bias: {region_bias}")
                 
-                if 'state' in details: components.append(details['state'])
-                if 'country' in details: components.append(details['country'])
-                
-                if components:
-                    region_bias = ", ".join(components)
-                    print(f"Detected Region Bias: {region_bias}")
-                    
-            else:
-                 raise HTTPException(status_code=400, detail=f"Could not geocode start address: {start_address}")
-        
-        # If max_distance is set, we really need a start location.
-        if max_distance and not start_location:
-            raise HTTPException(status_code=400, detail="Start address is required when using Max Distance filter.")
-
-        # 3. Geocode Deliveries using Region Bias
-        geocode_result = geocode_addresses(raw_addresses, region_bias)
-        locations = geocode_result["found"]
-        skipped = geocode_result["not_found"]
+        else:
+             raise HTTPException(status_code=400, detail=f"Could not geocode start address: {start_address}")
+    
+    # If max_distance is set, we really need a start location.
+    if max_distance and not start_location:
+        raise HTTPException(status_code=400, detail="Start address is required when using Max Distance filter.")
+
+    # 3. Geocode Deliveries using Region Bias
+    geocode_result = geocode_addresses(raw_addresses, region_bias)
+    locations = geocode_result["found"]
+    skipped = geocode_result["not_found"]
+
+    optimizer_options = {
+        "improve_time_limit": improve_time_limit,
+        "improve_max_iterations": improve_max_iterations,
+        "exact_max_stops": exact_max_stops,
+    }
 
-        # 4. Optimize
-        optimized_locations = optimize_route(locations, start_location, max_distance, round_trip, strategy)
-        
-        # Check against original locations to assume which were filtered by distance
-        opt_ids = {loc["id"] for loc in optimized_locations}
-        for loc in locations:
-            if loc["id"] not in opt_ids:
-                 skipped.append({
-                     "name": loc["name"],
-                     "address": loc["address"],
-                     "error": f"Distance > {max_distance}km"
-                 })
-
-        # 5. Get OSRM Data (Real Path & Duration)
-        total_dist = 0.0
-        total_time = 0.0
-        route_geometry = None
-        
-        # Prepare Coords for OSRM: List of (lon, lat)
-        path_coords = [(loc['lon'], loc['lat']) for loc in optimized_locations]
-        
-        if len(path_coords) >= 2:
-            from services.osrm_service import get_osrm_route
-            osrm_data = get_osrm_route(path_coords)
-            
-            if osrm_data:
-                 route_geometry = json.dumps(osrm_data['geometry'])
-                 total_time = osrm_data['duration'] # seconds
-                 total_dist = osrm_data['distance'] / 1000.0 # meters to km (OSRM returns meters)
-                 
-                 # Assign stats per leg
-                 legs = osrm_data.get('legs', [])
-                 # Legs connect points. Leg 0 connects Point 0 (Start) to Point 1.
-                 # So Optimized Location 1 (index 1) gets stats from Leg 0.
-                 # Start location (index 0) has 0 dist/time.
-                 
-                 for i, leg in enumerate(legs):
-                     # Guard against index out of bounds
-                     if i + 1 < len(optimized_locations):
-                         opt_loc = optimized_locations[i+1]
-                         # Convert OSRM meters/seconds to km/seconds for consistency
-                         opt_loc['distance_stop'] = leg['distance'] / 1000.0
-                         opt_loc['duration_stop'] = leg['duration']
-                         
+    # Road costs: one bulk OSRM /table matrix over [start] + locations
+    cost_unit = "km"
+    if cost_source != "haversine" and locations:
+        from services.osrm_service import get_osrm_table
+        nodes = ([start_location] if start_location else []) + locations
+        table = get_osrm_table([(loc['lon'], loc['lat']) for loc in nodes])
+        if table:
+            if cost_source == "osrm_duration":
+                optimizer_options["cost_matrix"] = table["durations"]
+                cost_unit = "s"
             else:
-                 # Fallback: Calculate straight line distance
-                 from services.optimizer import calculate_distance
-                 for i in range(len(optimized_locations) - 1):
-                     l1 = optimized_locations[i]
-                     l2 = optimized_locations[i+1]
-                     dist_km = calculate_distance(l1['lat'], l1['lon'], l2['lat'], l2['lon'])
-                     total_dist += dist_km
-                     
-                     # Est time
-                     time_s = (dist_km / 30.0) * 3600
-                     
-                     optimized_locations[i+1]['distance_stop'] = dist_km
-                     optimized_locations[i+1]['duration_stop'] = time_s
-                     
-                 total_time = (total_dist / 30.0) * 3600
-
-        return OptimizedRoute(
-            locations=optimized_locations, 
-            skipped=skipped,
-            total_distance=total_dist,
-            total_duration=total_time,
-            geometry=route_geometry
+                optimizer_options["cost_matrix"] = table["distances"] / 1000.0
+        else:
+            print("OSRM table unavailable, optimizing on straight-line distance")
+
+    # 4a. Multi-vehicle: split by capacity, optimize each vehicle in the process pool
+    if vehicles > 1:
+        from services.fleet import optimize_fleet
+        fleet_routes, unassigned = optimize_fleet(
+            locations, start_location, max_distance, round_trip, strategy,
+            num_vehicles=vehicles, capacity=vehicle_capacity, **optimizer_options
         )
 
+        unassigned_ids = {loc["id"] for loc in unassigned}
+        routed_ids = {loc["id"] for route in fleet_routes for loc in route["locations"]}
+        for loc in locations:
+            if loc["id"] in unassigned_ids:
+                skipped.append({
+                    "name": loc["name"],
+                    "address": loc["address"],
+                    "error": f"Capacity exceeded ({vehicles} vehicles x {vehicle_capacity} packages)"
+                })
+            elif loc["id"] not in routed_ids:
+                skipped.append({
+                    "name": loc["name"],
+                    "address": loc["address"],
+                    "error": f"Distance > {max_distance}km"
+                })
+
+        for route in fleet_routes:
+            if route["stats"]:
+                route["stats"]["cost_unit"] = cost_unit
+
+        # Manifest-level skipped items are reported once, on the first vehicle
+        return [
+            build_route_response(
+                route["locations"], skipped if i == 0 else [], route["stats"],
+                geometry_format, geometry_tolerance,
+                vehicle=route["vehicle"], load=route["load"]
+            )
+            for i, route in enumerate(fleet_routes)
+        ]
+
+    # 4. Optimize
+    optimization_stats = {}
+    optimized_locations = optimize_route(
+        locations, start_location, max_distance, round_trip, strategy,
+        stats=optimization_stats, **optimizer_options
+    )
+    
+    if optimization_stats:
+        optimization_stats["cost_unit"] = cost_unit
+    
+    # Check against original locations to assume which were filtered by distance
+    opt_ids = {loc["id"] for loc in optimized_locations}
+    for loc in locations:
+        if loc["id"] not in opt_ids:
+             skipped.append({
+                 "name": loc["name"],
+                 "address": loc["address"],
+                 "error": f"Distance > {max_distance}km"
+             })
+
+    # 5. Get OSRM Data (Real Path & Duration)
+    return build_route_response(optimized_locations, skipped, optimization_stats,
+                                geometry_format, geometry_tolerance)
+
+@app.post("/api/optimize-route", response_model=Union[OptimizedRoute, List[OptimizedRoute]])
+async def optimize_route_endpoint(
+    file: UploadFile = File(...),
+    options: dict = Depends(optimize_form),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    validate_optimize_request(file.filename, options)
+    
+    temp_file = f"temp_{file.filename}"
+    try:
+        with open(temp_file, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+
+        return optimize_manifest(temp_file, file.filename, **options)
+
     except HTTPException as he:
         raise he
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         if os.path.exists(temp_file):
             os.remove(temp_file)
 
+# --- OPTIMIZATION JOBS ---
+
+def run_optimization_job(job_id, filename, file_data, options):
+    """OptimizationJobQueue handler: the /api/optimize-route pipeline on a stored upload, as JSON."""
+    from fastapi.encoders import jsonable_encoder
+    temp_file = f"temp_{job_id}_{os.path.basename(filename)}"
+    try:
+        with open(temp_file, "wb") as buffer:
+            buffer.write(file_data)
+        return jsonable_encoder(optimize_manifest(temp_file, filename, **options))
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+from services.optimization_jobs import OptimizationJobQueue, QueueFullError, COMPLETED, FAILED
+optimization_jobs = OptimizationJobQueue(run_optimization_job)
+
+@app.on_event("startup")
+def startup_optimization_jobs():
+    # Every worker process picks up queued jobs, including ones submitted to other workers
+    optimization_jobs.start()
+
+def get_own_job(job_id, current_user):
+    job = optimization_jobs.get(job_id)
+    if job is None or (job["user_id"] != current_user.id and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Optimization job not found")
+    return job
+
+@app.post("/api/optimize-route/jobs", status_code=202)
+async def submit_optimization_job(
+    file: UploadFile = File(...),
+    options: dict = Depends(optimize_form),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """
+    Same input as /api/optimize-route, processed in the background. Poll
+    /api/optimize-route/jobs/{job_id} and fetch .../result once completed.
+    """
+    validate_optimize_request(file.filename, options)
+    try:
+        job_id = optimization_jobs.submit(current_user.id, file.filename, await file.read(), options)
+    except QueueFullError:
+        raise HTTPException(status_code=429, detail="Too many optimization jobs waiting, try again later")
+    return get_own_job(job_id, current_user)
+
+@app.get("/api/optimize-route/jobs/{job_id}")
+def get_optimization_job(job_id: str, current_user: models.User = Depends(auth.get_current_user)):
+    return get_own_job(job_id, current_user)
+
+@app.get("/api/optimize-route/jobs/{job_id}/result", response_model=Union[OptimizedRoute, List[OptimizedRoute]])
+def get_optimization_job_result(job_id: str, current_user: models.User = Depends(auth.get_current_user)):
+    job = get_own_job(job_id, current_user)
+    if job["status"] == FAILED:
+        # The error the synchronous endpoint would have returned
+        raise HTTPException(status_code=job["error_status"] or 500, detail=job["error"])
+    if job["status"] != COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Optimization job is {job['status']}")
+    return optimization_jobs.result(job_id)
+
+@app.get("/api/optimization-jobs/stats")
+def get_optimization_job_stats(current_user: models.User = Depends(auth.check_admin_role)):
+    return optimization_jobs.stats()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
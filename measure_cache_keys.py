@@ -0,0 +1,120 @@
+"""
+Measures geocode cache hit rates with raw vs canonical cache keys on real
+address spellings.
+
+Observations are (address as written in the manifest, lat, lon), replayed in
+upload order against an empty cache. Stops that resolved to the same point
+(rounded to --precision decimals) are the same place, so a lookup for a place
+seen before should hit: the report gives the share that does with each key,
+split into repeats with the identical spelling and with a different one. It
+also counts canonical keys shared by different places (false merges).
+
+Sources: the routes of completed optimization jobs in the database (--jobs)
+and/or CSV files with address, lat and lon columns (e.g. exported routes).
+Runs offline: nothing is geocoded.
+
+    python measure_cache_keys.py --jobs
+    python measure_cache_keys.py routes_march.csv routes_april.csv --region-bias CABA
+"""
+import argparse
+import csv
+import json
+import sys
+from collections import defaultdict
+from services.address_normalizer import cache_key
+
+def raw_key(address, region_bias=None):
+    # Key used before canonicalization
+    return address.strip()
+
+def _route_stops(result):
+    # A job result is one OptimizedRoute or a list of them (multi-vehicle)
+    for route in result if isinstance(result, list) else [result]:
+        for loc in route.get("locations", []):
+            yield loc["address"], loc["lat"], loc["lon"]
+
+def job_observations(limit=None):
+    """(address, lat, lon) of every stop routed by completed optimization jobs, oldest job first."""
+    from sqlalchemy import select
+    import database
+    import models
+    table = models.OptimizationJob
+    query = select(table.result).where(table.status == "completed").order_by(table.created_at)
+    if limit:
+        query = query.limit(limit)
+    with database.SessionLocal() as db:
+        for raw in db.scalars(query):
+            if raw:
+                yield from _route_stops(json.loads(raw))
+
+def csv_observations(path):
+    """(address, lat, lon) rows of a CSV with address/direccion, lat and lon headers."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            row = {k.strip().lower(): v for k, v in row.items() if k}
+            address = row.get("address") or row.get("direccion") or row.get("dirección")
+            try:
+                lat, lon = float(row["lat"]), float(row["lon"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if address and address.strip():
+                yield address, lat, lon
+
+def measure(observations, key_fn, region_bias, precision):
+    """
+    Replays the observations against an empty cache keyed by key_fn.
+    Returns a dict of lookups and hits for repeated places (same and other
+    spelling) and the number of keys shared by more than one place.
+    """
+    cache = {}  # key -> place
+    spellings = defaultdict(set)  # place -> spellings seen
+    places_by_key = defaultdict(set)
+    counts = {"repeats": 0, "hits": 0, "same_spelling": 0, "same_hits": 0, "variant_spelling": 0, "variant_hits": 0}
+    for address, lat, lon in observations:
+        place = (round(lat, precision), round(lon, precision))
+        key = key_fn(address, region_bias)
+        spelling = address.strip()
+        if spellings[place]:
+            same = spelling in spellings[place]
+            hit = cache.get(key) == place
+            counts["repeats"] += 1
+            counts["hits"] += hit
+            counts["same_spelling" if same else "variant_spelling"] += 1
+            counts["same_hits" if same else "variant_hits"] += hit
+        spellings[place].add(spelling)
+        cache.setdefault(key, place)
+        places_by_key[key].add(place)
+    counts["false_merges"] = sum(1 for places in places_by_key.values() if len(places) > 1)
+    return counts
+
+def _pct(hits, total):
+    return f"{hits / total * 100:.1f}%" if total else "-"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Geocode cache key hit rates on real address spellings")
+    parser.add_argument("files", nargs="*", help="CSV files with address, lat and lon columns")
+    parser.add_argument("--jobs", action="store_true", help="read completed optimization job results from the database")
+    parser.add_argument("--job-limit", type=int, help="oldest N completed jobs only")
+    parser.add_argument("--region-bias", default="CABA")
+    parser.add_argument("--precision", type=int, default=4, help="lat/lon decimals that identify a place (4 = about 10 m)")
+    args = parser.parse_args()
+    if not args.files and not args.jobs:
+        parser.error("give CSV files and/or --jobs")
+
+    observations = []
+    if args.jobs:
+        observations.extend(job_observations(args.job_limit))
+    for path in args.files:
+        observations.extend(csv_observations(path))
+    if not observations:
+        sys.exit("No observations found")
+
+    print(f"{len(observations)} stops, {len({(round(lat, args.precision), round(lon, args.precision)) for _, lat, lon in observations})} places")
+    print(f"{'key':<10} {'repeats':>8} {'hit %':>7} {'same spelling':>14} {'other spelling':>15} {'false merges':>13}")
+    for label, key_fn in (("raw", raw_key), ("canonical", cache_key)):
+        c = measure(observations, key_fn, args.region_bias, args.precision)
+        print(
+            f"{label:<10} {c['repeats']:>8} {_pct(c['hits'], c['repeats']):>7} "
+            f"{_pct(c['same_hits'], c['same_spelling']):>14} "
+            f"{_pct(c['variant_hits'], c['variant_spelling']):>15} {c['false_merges']:>13}"
+        )
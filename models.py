@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Enum, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Enum, Boolean, DateTime, Float, LargeBinary, Text
+from sqlalchemy.dialects.mysql import LONGBLOB, LONGTEXT, MEDIUMTEXT
 from database import Base
 import enum
 
@@ -36,4 +37,66 @@ class Configuration(Base):
     value = Column(String(255), nullable=False)
     description = Column(String(255), nullable=True)
 
+class GeocodeCacheEntry(Base):
+    __tablename__ = "geocode_cache"
 
+    id = Column(Integer, primary_key=True, index=True)
+    # sha1 of the normalized address: fixed width, so long addresses fit a unique index
+    key_hash = Column(String(40), unique=True, index=True, nullable=False)
+    address_key = Column(String(500), nullable=False)
+    lat = Column(Float, nullable=False)
+    lon = Column(Float, nullable=False)
+    details = Column(Text, nullable=True) # JSON address details from the provider
+    updated_at = Column(DateTime, nullable=False)
+
+class GeocodeNegativeEntry(Base):
+    __tablename__ = "geocode_negative_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    key_hash = Column(String(40), unique=True, index=True, nullable=False)
+    address_key = Column(String(500), nullable=False)
+    created_at = Column(DateTime, nullable=False) # When every query variant came back empty
+
+class GeocodeVariantStat(Base):
+    __tablename__ = "geocode_variant_stats"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # sha1 of "region_bias|pattern|variant"
+    key_hash = Column(String(40), unique=True, index=True, nullable=False)
+    region_bias = Column(String(255), nullable=False) # canonical region bias
+    pattern = Column(String(100), nullable=False) # address_pattern()
+    variant = Column(String(20), nullable=False) # "bias", "raw", "argentina", "caba"
+    tried = Column(Integer, nullable=False)
+    succeeded = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+class OSRMLegCacheEntry(Base):
+    __tablename__ = "osrm_leg_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # sha1 of the rounded "lon,lat;lon,lat" pair
+    key_hash = Column(String(40), unique=True, index=True, nullable=False)
+    leg_key = Column(String(100), nullable=False)
+    distance = Column(Float, nullable=False) # meters
+    duration = Column(Float, nullable=False) # seconds
+    geometry = Column(Text().with_variant(MEDIUMTEXT(), "mysql"), nullable=True) # JSON [lon, lat] list of the leg; full-resolution legs outgrow TEXT
+    updated_at = Column(DateTime, nullable=False, index=True) # last write or hit; least recent entries are evicted first
+
+class OptimizationJob(Base):
+    __tablename__ = "optimization_jobs"
+
+    id = Column(String(32), primary_key=True) # uuid4 hex, handed to the client
+    user_id = Column(Integer, index=True, nullable=False)
+    status = Column(String(20), index=True, nullable=False) # queued, running, completed, failed
+    filename = Column(String(255), nullable=False)
+    options = Column(Text, nullable=False) # JSON optimize_manifest keyword arguments
+    file_data = Column(LargeBinary().with_variant(LONGBLOB(), "mysql"), nullable=True) # dropped once processed
+    result = Column(Text().with_variant(LONGTEXT(), "mysql"), nullable=True) # JSON OptimizedRoute or list of them
+    error = Column(Text, nullable=True)
+    error_status = Column(Integer, nullable=True) # HTTP status the synchronous endpoint would have answered
+    worker = Column(String(100), nullable=True) # host:pid that claimed it
+    attempts = Column(Integer, nullable=False, default=0) # times claimed
+    heartbeat_at = Column(DateTime, nullable=True) # lease renewed by the running worker
+    created_at = Column(DateTime, index=True, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
@@ -0,0 +1,175 @@
+"""
+Local OSRM (and Nominatim) stand-in for development and offline testing.
+
+Serves /route and /table with the same JSON shape as osrm-routed, using
+straight-line distance times a detour factor at a fixed speed, and a
+Nominatim-style /search that places every query at a stable point around
+Buenos Aires (queries containing "nowhere" have no match).
+
+Faults can be injected to exercise retries and circuit breakers: a share of
+requests fails with an HTTP error, and/or every request is delayed. Set them
+at startup or change them while running with GET /_faults?fail_rate=&delay=&status=.
+
+    python osrm_standin.py --port 5000 --fail-rate 0.5 --delay 2
+    OSRM_URL=http://localhost:5000 NOMINATIM_DOMAIN=localhost:5000 NOMINATIM_SCHEME=http uvicorn main:app
+    curl "http://localhost:5000/_faults?fail_rate=1"   # full outage
+"""
+import argparse
+import hashlib
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from services.geometry import encode_polyline
+from services.optimizer import calculate_distance
+
+DETOUR_FACTOR = 1.3
+SPEED_KMH = 30.0
+
+def leg(a, b):
+    # (distance m, duration s) between two (lon, lat) points
+    km = calculate_distance(a[1], a[0], b[1], b[0]) * DETOUR_FACTOR
+    return km * 1000, km / SPEED_KMH * 3600
+
+class OSRMStandIn(BaseHTTPRequestHandler):
+    max_table_size = 100
+    # Injected faults (shared by every request)
+    fail_rate = 0.0
+    fail_status = 503
+    delay = 0.0
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        query = parse_qs(url.query)
+        if parts[0] == "_faults":
+            return self._faults(query)
+
+        if OSRMStandIn.delay:
+            time.sleep(OSRMStandIn.delay)
+        if random.random() < OSRMStandIn.fail_rate:
+            return self._send(OSRMStandIn.fail_status, {"code": "Unavailable", "message": "Injected fault"})
+
+        if parts[0] == "search":
+            return self._search(query)
+        if len(parts) != 4 or parts[1] != "v1":
+            return self._send(400, {"code": "InvalidUrl", "message": url.path})
+
+        service, coord_str = parts[0], parts[3]
+        try:
+            coords = [tuple(float(v) for v in c.split(",")) for c in coord_str.split(";")]
+        except ValueError:
+            return self._send(400, {"code": "InvalidQuery", "message": "Bad coordinates"})
+
+        if service == "route":
+            return self._route(coords, query)
+        if service == "table":
+            return self._table(coords, query)
+        return self._send(400, {"code": "InvalidService", "message": service})
+
+    def _route(self, coords, query):
+        if len(coords) < 2:
+            return self._send(400, {"code": "InvalidQuery", "message": "Need at least 2 coordinates"})
+        with_steps = query.get("steps", ["false"])[0] == "true"
+        geometries = query.get("geometries", ["polyline"])[0]
+        overview = query.get("overview", ["simplified"])[0]
+
+        def line(points):
+            points = [list(c) for c in points]
+            if geometries == "geojson":
+                return {"type": "LineString", "coordinates": points}
+            return encode_polyline(points, 6 if geometries == "polyline6" else 5)
+
+        legs = []
+        for a, b in zip(coords, coords[1:]):
+            distance, duration = leg(a, b)
+            steps = []
+            if with_steps:
+                steps = [{
+                    "geometry": line([a, b]),
+                    "distance": distance, "duration": duration, "name": "", "mode": "driving",
+                }]
+            legs.append({"distance": distance, "duration": duration, "steps": steps, "summary": "", "weight": duration})
+        route = {
+            "legs": legs,
+            "distance": sum(l["distance"] for l in legs),
+            "duration": sum(l["duration"] for l in legs),
+            "weight_name": "routability",
+            "weight": sum(l["duration"] for l in legs),
+        }
+        if overview != "false":
+            route["geometry"] = line(coords)
+        waypoints = [{"location": list(c), "name": ""} for c in coords]
+        self._send(200, {"code": "Ok", "routes": [route], "waypoints": waypoints})
+
+    def _table(self, coords, query):
+        if len(coords) > self.max_table_size:
+            return self._send(400, {"code": "TooBig", "message": "Too many table coordinates"})
+
+        def indices(name):
+            if name not in query or query[name][0] == "all":
+                return list(range(len(coords)))
+            return [int(i) for i in query[name][0].split(";")]
+
+        sources, destinations = indices("sources"), indices("destinations")
+        annotations = query.get("annotations", ["duration"])[0].split(",")
+        cells = [[leg(coords[s], coords[d]) for d in destinations] for s in sources]
+
+        payload = {"code": "Ok"}
+        if "duration" in annotations:
+            payload["durations"] = [[c[1] for c in row] for row in cells]
+        if "distance" in annotations:
+            payload["distances"] = [[c[0] for c in row] for row in cells]
+        self._send(200, payload)
+
+    def _faults(self, query):
+        cls = OSRMStandIn
+        if "fail_rate" in query:
+            cls.fail_rate = float(query["fail_rate"][0])
+        if "delay" in query:
+            cls.delay = float(query["delay"][0])
+        if "status" in query:
+            cls.fail_status = int(query["status"][0])
+        self._send(200, {"fail_rate": cls.fail_rate, "delay": cls.delay, "status": cls.fail_status})
+
+    def _search(self, query):
+        q = query.get("q", [""])[0]
+        if not q or "nowhere" in q.lower():
+            return self._send(200, [])
+        # Stable pseudo-location within ~10 km of the Obelisco
+        digest = hashlib.sha1(q.lower().encode("utf-8")).digest()
+        lat = -34.6037 + (digest[0] / 255 - 0.5) * 0.18
+        lon = -58.3816 + (digest[1] / 255 - 0.5) * 0.22
+        self._send(200, [{
+            "lat": str(lat), "lon": str(lon), "display_name": q,
+            "address": {"city": "Buenos Aires", "state": "Ciudad Autónoma de Buenos Aires", "country": "Argentina"},
+        }])
+
+    def log_message(self, format, *args):
+        pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OSRM stand-in")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--max-table-size", type=int, default=100)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered with an error")
+    parser.add_argument("--fail-status", type=int, default=503)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds added to every request")
+    args = parser.parse_args()
+
+    OSRMStandIn.max_table_size = args.max_table_size
+    OSRMStandIn.fail_rate = args.fail_rate
+    OSRMStandIn.fail_status = args.fail_status
+    OSRMStandIn.delay = args.delay
+    server = ThreadingHTTPServer(("0.0.0.0", args.port), OSRMStandIn)
+    print(f"OSRM stand-in listening on :{args.port}")
+    server.serve_forever()
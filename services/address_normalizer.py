@@ -0,0 +1,88 @@
+import re
+import unicodedata
+
+# Street-type and title abbreviations seen on manifests -> full word
+ABBREVIATIONS = {
+    "av": "avenida", "avda": "avenida", "ave": "avenida",
+    "gral": "general", "cnel": "coronel", "tte": "teniente", "pte": "presidente", "pres": "presidente",
+    "dr": "doctor", "ing": "ingeniero", "prof": "profesor", "sta": "santa", "sto": "santo",
+    "pje": "pasaje", "psje": "pasaje", "bv": "boulevard", "bvd": "boulevard", "blvd": "boulevard",
+    "cno": "camino", "diag": "diagonal", "pcia": "provincia", "prov": "provincia", "cdad": "ciudad",
+}
+
+# Spellings of the same place (applied to the lowercase, accent-free form)
+PLACE_ALIASES = [
+    (re.compile(r"\bc\s?a\s?b\s?a\b"), "caba"),
+    (re.compile(r"\bciudad autonoma de buenos aires\b"), "caba"),
+    (re.compile(r"\bcapital federal\b"), "caba"),
+    (re.compile(r"\bbs\s?as\b"), "buenos aires"),
+]
+
+# "N° 2759", "Nro. 2759", "nº2759", "#2759" -> "2759"
+NUMBER_MARKER = re.compile(r"(?:\b(?:n|no|nro|num|numero)\s?[.°º]?|#)\s*(?=\d)", re.IGNORECASE)
+# "2.759" -> "2759" (thousands separator inside a house number)
+THOUSANDS_DOT = re.compile(r"(?<=\d)\.(?=\d{3}\b)")
+SIN_NUMERO = re.compile(r"\bs\s?/\s?n\b", re.IGNORECASE)
+PUNCTUATION = re.compile(r"[^\w\s]")
+
+_ABBREVIATION_PATTERN = re.compile(r"\b(" + "|".join(ABBREVIATIONS) + r")\b\.?(?=\s)", re.IGNORECASE)
+
+def strip_accents(text):
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+def _unify_numbers(text, sin_numero=" sn "):
+    text = SIN_NUMERO.sub(sin_numero, text)
+    text = NUMBER_MARKER.sub("", text)
+    return THOUSANDS_DOT.sub("", text)
+
+def canonicalize(address):
+    """
+    Canonical form used for cache keys: lowercase, no accents or punctuation,
+    abbreviations expanded, house-number formats unified, place aliases
+    folded ("C.A.B.A." -> "caba"), a leading "calle" and the country dropped.
+    """
+    if not address:
+        return ""
+    text = _unify_numbers(strip_accents(address).casefold())
+    text = PUNCTUATION.sub(" ", text)
+    tokens = [ABBREVIATIONS.get(token, token) for token in text.split()]
+    if tokens and tokens[0] == "calle":
+        tokens = tokens[1:]
+    if tokens and tokens[-1] == "argentina":
+        tokens = tokens[:-1]
+    text = " ".join(tokens)
+    for pattern, replacement in PLACE_ALIASES:
+        text = pattern.sub(replacement, text)
+    return text
+
+STREET_TYPES = ("avenida", "pasaje", "boulevard", "diagonal", "camino")
+
+def address_pattern(address):
+    """
+    Coarse shape of an address, e.g. "avenida+numero+localidad": street type,
+    whether it has a house number and whether a locality follows a comma.
+    """
+    tokens = canonicalize(address).split()
+    pattern = tokens[0] if tokens and tokens[0] in STREET_TYPES else "calle"
+    if any(token.isdigit() for token in tokens):
+        pattern += "+numero"
+    if "," in (address or ""):
+        pattern += "+localidad"
+    return pattern
+
+def cache_key(address, region_bias=None):
+    """Cache key for an address resolved with a given region bias: the same street in two regions never shares an entry."""
+    return f"{canonicalize(address)}|{canonicalize(region_bias)}"
+
+def search_form(address):
+    """
+    Query text sent to the geocoding provider: abbreviations expanded,
+    "C.A.B.A." style aliases replaced by CABA, house numbers cleaned and
+    whitespace collapsed. Case and accents are kept.
+    """
+    # "s/n" (no house number) means nothing to the provider
+    text = _unify_numbers(" ".join(address.split()), sin_numero=" ")
+    text = _ABBREVIATION_PATTERN.sub(lambda m: ABBREVIATIONS[m.group(1).lower()].capitalize(), text)
+    text = re.sub(r"C\.\s?A\.\s?B\.\s?A\.?", "CABA", text)
+    text = text.replace("Ciudad Autónoma de Buenos Aires", "CABA")
+    return " ".join(text.split())
@@ -0,0 +1,194 @@
+import csv
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+# Job state files (address list + progress), so jobs can be resumed after a restart
+WARMUP_DIR = os.getenv("GEOCODE_WARMUP_DIR", os.path.join("/tmp" if os.path.exists("/tmp") else ".", "geocode_warmup"))
+# Addresses handed to geocode_addresses at a time; progress is saved after each chunk
+CHUNK_SIZE = int(os.getenv("GEOCODE_WARMUP_CHUNK", "20"))
+# Region bias used by the optimize endpoint when the start address gives no context
+DEFAULT_REGION_BIAS = "Argentina"
+
+def read_addresses(file_path, start_row=1, address_col="A", csv_column=None):
+    """
+    Address list from an Excel file (via parse_excel) or a CSV.
+    For CSV, csv_column is a header name or a 0-based index (default: an
+    "address"/"direccion" header, else the first column).
+    """
+    if file_path.lower().endswith((".xlsx", ".xls")):
+        from services.excel_parser import parse_excel
+        return [item["address"] for item in parse_excel(file_path, start_row, address_col)]
+
+    with open(file_path, newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.reader(f))
+    if not rows:
+        return []
+
+    header = [cell.strip().lower() for cell in rows[0]]
+    if csv_column is not None and str(csv_column).isdigit():
+        index, body = int(csv_column), rows
+    elif csv_column is not None:
+        if csv_column.strip().lower() not in header:
+            raise ValueError(f"CSV has no column {csv_column}")
+        index, body = header.index(csv_column.strip().lower()), rows[1:]
+    else:
+        known = [name for name in ("address", "direccion", "dirección") if name in header]
+        index, body = (header.index(known[0]), rows[1:]) if known else (0, rows)
+    return [row[index].strip() for row in body if len(row) > index and row[index].strip()]
+
+def resolve_region_bias(region_bias=None, start_address=None):
+    """
+    Same region bias the optimize endpoint would use, so warmed entries are hit
+    by its cache keys. Raises CircuitOpenError if the start address has to be
+    geocoded while the providers are unavailable.
+    """
+    if region_bias:
+        return region_bias
+    if start_address:
+        from services.geocoder import geocode_single, region_bias_from_details
+        result = geocode_single(start_address)
+        if result:
+            return region_bias_from_details(result[2]) or DEFAULT_REGION_BIAS
+    return DEFAULT_REGION_BIAS
+
+class WarmupJob:
+    """
+    Geocodes an address list into the persistent cache, chunk by chunk, through
+    geocode_addresses (so rate limits, dedup and negative caching all apply).
+    State is saved to WARMUP_DIR/<id>.json after every chunk; run() continues
+    from the saved position.
+    """
+
+    def __init__(self, state):
+        self.state = state
+        self._stop = threading.Event()
+
+    @classmethod
+    def create(cls, addresses, region_bias, source=None):
+        from services.address_normalizer import cache_key
+        # One entry per cache key: the same customer written twice is geocoded once
+        unique = list({cache_key(addr, region_bias): addr for addr in addresses if addr}.values())
+        job = cls({
+            "id": uuid.uuid4().hex[:12],
+            "source": source,
+            "region_bias": region_bias,
+            "addresses": unique,
+            "total": len(unique),
+            "position": 0,
+            "hits": 0,
+            "misses": 0,
+            "failed": 0,
+            "status": "pending",
+            "created_at": datetime.utcnow().isoformat(),
+            "updated_at": None,
+            "elapsed": 0.0,
+            "error": None,
+        })
+        job.save()
+        return job
+
+    @staticmethod
+    def path(job_id):
+        return os.path.join(WARMUP_DIR, f"{job_id}.json")
+
+    @classmethod
+    def load(cls, job_id):
+        if not job_id.isalnum() or not os.path.exists(cls.path(job_id)):
+            return None
+        with open(cls.path(job_id), "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def save(self):
+        os.makedirs(WARMUP_DIR, exist_ok=True)
+        self.state["updated_at"] = datetime.utcnow().isoformat()
+        tmp = self.path(self.state["id"]) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp, self.path(self.state["id"]))
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self, on_progress=None):
+        from services.address_normalizer import cache_key
+        from services.geocoder import cached_results, geocode_addresses
+
+        state = self.state
+        region_bias = state["region_bias"]
+        state["status"] = "running"
+        state["error"] = None
+        self.save()
+        try:
+            while state["position"] < state["total"] and not self._stop.is_set():
+                started = time.perf_counter()
+                chunk = state["addresses"][state["position"]:state["position"] + CHUNK_SIZE]
+
+                cached = cached_results([cache_key(addr, region_bias) for addr in chunk])
+                misses = [addr for addr in chunk if cache_key(addr, region_bias) not in cached]
+                found = failed = 0
+                if misses:
+                    result = geocode_addresses([{"name": addr, "address": addr} for addr in misses], region_bias)
+                    if any(item["error"] == "Geocoding Unavailable" for item in result["not_found"]):
+                        # Upstream breaker open: stop here, the chunk is retried on resume
+                        state["error"] = "Geocoding upstream unavailable"
+                        break
+                    found, failed = len(result["found"]), len(result["not_found"])
+
+                state["hits"] += len(chunk) - len(misses)
+                state["misses"] += found
+                state["failed"] += failed
+                state["position"] += len(chunk)
+                state["elapsed"] += time.perf_counter() - started
+                self.save()
+                if on_progress:
+                    on_progress(self.progress())
+            state["status"] = "completed" if state["position"] >= state["total"] else "paused"
+        except Exception as e:
+            state["status"] = "failed"
+            state["error"] = str(e)
+        self.save()
+        return self.progress()
+
+    def progress(self):
+        state = self.state
+        done, total, elapsed = state["position"], state["total"], state["elapsed"]
+        throughput = done / elapsed if elapsed > 0 else None
+        return {
+            "job_id": state["id"],
+            "status": state["status"],
+            "source": state["source"],
+            "region_bias": state["region_bias"],
+            "total": total,
+            "processed": done,
+            "hits": state["hits"],
+            "misses": state["misses"],
+            "failed": state["failed"],
+            "elapsed_seconds": round(elapsed, 1),
+            "throughput_per_second": round(throughput, 2) if throughput else None,
+            "eta_seconds": round((total - done) / throughput, 1) if throughput else None,
+            "updated_at": state["updated_at"],
+            "error": state["error"],
+        }
+
+_running = {}
+_running_lock = threading.Lock()
+
+def start_in_background(job):
+    """Runs the job on a daemon thread of this process. Returns False if it is already running here."""
+    with _running_lock:
+        thread = _running.get(job.state["id"])
+        if thread is not None and thread.is_alive():
+            return False
+        thread = threading.Thread(target=job.run, name=f"warmup-{job.state['id']}", daemon=True)
+        _running[job.state["id"]] = thread
+        thread.start()
+        return True
+
+def is_running_here(job_id):
+    with _running_lock:
+        thread = _running.get(job_id)
+        return thread is not None and thread.is_alive()
@@ -0,0 +1,185 @@
+import os
+import threading
+import time
+from collections import deque
+
+# Defaults per upstream; override with <NAME>_BREAKER_FAILURE_RATE, _MIN_CALLS,
+# _WINDOW, _OPEN_SECONDS and _HALF_OPEN_PROBES, e.g. OSRM_BREAKER_OPEN_SECONDS=60
+DEFAULT_FAILURE_RATE = 0.5   # share of failed calls in the window that opens the breaker
+DEFAULT_MIN_CALLS = 10       # calls in the window before the rate is trusted
+DEFAULT_WINDOW = 20          # most recent calls considered
+DEFAULT_OPEN_SECONDS = 30.0  # time calls fail fast before probing again
+DEFAULT_HALF_OPEN_PROBES = 1 # successful probes needed to close again
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+    def __init__(self, name):
+        super().__init__(f"{name} unavailable (circuit open)")
+        self.name = name
+
+class CircuitBreaker:
+    """
+    Per-upstream circuit breaker over the outcome of the last `window` calls.
+
+    closed: calls go through; once at least min_calls are recorded and the
+    failure share reaches failure_rate, the breaker opens.
+    open: calls fail fast with CircuitOpenError for open_seconds.
+    half_open: up to half_open_probes calls at a time are let through; that
+    many successes close the breaker, any failure opens it again.
+    """
+
+    def __init__(self, name, failure_rate=DEFAULT_FAILURE_RATE, min_calls=DEFAULT_MIN_CALLS,
+                 window=DEFAULT_WINDOW, open_seconds=DEFAULT_OPEN_SECONDS, half_open_probes=DEFAULT_HALF_OPEN_PROBES):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self._outcomes = deque(maxlen=window)  # True = success
+        self._state = CLOSED
+        # Bumped on every state change; allow() hands it out as the admission token
+        self._generation = 1
+        self._opened_at = None
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    def _set_state(self, state):
+        # Caller holds _lock
+        self._state = state
+        self._generation += 1
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    def _refresh(self):
+        # Caller holds _lock
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._set_state(HALF_OPEN)
+
+    def _open(self):
+        # Caller holds _lock
+        self._set_state(OPEN)
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.opened += 1
+
+    @property
+    def state(self):
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def allow(self):
+        """
+        Admission token if a call may go through now (counts as a probe in
+        half-open), None otherwise. Pass the token back to record().
+        """
+        with self._lock:
+            self._refresh()
+            if self._state == CLOSED:
+                return self._generation
+            if self._state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return self._generation
+            self.rejected += 1
+            return None
+
+    def record(self, token, success):
+        """
+        Records the outcome of a call admitted with `token`. Outcomes of calls
+        admitted under an earlier state (e.g. a slow call let through while
+        closed that finishes after the breaker opened and went half-open) are
+        ignored, so only the probes themselves decide a half-open breaker.
+        """
+        with self._lock:
+            if token != self._generation:
+                return
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if not success:
+                    self._open()
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._set_state(CLOSED)
+                return
+            self._outcomes.append(bool(success))
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._open()
+
+    def call(self, fn, *args, **kwargs):
+        """Runs fn through the breaker: fails fast when open, records the outcome otherwise."""
+        token = self.allow()
+        if token is None:
+            raise CircuitOpenError(self.name)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record(token, False)
+            raise
+        self.record(token, True)
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._set_state(CLOSED)
+            self._outcomes.clear()
+            self._opened_at = None
+
+    def snapshot(self):
+        with self._lock:
+            self._refresh()
+            calls = len(self._outcomes)
+            return {
+                "name": self.name,
+                "state": self._state,
+                "recent_calls": calls,
+                "recent_failure_rate": self._outcomes.count(False) / calls if calls else None,
+                "failure_rate_threshold": self.failure_rate,
+                "min_calls": self.min_calls,
+                "retry_in_seconds": (
+                    max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)) if self._state == OPEN else None
+                ),
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(name):
+    """Shared breaker for an upstream, created on first use from the environment."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            prefix = name.upper()
+            breaker = _breakers[name] = CircuitBreaker(
+                name,
+                failure_rate=float(os.getenv(f"{prefix}_BREAKER_FAILURE_RATE", DEFAULT_FAILURE_RATE)),
+                min_calls=int(os.getenv(f"{prefix}_BREAKER_MIN_CALLS", DEFAULT_MIN_CALLS)),
+                window=int(os.getenv(f"{prefix}_BREAKER_WINDOW", DEFAULT_WINDOW)),
+                open_seconds=float(os.getenv(f"{prefix}_BREAKER_OPEN_SECONDS", DEFAULT_OPEN_SECONDS)),
+                half_open_probes=int(os.getenv(f"{prefix}_BREAKER_HALF_OPEN_PROBES", DEFAULT_HALF_OPEN_PROBES)),
+            )
+        return breaker
+
+def breaker_states():
+    """Snapshots of every breaker created in this process."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [breaker.snapshot() for breaker in breakers]
+
+def reset_breaker(name):
+    """Closes a breaker by hand. Returns False if no such breaker exists in this process."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+    if breaker is None:
+        return False
+    breaker.reset()
+    return True
@@ -1,11 +1,12 @@
 import openpyxl
 import re
 
-def parse_excel(file_path, start_row, address_col):
+def parse_excel(file_path, start_row, address_col, quantity_col=None):
     """
     Parses an Excel file to extract addresses.
     start_row: 1-based index (e.g., 16)
     address_col: Column letter (e.g., 'B')
+    quantity_col: Optional column letter with the package count (e.g., 'D' for "Bultos")
     """
     extracted_data = []
     
@@ -18,24 +19,34 @@ def parse_excel(file_path, start_row, address_col):
         from openpyxl.utils import column_index_from_string
         try:
             col_idx = column_index_from_string(address_col)
+            qty_idx = column_index_from_string(quantity_col) if quantity_col else None
         except ValueError:
-            print(f"Invalid column letter: {address_col}")
+            print(f"Invalid column letter: {address_col} / {quantity_col}")
             return []
 
         # Iterate rows
         # openpyxl rows are 1-based.
         # min_row = start_row
         
-        for row in sheet.iter_rows(min_row=start_row, min_col=col_idx, max_col=col_idx):
-            cell = row[0] 
+        min_col = min(col_idx, qty_idx or col_idx)
+        max_col = max(col_idx, qty_idx or col_idx)
+        for row in sheet.iter_rows(min_row=start_row, min_col=min_col, max_col=max_col):
+            cell = row[col_idx - min_col]
             if cell.value:
                 val = str(cell.value).strip()
                 if val:
                     # Basic cleanup if needed, but Excel cells are usually cleaner than PDF lines
-                    extracted_data.append({
+                    item = {
                         "name": f"Cliente {len(extracted_data)+1}", 
                         "address": val
-                    })
+                    }
+                    if qty_idx:
+                        qty = row[qty_idx - min_col].value
+                        try:
+                            item["quantity"] = int(float(qty))
+                        except (TypeError, ValueError):
+                            pass
+                    extracted_data.append(item)
                     
         return extracted_data
         
@@ -0,0 +1,163 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from services.optimizer import haversine_pairs, optimize_route
+
+# Worker processes used to optimize vehicle routes in parallel
+FLEET_POOL_WORKERS = int(os.getenv("FLEET_POOL_WORKERS", str(os.cpu_count() or 1)))
+
+_pool = None
+
+def _get_pool():
+    # Created lazily so importing this module (and forking gunicorn) stays cheap
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=FLEET_POOL_WORKERS)
+    return _pool
+
+def stop_quantity(location):
+    """Package count (Bultos) of a stop. Stops without one count as 1."""
+    qty = location.get("quantity")
+    return qty if qty is not None and qty >= 0 else 1
+
+def split_by_capacity(locations, start_location, num_vehicles, capacity=None):
+    """
+    Sweep clustering: stops are sorted by bearing around the depot (or their
+    centroid when there is no depot) and handed to vehicles in that order, so
+    each vehicle gets a contiguous wedge of the map.
+
+    Loads are balanced towards total / num_vehicles; capacity (if set) is a
+    hard limit. Stops the sweep cannot fit are then placed in any vehicle
+    that still has room; only stops that fit in no vehicle are returned as
+    unassigned.
+
+    Returns (clusters, unassigned): clusters is a list of location lists, one
+    per vehicle (possibly empty).
+    """
+    clusters = [[] for _ in range(num_vehicles)]
+    if not locations:
+        return clusters, []
+
+    lats = np.array([loc["lat"] for loc in locations], dtype=float)
+    lons = np.array([loc["lon"] for loc in locations], dtype=float)
+    if start_location:
+        center_lat, center_lon = start_location["lat"], start_location["lon"]
+    else:
+        center_lat, center_lon = float(lats.mean()), float(lons.mean())
+
+    angles = np.arctan2(lats - center_lat, (lons - center_lon) * math.cos(math.radians(center_lat)))
+    order = np.argsort(angles, kind="stable")
+
+    # Start the sweep right after the widest empty sector so no wedge straddles two clusters
+    if len(order) > 1:
+        sorted_angles = angles[order]
+        gaps = np.diff(np.concatenate((sorted_angles, [sorted_angles[0] + 2 * math.pi])))
+        order = np.roll(order, -((int(np.argmax(gaps)) + 1) % len(order)))
+
+    quantities = [stop_quantity(loc) for loc in locations]
+    total = sum(quantities)
+    target = math.ceil(total / num_vehicles)
+    if capacity:
+        target = min(target, capacity)
+
+    unassigned, leftover = [], []
+    loads = [0] * num_vehicles
+    vehicle = 0
+    for idx in order:
+        qty = quantities[idx]
+        if capacity and qty > capacity:
+            unassigned.append(locations[idx])
+            continue
+
+        overflows = capacity and loads[vehicle] + qty > capacity
+        balanced = loads[vehicle] >= target
+        if clusters[vehicle] and (overflows or balanced) and vehicle < num_vehicles - 1:
+            vehicle += 1
+        elif overflows:
+            # Last vehicle is full: placed after the sweep wherever there is room
+            leftover.append(idx)
+            continue
+
+        clusters[vehicle].append(locations[idx])
+        loads[vehicle] += qty
+
+    # Earlier wedges may still have room: biggest leftovers first, each into the
+    # vehicle with room whose stops are closest to it
+    for idx in sorted(leftover, key=lambda i: -quantities[i]):
+        qty = quantities[idx]
+        best, best_dist = None, None
+        for v, cluster in enumerate(clusters):
+            if loads[v] + qty > capacity:
+                continue
+            if cluster:
+                dist = float(haversine_pairs(
+                    lats[idx], lons[idx], [loc["lat"] for loc in cluster], [loc["lon"] for loc in cluster]
+                ).min())
+            else:
+                dist = math.inf
+            if best is None or dist < best_dist:
+                best, best_dist = v, dist
+        if best is None:
+            unassigned.append(locations[idx])
+        else:
+            clusters[best].append(locations[idx])
+            loads[best] += qty
+
+    return clusters, unassigned
+
+def _optimize_cluster(args):
+    # Top-level so it can be pickled into the process pool
+    cluster, start_location, round_trip, strategy, options = args
+    stats = {}
+    route = optimize_route(cluster, start_location, None, round_trip, strategy, stats=stats, **options)
+    return route, stats
+
+def optimize_fleet(locations, start_location=None, max_distance_km=None, round_trip=False, strategy="nearest",
+                   num_vehicles=1, capacity=None, cost_matrix=None, **options):
+    """
+    Multi-vehicle routing: filters by max_distance_km, splits the stops with
+    split_by_capacity and optimizes every vehicle route independently across
+    the process pool. options are forwarded to optimize_route.
+    cost_matrix: optional matrix over [start_location] + locations, as in
+                 optimize_route; each vehicle gets its own sub-matrix.
+
+    Returns (routes, unassigned) where routes is a list of
+    {"vehicle", "load", "locations", "stats"} dicts, one per vehicle.
+    """
+    # Matrix row of every location, taken before any filtering
+    offset = 1 if start_location else 0
+    position = {id(loc): i + offset for i, loc in enumerate(locations)}
+
+    if start_location and max_distance_km is not None and max_distance_km > 0 and locations:
+        dists = haversine_pairs(
+            start_location["lat"], start_location["lon"],
+            [loc["lat"] for loc in locations], [loc["lon"] for loc in locations]
+        )
+        locations = [loc for loc, d in zip(locations, dists) if d <= max_distance_km]
+
+    clusters, unassigned = split_by_capacity(locations, start_location, num_vehicles, capacity)
+
+    jobs = []
+    for cluster in clusters:
+        cluster_options = options
+        if cost_matrix is not None:
+            idx = [0] * offset + [position[id(loc)] for loc in cluster]
+            cluster_options = dict(options, cost_matrix=np.asarray(cost_matrix)[np.ix_(idx, idx)])
+        jobs.append((cluster, start_location, round_trip, strategy, cluster_options))
+    busy = [job for job in jobs if job[0]]
+    if len(busy) > 1:
+        results = iter(_get_pool().map(_optimize_cluster, busy))
+    else:
+        results = iter(map(_optimize_cluster, busy))
+
+    routes = []
+    for vehicle, job in enumerate(jobs, 1):
+        route, stats = next(results) if job[0] else ([], {})
+        routes.append({
+            "vehicle": vehicle,
+            "load": sum(stop_quantity(loc) for loc in job[0]),
+            "locations": route,
+            "stats": stats,
+        })
+    return routes, unassigned
@@ -0,0 +1,95 @@
+import os
+import threading
+
+# Lowest trigram similarity (Dice coefficient) accepted as a match
+MIN_SCORE = float(os.getenv("FUZZY_MATCH_MIN_SCORE", "0.75"))
+# Trigrams found in more streets than this are too common to pick candidates
+# (e.g. the ones from "avenida"); they still count when scoring
+COMMON_TRIGRAM_STREETS = 200
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def split_address(canonical, number_position=None):
+    """
+    (street, house number, locality) of a canonical address. By default the
+    house number is the last numeric token (after at least one street word).
+    """
+    tokens = canonical.split()
+    positions = [i for i in range(1, len(tokens)) if tokens[i].isdigit()]
+    if not positions:
+        return None
+    i = positions[-1] if number_position is None else number_position
+    return " ".join(tokens[:i]), tokens[i], " ".join(tokens[i + 1:])
+
+class FuzzyStreetIndex:
+    """
+    Trigram index over the street names of known-good cache keys
+    ("<canonical address>|<canonical region>"), used to resolve addresses
+    with typos or stray tokens to an already geocoded address with the same
+    house number and region.
+    """
+
+    def __init__(self, min_score=MIN_SCORE):
+        self.min_score = min_score
+        self._street_ids = {}       # street -> id
+        self._street_trigrams = []  # id -> trigram set
+        self._postings = {}         # trigram -> set of street ids
+        self._entries = {}          # (street id, region) -> {house number: cache key}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(numbers) for numbers in self._entries.values())
+
+    def add(self, key):
+        address, _, region = key.rpartition("|")
+        parts = split_address(address)
+        if parts is None:
+            return
+        street, number, _ = parts
+        with self._lock:
+            street_id = self._street_ids.get(street)
+            if street_id is None:
+                street_id = self._street_ids[street] = len(self._street_trigrams)
+                grams = trigrams(street)
+                self._street_trigrams.append(grams)
+                for gram in grams:
+                    self._postings.setdefault(gram, set()).add(street_id)
+            self._entries.setdefault((street_id, region), {}).setdefault(number, key)
+
+    def _candidates(self, grams):
+        # Caller holds _lock
+        postings = [self._postings[gram] for gram in grams if gram in self._postings]
+        rare = [ids for ids in postings if len(ids) <= COMMON_TRIGRAM_STREETS]
+        candidates = set()
+        for ids in rare or postings:
+            candidates |= ids
+        return candidates
+
+    def lookup(self, key):
+        """
+        Best known cache key for a (possibly misspelled) key, as (key, score),
+        or None. Every numeric token is tried as the house number, so a stray
+        count after the number does not prevent a match.
+        """
+        address, _, region = key.rpartition("|")
+        tokens = address.split()
+        best = None
+        with self._lock:
+            for position in [i for i in range(1, len(tokens)) if tokens[i].isdigit()]:
+                street, number, _ = split_address(address, position)
+                grams = trigrams(street)
+                for street_id in self._candidates(grams):
+                    known = self._entries.get((street_id, region))
+                    if not known or number not in known:
+                        continue
+                    other = self._street_trigrams[street_id]
+                    score = 2 * len(grams & other) / (len(grams) + len(other))
+                    if score >= self.min_score and (best is None or score > best[1]):
+                        best = (known[number], score)
+        return best
+
+    def stats(self):
+        with self._lock:
+            return {"streets": len(self._street_trigrams), "entries": len(self), "min_score": self.min_score}
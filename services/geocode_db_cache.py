@@ -0,0 +1,185 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+import database
+import models
+
+# New entries are upserted in batches by a background thread
+FLUSH_INTERVAL = float(os.getenv("GEOCODE_CACHE_FLUSH_INTERVAL", "1.0"))
+FLUSH_BATCH = int(os.getenv("GEOCODE_CACHE_FLUSH_BATCH", "100"))
+# Keys per SELECT ... IN (...) when prefetching a manifest
+READ_BATCH = 500
+
+def key_hash(key):
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def upsert(db, model, rows, updated, increment=()):
+    """
+    Inserts rows into model's table, updating the `updated` columns of rows
+    whose key_hash exists. `increment` columns are added to the stored value
+    instead of replacing it.
+    """
+    table = model.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        stmt = mysql.insert(table).values(rows)
+        values = {col: stmt.inserted[col] for col in updated}
+        values.update({col: table.c[col] + stmt.inserted[col] for col in increment})
+        stmt = stmt.on_duplicate_key_update(values)
+    elif dialect in ("postgresql", "sqlite"):
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = insert(table).values(rows)
+        values = {col: stmt.excluded[col] for col in updated}
+        values.update({col: table.c[col] + stmt.excluded[col] for col in increment})
+        stmt = stmt.on_conflict_do_update(index_elements=["key_hash"], set_=values)
+    else:
+        for row in rows:
+            entry = db.execute(select(model).where(model.key_hash == row["key_hash"])).scalar_one_or_none()
+            if entry is None:
+                db.add(model(**row))
+            else:
+                for col in updated:
+                    setattr(entry, col, row[col])
+                for col in increment:
+                    setattr(entry, col, getattr(entry, col) + row[col])
+        return
+    db.execute(stmt)
+
+class DatabaseGeocodeCache:
+    """
+    Geocode cache shared by every worker and node through the application
+    database (models.GeocodeCacheEntry). The geocoder keeps its per-process
+    memory tier (services/memory_cache.py) in front of it.
+
+    Values are (lat, lon, details) like the rest of the geocoder. Reads go to
+    the table by key hash; writes are buffered and upserted in batches.
+    Database errors degrade to cache misses.
+    """
+
+    def __init__(self, session_factory=database.SessionLocal):
+        self.session_factory = session_factory
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flusher = None
+
+    # --- reads ---
+
+    def get_many(self, keys):
+        """Looks up many keys with one query per READ_BATCH keys. Returns {key: value} for hits."""
+        found, missing = {}, []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                if key in self._pending:
+                    found[key] = self._pending[key]
+                else:
+                    missing.append(key)
+        if not missing:
+            return found
+
+        table = models.GeocodeCacheEntry
+        try:
+            with self.session_factory() as db:
+                for start in range(0, len(missing), READ_BATCH):
+                    by_hash = {key_hash(key): key for key in missing[start:start + READ_BATCH]}
+                    rows = db.execute(
+                        select(table.key_hash, table.lat, table.lon, table.details)
+                        .where(table.key_hash.in_(list(by_hash)))
+                    )
+                    for h, lat, lon, details in rows:
+                        found[by_hash[h]] = (lat, lon, json.loads(details) if details else {})
+        except Exception as e:
+            print(f"Geocode cache DB error: {e}")
+        return found
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __iter__(self):
+        """Yields every stored key, reading the table in pages."""
+        table = models.GeocodeCacheEntry
+        last_id = 0
+        while True:
+            with self.session_factory() as db:
+                rows = db.execute(
+                    select(table.id, table.address_key).where(table.id > last_id).order_by(table.id).limit(READ_BATCH)
+                ).all()
+            if not rows:
+                return
+            for row_id, key in rows:
+                yield key
+            last_id = rows[-1][0]
+
+    def __len__(self):
+        self.flush()
+        with self.session_factory() as db:
+            return db.scalar(select(func.count()).select_from(models.GeocodeCacheEntry))
+
+    # --- writes ---
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._pending[key] = value
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name="geocode-cache-db", daemon=True)
+                self._flusher.start()
+                atexit.register(self.flush)
+            if len(self._pending) >= FLUSH_BATCH:
+                self._wake.set()
+
+    def __delitem__(self, key):
+        self.flush()
+        with self.session_factory() as db:
+            db.execute(delete(models.GeocodeCacheEntry).where(models.GeocodeCacheEntry.key_hash == key_hash(key)))
+            db.commit()
+
+    def _run(self):
+        while True:
+            self._wake.wait(FLUSH_INTERVAL)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Upserts buffered entries in one statement. Failed batches stay buffered for the next try."""
+        with self._io_lock:
+            with self._lock:
+                batch = dict(self._pending)
+            if not batch:
+                return
+
+            now = datetime.utcnow()
+            rows = [{
+                "key_hash": key_hash(key),
+                "address_key": key[:500],
+                "lat": value[0],
+                "lon": value[1],
+                "details": json.dumps(value[2] or {}, ensure_ascii=False),
+                "updated_at": now,
+            } for key, value in batch.items()]
+            try:
+                with self.session_factory() as db:
+                    upsert(db, models.GeocodeCacheEntry, rows, ("address_key", "lat", "lon", "details", "updated_at"))
+                    db.commit()
+            except Exception as e:
+                print(f"Geocode cache DB error: {e}")
+                return
+
+            with self._lock:
+                for key, value in batch.items():
+                    if self._pending.get(key) is value:
+                        del self._pending[key]
@@ -1,89 +1,285 @@
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut
-import time
-import json
+from concurrent.futures import ThreadPoolExecutor
 import os
+import sys
+import threading
+from services.address_normalizer import address_pattern, cache_key, canonicalize, search_form
+from services.circuit_breaker import CircuitOpenError
+from services.fuzzy_index import FuzzyStreetIndex
+from services.geocoding_backends import GazetteerBackend, NominatimBackend, PhotonBackend
+from services.hedged_geocoder import HedgedGeocoder
+from services.journal_cache import JournalCache
+from services.memory_cache import BoundedCache
+from services.negative_cache import DatabaseNegativeCache, JournalNegativeCache
+from services.variant_stats import VariantStats, create_variant_store
 
-# User agent is required by Nominatim policy
-geolocator = Nominatim(user_agent="delivery_route_optimizer_v1")
+# Lookup chain: offline gazetteer (GAZETTEER_PATH, optional) -> cache -> remote providers.
+# GEOCODER_REMOTE is an ordered, comma separated provider list ("nominatim,photon"):
+# later providers are hedged behind the earlier ones (see services/hedged_geocoder.py).
+# GEOCODER_REMOTE=none keeps every lookup on this machine.
+# NOMINATIM_DOMAIN can point at a self-hosted instance (raise NOMINATIM_RATE_PER_SEC to match)
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH")
+GEOCODER_REMOTE = os.getenv("GEOCODER_REMOTE", "nominatim")
+REMOTE_PROVIDERS = {"nominatim": NominatimBackend, "photon": PhotonBackend}
 
-# Persistent cache path
-CACHE_PATH = os.path.join("/tmp", "geocoding_cache.json") if os.path.exists("/tmp") else "geocoding_cache.json"
+def create_remote_backend(names=GEOCODER_REMOTE):
+    names = [name.strip() for name in names.split(",") if name.strip() and name.strip() != "none"]
+    unknown = [name for name in names if name not in REMOTE_PROVIDERS]
+    if unknown:
+        raise ValueError(f"Unknown GEOCODER_REMOTE provider: {', '.join(unknown)}")
+    if not names:
+        return None
+    return HedgedGeocoder([REMOTE_PROVIDERS[name]() for name in names])
 
-def load_cache():
-    if os.path.exists(CACHE_PATH):
-        try:
-            with open(CACHE_PATH, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+offline_backend = GazetteerBackend(GAZETTEER_PATH) if GAZETTEER_PATH else None
+remote_backend = create_remote_backend()
+
+
+# Addresses geocoded at the same time; the provider rate is enforced by the shared limiter
+GEOCODER_WORKERS = int(os.getenv("GEOCODER_WORKERS", "4"))
+
+# Persistent cache backend:
+#   "database": shared table in the application DB (models.GeocodeCacheEntry), safe with several workers
+#   "journal": local append-only file (see services/journal_cache.py), one process only
+GEOCODE_CACHE_BACKEND = os.getenv("GEOCODE_CACHE_BACKEND", "database")
+
+# Journal location. The old single-file JSON cache is imported once if present.
+CACHE_DIR = "/tmp" if os.path.exists("/tmp") else "."
+CACHE_PATH = os.path.join(CACHE_DIR, "geocoding_cache.jsonl")
+LEGACY_CACHE_PATH = os.path.join(CACHE_DIR, "geocoding_cache.json")
+
+def create_cache(backend=GEOCODE_CACHE_BACKEND):
+    if backend == "database":
+        from services.geocode_db_cache import DatabaseGeocodeCache
+        return DatabaseGeocodeCache()
+    if backend == "journal":
+        return JournalCache(CACHE_PATH, legacy_path=LEGACY_CACHE_PATH)
+    raise ValueError(f"Unknown GEOCODE_CACHE_BACKEND: {backend}")
+
+# Initialize cache (nothing is read until the first lookup)
+persistent_cache = create_cache()
+
+# Addresses that no query variant resolved are not retried upstream for this long
+NEGATIVE_CACHE_TTL = float(os.getenv("GEOCODE_NEGATIVE_TTL", str(3 * 86400)))
+NEGATIVE_CACHE_PATH = os.path.join(CACHE_DIR, "geocoding_negative_cache.jsonl")
+
+def create_negative_cache(backend=GEOCODE_CACHE_BACKEND):
+    if backend == "database":
+        return DatabaseNegativeCache(NEGATIVE_CACHE_TTL)
+    if backend == "journal":
+        return JournalNegativeCache(NEGATIVE_CACHE_PATH, NEGATIVE_CACHE_TTL)
+    raise ValueError(f"Unknown GEOCODE_CACHE_BACKEND: {backend}")
+
+negative_cache = create_negative_cache()
+
+# Success rates of the query variants, used to order and prune them; kept in
+# the same backend as the caches so they survive deploys and are shared by the workers
+VARIANT_STATS_PATH = os.path.join(CACHE_DIR, "geocoding_variant_stats.jsonl")
+variant_stats = VariantStats(store=create_variant_store(GEOCODE_CACHE_BACKEND, VARIANT_STATS_PATH))
+
+# Bounded in-process tier in front of persistent_cache
+MEMORY_CACHE_MAX_ENTRIES = int(os.getenv("GEOCODE_MEMORY_CACHE_ENTRIES", "20000"))
+MEMORY_CACHE_MAX_BYTES = int(os.getenv("GEOCODE_MEMORY_CACHE_BYTES", str(16 * 1024 * 1024)))
+MEMORY_CACHE_TTL = float(os.getenv("GEOCODE_MEMORY_CACHE_TTL", "86400"))
+memory_cache = BoundedCache(MEMORY_CACHE_MAX_ENTRIES, MEMORY_CACHE_MAX_BYTES, MEMORY_CACHE_TTL)
+
+# Address details kept per result; the rest of the Nominatim address dict is dropped
+DETAIL_FIELDS = ("city", "town", "state", "country")
 
-def save_cache(cache):
+def compact_result(lat, lon, details=None):
+    """(lat, lon, details) with details reduced to DETAIL_FIELDS and their strings interned."""
+    details = details or {}
+    return (float(lat), float(lon), {f: sys.intern(str(details[f])) for f in DETAIL_FIELDS if details.get(f)})
+
+def _pack(result):
+    # Memory-tier entry: a flat tuple instead of a dict per result
+    lat, lon, details = result
+    return (lat, lon) + tuple(details.get(f) for f in DETAIL_FIELDS)
+
+def _unpack(packed):
+    return (packed[0], packed[1], {f: v for f, v in zip(DETAIL_FIELDS, packed[2:]) if v is not None})
+
+# Street names of cached addresses, for typo-tolerant matches before any remote query.
+# Filled from the persistent cache in the background on first use, then on every store.
+fuzzy_index = FuzzyStreetIndex()
+_fuzzy_loader = None
+_fuzzy_loader_lock = threading.Lock()
+
+def _load_fuzzy_index():
     try:
-        with open(CACHE_PATH, "w", encoding="utf-8") as f:
-            json.dump(cache, f, ensure_ascii=False)
-    except:
-        pass
+        for key in persistent_cache:
+            fuzzy_index.add(key)
+    except Exception as e:
+        print(f"Fuzzy index load error: {e}")
+
+def _ensure_fuzzy_index():
+    global _fuzzy_loader
+    with _fuzzy_loader_lock:
+        if _fuzzy_loader is None:
+            _fuzzy_loader = threading.Thread(target=_load_fuzzy_index, name="fuzzy-index", daemon=True)
+            _fuzzy_loader.start()
+
+def fuzzy_results(keys):
+    """
+    Resolves keys to the closest known address (same house number and region).
+    Returns {key: result}; result details carry the match score as "match_confidence".
+    """
+    _ensure_fuzzy_index()
+    matches = {}
+    for key in keys:
+        match = fuzzy_index.lookup(key)
+        if match and match[0] != key:
+            matches[key] = match
+    if not matches:
+        return {}
+    known = cached_results({matched for matched, _ in matches.values()})
+    found = {}
+    for key, (matched, score) in matches.items():
+        if matched in known:
+            lat, lon, details = known[matched]
+            found[key] = (lat, lon, dict(details, match_confidence=round(score, 3)))
+    return found
+
+def cached_results(keys):
+    """Looks keys up in the memory tier, then the rest in one persistent-cache call. Returns {key: result}."""
+    found, missing = {}, []
+    for key in keys:
+        packed = memory_cache.get(key)
+        if packed is not None:
+            found[key] = _unpack(packed)
+        else:
+            missing.append(key)
+    if missing:
+        for key, result in persistent_cache.get_many(missing).items():
+            result = compact_result(*result)
+            memory_cache.set(key, _pack(result))
+            found[key] = result
+    return found
+
+def store_result(key, result):
+    memory_cache.set(key, _pack(result))
+    persistent_cache[key] = result
+    fuzzy_index.add(key)
+
+def strategy_stats():
+    return variant_stats.stats()
+
+def provider_stats():
+    return remote_backend.stats() if remote_backend is not None else {"providers": []}
+
+def cache_stats():
+    return {"fuzzy": fuzzy_index.stats(),
+            "offline": offline_backend.name if offline_backend else None,
+            "remote": [p.name for p in remote_backend.providers] if remote_backend else [],
+            "backend": GEOCODE_CACHE_BACKEND, "memory": memory_cache.stats(), "negative_ttl": NEGATIVE_CACHE_TTL}
 
-# Initialize cache
-persistent_cache = load_cache()
+def invalidate_negative(addresses=None, region_bias=None):
+    """
+    Forgets cached failures for the given addresses as resolved with region_bias
+    (every cached failure when addresses is None). Returns how many were removed.
+    """
+    keys = None if addresses is None else [cache_key(addr, region_bias) for addr in addresses if addr]
+    return negative_cache.invalidate(keys)
+
+def region_bias_from_details(details):
+    """Region bias ("city, state, country") derived from the details of a geocoded start address, or None."""
+    components = []
+    if 'city' in details: components.append(details['city'])
+    elif 'town' in details: components.append(details['town'])
+
+    if 'state' in details: components.append(details['state'])
+    if 'country' in details: components.append(details['country'])
+
+    return ", ".join(components) or None
 
 def geocode_single(address, region_bias=None):
     """
     Geocodes a single address string with persistent caching and multi-region strategy.
+    Returns None when the address is not found; raises CircuitOpenError when
+    it is not cached and every remote provider is unavailable.
     """
     if not address:
         return None
 
     clean_addr = address.strip()
-    
-    # Check cache first
-    if clean_addr in persistent_cache:
-        return persistent_cache[clean_addr]
+    key = cache_key(clean_addr, region_bias)
+
+    # Offline index first, then the cache
+    offline = geocode_offline(clean_addr)
+    if offline:
+        return offline
+    cached = cached_results([key]).get(key)
+    if cached:
+        return cached
+    # Then a near match on a known street (typos, stray tokens)
+    fuzzy = fuzzy_results([key]).get(key)
+    if fuzzy:
+        return fuzzy
+    if negative_cache.get_many([key]):
+        return None
+
+    return _geocode_upstream(key, clean_addr, region_bias)
 
-    # Pre-processing
-    search_addr = clean_addr.replace("AV ", "Avenida ").replace("Av. ", "Avenida ").replace("Gral. ", "General ")
-    search_addr = search_addr.replace("C.A.B.A.", "CABA").replace("Ciudad Autónoma de Buenos Aires", "CABA")
+def geocode_offline(address):
+    """Looks the address up in the local gazetteer, if one is configured."""
+    if offline_backend is None:
+        return None
+    result = offline_backend.geocode(search_form(address))
+    return compact_result(*result) if result else None
+
+def _geocode_upstream(key, clean_addr, region_bias=None):
+    if remote_backend is None:
+        return None
+
+    # Pre-processing (abbreviations, CABA aliases, house-number formats)
+    search_addr = search_form(clean_addr)
 
     attempts = []
-    
+
     # Strategy 1: The address exactly as provided (with bias if any)
     if region_bias and region_bias.lower() not in search_addr.lower():
-        attempts.append(f"{search_addr}, {region_bias}")
-    attempts.append(search_addr)
-    
+        attempts.append(("bias", f"{search_addr}, {region_bias}"))
+    attempts.append(("raw", search_addr))
+
     # Strategy 2: Explicit Argentina context (Covers whole country)
     if "argentina" not in search_addr.lower():
-        attempts.append(f"{search_addr}, Argentina")
+        attempts.append(("argentina", f"{search_addr}, Argentina"))
 
     # Strategy 3: Priority Contexts (If CABA or GBA bias)
     if not any(x in search_addr.lower() for x in ["caba", "buenos aires", "provincia"]):
-        attempts.append(f"{search_addr}, CABA, Argentina")
-    
+        attempts.append(("caba", f"{search_addr}, CABA, Argentina"))
+
     # Deduplicate attempts while preserving order
     unique_attempts = []
-    for a in attempts:
-        if a not in unique_attempts: unique_attempts.append(a)
+    for name, query in attempts:
+        if query not in [q for _, q in unique_attempts]: unique_attempts.append((name, query))
+
+    # Historically best variant first, rarely successful ones dropped
+    context = (canonicalize(region_bias), address_pattern(clean_addr))
+    unique_attempts = variant_stats.order(context, unique_attempts)
 
-    for query in unique_attempts:
+    failed = False
+    for name, query in unique_attempts:
         try:
-            # Respect policy - Minimum 1s wait
-            time.sleep(1.05)
-            location = geolocator.geocode(query, addressdetails=True)
-            
+            # Providers wait for their own rate limits; slow ones are hedged
+            location = remote_backend.geocode(query)
+            variant_stats.record(context, name, location is not None)
+
             if location:
-                result = (location.latitude, location.longitude, location.raw.get('address', {}))
-                # Store in persistent cache
-                persistent_cache[clean_addr] = result
-                save_cache(persistent_cache)
+                result = compact_result(*location)
+                # Store in memory and persistent cache (written behind in batches)
+                store_result(key, result)
                 return result
-        except GeocoderTimedOut:
-            continue
+        except CircuitOpenError:
+            # Every provider is down: the other variants would fail the same way
+            raise
         except Exception as e:
             print(f"Error for {query}: {e}")
+            failed = True
             continue
-            
+
+    # Only a clean "no results" from every variant is remembered, not upstream errors
+    if not failed:
+        negative_cache.add(key)
     return None
 
 def geocode_addresses(raw_data, region_bias=None):
@@ -97,10 +293,43 @@ def geocode_addresses(raw_data, region_bias=None):
         if addr not in unique_addresses:
             unique_addresses[addr] = item["name"]
 
-    # 2. Geocode unique ones
-    results_map = {}
-    for addr, name in unique_addresses.items():
-        results_map[addr] = geocode_single(addr, region_bias)
+    # 2. Geocode unique ones: spellings with the same canonical key share a
+    #    lookup, the gazetteer, cache hits and near matches of known streets
+    #    resolve right away, misses run concurrently and
+    #    share the provider's rate limit (known failures come from the
+    #    negative cache without any upstream call)
+    keys = {addr: cache_key(addr, region_bias) for addr in unique_addresses if addr}
+    results_by_key = {}
+    if offline_backend is not None:
+        for addr, key in keys.items():
+            if key not in results_by_key:
+                result = geocode_offline(addr)
+                if result:
+                    results_by_key[key] = result
+    results_by_key.update(cached_results(set(keys.values()) - set(results_by_key)))
+    results_by_key.update(fuzzy_results(set(keys.values()) - set(results_by_key)))
+    known_failures = negative_cache.get_many([key for key in set(keys.values()) if key not in results_by_key])
+    misses = {}
+    for addr, key in keys.items():
+        if key not in results_by_key and key not in known_failures:
+            misses.setdefault(key, addr)
+
+    # Misses not looked up because every remote provider's breaker was open
+    unavailable = set()
+
+    def lookup(key):
+        try:
+            return _geocode_upstream(key, misses[key].strip(), region_bias)
+        except CircuitOpenError:
+            unavailable.add(key)
+            return None
+
+    if len(misses) > 1 and GEOCODER_WORKERS > 1:
+        with ThreadPoolExecutor(max_workers=min(GEOCODER_WORKERS, len(misses))) as pool:
+            results_by_key.update(zip(misses, pool.map(lookup, misses)))
+    else:
+        results_by_key.update((key, lookup(key)) for key in misses)
+    results_map = {addr: results_by_key.get(key) for addr, key in keys.items()}
 
     # 3. Rebuild original list with geocoded data
     found = []
@@ -113,18 +342,24 @@ def geocode_addresses(raw_data, region_bias=None):
         
         if result:
             lat, lon, _ = result
-            found.append({
+            location = {
                 "id": idx + 1,
                 "name": name,
                 "address": addr,
                 "lat": lat,
                 "lon": lon
-            })
+            }
+            if "quantity" in item:
+                location["quantity"] = item["quantity"]
+            if "match_confidence" in result[2]:
+                location["match_confidence"] = result[2]["match_confidence"]
+            found.append(location)
         else:
             not_found.append({
                 "name": name,
                 "address": addr,
-                "error": "Not Found"
+                "error": "Geocoding Unavailable" if keys.get(addr) in unavailable else "Not Found",
+                "from_cache": keys.get(addr) in known_failures
             })
         
     return {"found": found, "not_found": not_found}
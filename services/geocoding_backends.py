@@ -0,0 +1,161 @@
+import bisect
+import csv
+import functools
+import os
+from services.address_normalizer import canonicalize
+from services.circuit_breaker import get_breaker
+from services.rate_limiter import get_limiter
+
+class GeocoderBackend:
+    """
+    A source of coordinates. geocode() returns (lat, lon, details) or None when
+    the query has no match, and raises when the backend itself failed (so the
+    failure is not mistaken for "address does not exist").
+    Subclasses implement query(); geocode() waits for the backend's rate
+    limiter (if any) first. max_concurrency caps requests in flight when the
+    backend is used by HedgedGeocoder. Remote backends have a circuit breaker:
+    while it is open, geocode() raises CircuitOpenError without waiting.
+    """
+    name = "backend"
+    limiter = None
+    breaker = None
+    max_concurrency = 4
+
+    def geocode(self, query):
+        if self.breaker is not None:
+            return self.breaker.call(self._limited_query, query)
+        return self._limited_query(query)
+
+    def _limited_query(self, query):
+        if self.limiter is not None:
+            self.limiter.acquire()
+        return self.query(query)
+
+    def query(self, query):
+        raise NotImplementedError
+
+class NominatimBackend(GeocoderBackend):
+    """OpenStreetMap Nominatim through geopy, rate limited by the shared "nominatim" bucket."""
+    name = "nominatim"
+
+    def __init__(self, domain=None, user_agent="delivery_route_optimizer_v1"):
+        from geopy.geocoders import Nominatim
+        # User agent is required by Nominatim policy
+        self.geolocator = Nominatim(user_agent=user_agent,
+                                    domain=domain or os.getenv("NOMINATIM_DOMAIN", "nominatim.openstreetmap.org"),
+                                    scheme=os.getenv("NOMINATIM_SCHEME", "https"))
+        # Respect policy: every request waits for a token from the provider's shared bucket
+        self.limiter = get_limiter(self.name)
+        self.breaker = get_breaker(self.name)
+        self.max_concurrency = int(os.getenv("NOMINATIM_MAX_CONCURRENCY", "1"))
+
+    def query(self, query):
+        location = self.geolocator.geocode(query, addressdetails=True)
+        if location is None:
+            return None
+        return (location.latitude, location.longitude, location.raw.get("address", {}))
+
+class PhotonBackend(GeocoderBackend):
+    """Photon (OSM data, komoot public instance by default) through geopy, rate limited by the "photon" bucket."""
+    name = "photon"
+
+    def __init__(self, domain=None, user_agent="delivery_route_optimizer_v1"):
+        from geopy.geocoders import Photon
+        self.geolocator = Photon(user_agent=user_agent, domain=domain or os.getenv("PHOTON_DOMAIN", "photon.komoot.io"))
+        self.limiter = get_limiter(self.name)
+        self.breaker = get_breaker(self.name)
+        self.max_concurrency = int(os.getenv("PHOTON_MAX_CONCURRENCY", "2"))
+
+    def query(self, query):
+        location = self.geolocator.geocode(query)
+        if location is None:
+            return None
+        return (location.latitude, location.longitude, location.raw.get("properties", {}))
+
+class GazetteerBackend(GeocoderBackend):
+    """
+    Offline street index loaded from a CSV gazetteer (e.g. exported from an
+    OSM extract: address points and addr:interpolation ways).
+
+    Columns: street, number_from, number_to, lat_from, lon_from, lat_to, lon_to, city, state
+    A row with number_to/lat_to/lon_to empty is a single address point;
+    otherwise the house number is interpolated linearly along the segment.
+    city and state are optional. Rows with a blank street or blank or
+    non-numeric numbers or coordinates are skipped and counted in skipped_rows.
+
+    Queries are "<street> <number>[, <locality>...]". Only numbered addresses
+    that fall inside a known segment (or hit a point) resolve; anything else
+    returns None and goes to the next tier. When the street exists in several
+    cities, the segment whose city matches the locality is preferred.
+    """
+    name = "gazetteer"
+
+    def __init__(self, path):
+        self.path = path
+        # canonical street -> sorted [(number_from, number_to, lat_from, lon_from, lat_to, lon_to, city key, city, state)]
+        self.streets = {}
+        # Rows without a street or with blank/non-numeric numbers or coordinates
+        self.skipped_rows = 0
+        # Street and city names repeat across rows
+        canonical = functools.lru_cache(maxsize=None)(canonicalize)
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                street = canonical(row.get("street"))
+                try:
+                    if not street:
+                        raise ValueError("no street")
+                    start = int(float(row["number_from"]))
+                    lat_from, lon_from = float(row["lat_from"]), float(row["lon_from"])
+                    if (row.get("number_to") or "").strip():
+                        end = int(float(row["number_to"]))
+                        lat_to, lon_to = float(row["lat_to"]), float(row["lon_to"])
+                    else:
+                        end, lat_to, lon_to = start, lat_from, lon_from
+                except (KeyError, TypeError, ValueError):
+                    # One bad export row should not take the offline tier down
+                    self.skipped_rows += 1
+                    continue
+                if end < start:
+                    start, end, lat_from, lon_from, lat_to, lon_to = end, start, lat_to, lon_to, lat_from, lon_from
+                self.streets.setdefault(street, []).append((
+                    start, end, lat_from, lon_from, lat_to, lon_to,
+                    canonical(row.get("city")), (row.get("city") or "").strip(), (row.get("state") or "").strip(),
+                ))
+        if self.skipped_rows:
+            print(f"Gazetteer {path}: skipped {self.skipped_rows} malformed rows")
+        for segments in self.streets.values():
+            segments.sort()
+        self._starts = {street: [s[0] for s in segments] for street, segments in self.streets.items()}
+
+    @staticmethod
+    def parse(query):
+        """(canonical street, house number or None, canonical locality) from a query."""
+        street_part, _, locality = query.partition(",")
+        tokens = canonicalize(street_part).split()
+        # The house number is the last numeric token; words after it are a locality without a comma
+        for i in range(len(tokens) - 1, 0, -1):
+            if tokens[i].isdigit():
+                locality = " ".join(tokens[i + 1:] + [locality])
+                return " ".join(tokens[:i]), int(tokens[i]), canonicalize(locality)
+        return " ".join(tokens), None, canonicalize(locality)
+
+    def query(self, query):
+        street, number, locality = self.parse(query)
+        segments = self.streets.get(street)
+        if not segments or number is None:
+            return None
+
+        # Segments starting at or below the number that also reach it
+        starts = self._starts[street]
+        candidates = [
+            segment for segment in segments[:bisect.bisect_right(starts, number)] if number <= segment[1]
+        ]
+        if not candidates:
+            return None
+        if locality:
+            candidates.sort(key=lambda segment: not (segment[6] and (segment[6] in locality or locality in segment[6])))
+
+        start, end, lat_from, lon_from, lat_to, lon_to, _, city, state = candidates[0]
+        t = (number - start) / (end - start) if end > start else 0.0
+        details = {key: value for key, value in (("city", city), ("state", state)) if value}
+        return (lat_from + (lat_to - lat_from) * t, lon_from + (lon_to - lon_from) * t, details)
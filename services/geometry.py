@@ -0,0 +1,106 @@
+import json
+import math
+import numpy as np
+
+# geometry_format values accepted by the route endpoints
+GEOMETRY_FORMATS = ("geojson", "polyline", "polyline6")
+POLYLINE_PRECISION = {"polyline": 5, "polyline6": 6}
+
+def encode_polyline(coordinates, precision=5):
+    """Encoded polyline (Google algorithm) of a [lon, lat] list; the encoding itself is lat, lon."""
+    factor = 10 ** precision
+    chunks = []
+    prev_lat = prev_lon = 0
+    for lon, lat in coordinates:
+        lat, lon = int(round(lat * factor)), int(round(lon * factor))
+        for delta in (lat - prev_lat, lon - prev_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        prev_lat, prev_lon = lat, lon
+    return "".join(chunks)
+
+def decode_polyline(encoded, precision=5):
+    """[lon, lat] list of an encoded polyline."""
+    factor = 10 ** precision
+    coordinates = []
+    index = lat = lon = 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        coordinates.append([lon / factor, lat / factor])
+    return coordinates
+
+def simplify(coordinates, tolerance):
+    """
+    Douglas-Peucker simplification of a [lon, lat] list: drops points closer
+    than tolerance meters to the line between the points kept around them.
+    Distances use a local equirectangular projection, accurate at city scale.
+    """
+    n = len(coordinates)
+    if not tolerance or n < 3:
+        return coordinates
+
+    points = np.asarray(coordinates, dtype=float)
+    scale_x = 111320.0 * math.cos(math.radians(points[:, 1].mean()))
+    xy = np.column_stack((points[:, 0] * scale_x, points[:, 1] * 110540.0))
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = xy[end] - xy[start]
+        offsets = xy[start + 1:end] - xy[start]
+        length = math.hypot(segment[0], segment[1])
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        i = int(distances.argmax())
+        if distances[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return points[keep].tolist()
+
+def format_geometry(coordinates, geometry_format="geojson", tolerance=None):
+    """Route geometry ([lon, lat] list) in the requested format, simplified first when tolerance (m) is set."""
+    if not coordinates:
+        return None
+    coordinates = simplify(coordinates, tolerance)
+    if geometry_format in POLYLINE_PRECISION:
+        return encode_polyline(coordinates, POLYLINE_PRECISION[geometry_format])
+    return {"type": "LineString", "coordinates": coordinates}
+
+def parse_geometry(geometry, geometry_format=None):
+    """
+    [lon, lat] list of a geometry as returned by format_geometry (or the older
+    GeoJSON string), or None if it cannot be read.
+    """
+    if not geometry:
+        return None
+    try:
+        if isinstance(geometry, dict):
+            return geometry["coordinates"]
+        if geometry_format in POLYLINE_PRECISION:
+            return decode_polyline(geometry, POLYLINE_PRECISION[geometry_format])
+        return json.loads(geometry)["coordinates"]
+    except (ValueError, KeyError, TypeError, IndexError):
+        return None
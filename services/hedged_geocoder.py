@@ -0,0 +1,194 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from services.circuit_breaker import CircuitOpenError
+from services.geocoding_backends import GeocoderBackend
+
+# Start the next provider when the current ones have not answered after this many seconds
+HEDGE_DELAY = float(os.getenv("GEOCODER_HEDGE_DELAY", "1.0"))
+# Latency samples kept per provider for the percentiles
+LATENCY_WINDOW = 1000
+
+class ProviderStats:
+    def __init__(self):
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.wins = 0
+        self.no_match = 0
+        self.errors = 0
+        self.hedged = 0  # times it was started because an earlier provider was slow
+        self.short_circuited = 0  # calls skipped because its breaker was open
+
+    def snapshot(self):
+        latencies = np.array(self.latencies) * 1000 if self.latencies else None
+        return {
+            "calls": self.calls,
+            "wins": self.wins,
+            "no_match": self.no_match,
+            "errors": self.errors,
+            "hedged": self.hedged,
+            "short_circuited": self.short_circuited,
+            "p50_ms": float(np.percentile(latencies, 50)) if latencies is not None else None,
+            "p99_ms": float(np.percentile(latencies, 99)) if latencies is not None else None,
+        }
+
+class HedgedGeocoder(GeocoderBackend):
+    """
+    Queries an ordered list of providers, first acceptable (non-None) answer wins.
+
+    The first provider starts right away. The next one is started when the
+    last one started has not answered within hedge_delay of going upstream
+    (after its concurrency slot and rate-limit token, so local queueing does
+    not trigger a hedge), or as soon as one comes back empty or fails. Each
+    provider keeps its own rate limiter and at most max_concurrency requests
+    in flight; calls still queued locally when the lookup is decided are
+    dropped, late answers from losing providers are discarded but still
+    counted in their latency stats.
+
+    Providers whose circuit breaker is open are skipped at once. Returns None
+    only when every provider answered "no match"; if none matched and any of
+    them failed, the error is raised so the miss is not treated as
+    definitive (CircuitOpenError when every provider was short-circuited).
+    """
+    name = "hedged"
+
+    def __init__(self, providers, hedge_delay=HEDGE_DELAY):
+        if not providers:
+            raise ValueError("HedgedGeocoder needs at least one provider")
+        self.providers = list(providers)
+        self.hedge_delay = hedge_delay
+        self._slots = {id(p): threading.BoundedSemaphore(max(1, p.max_concurrency)) for p in self.providers}
+        self._stats = {id(p): ProviderStats() for p in self.providers}
+        self._stats_lock = threading.Lock()
+        # Enough threads for every provider slot plus callers queued on the semaphores
+        workers = sum(max(1, p.max_concurrency) for p in self.providers) * 2
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="geocoder")
+
+    def _call(self, provider, query, on_start=None, abandoned=None):
+        """
+        Runs one provider call: waits for a concurrency slot, then (unless the
+        lookup was decided meanwhile) passes the breaker, waits for a
+        rate-limit token and goes upstream. on_start() is called right before
+        the request is sent. Returns None without a request or a token when
+        the lookup was abandoned before the slot came free.
+        """
+        stats = self._stats[id(provider)]
+        breaker = provider.breaker
+        with self._slots[id(provider)]:
+            if abandoned is not None and abandoned.is_set():
+                return None
+            token = breaker.allow() if breaker is not None else None
+            if breaker is not None and token is None:
+                with self._stats_lock:
+                    stats.short_circuited += 1
+                raise CircuitOpenError(breaker.name)
+            # Once the token is taken the request goes out even if the lookup was
+            # decided meanwhile: the budget is spent and the breaker needs the outcome
+            if provider.limiter is not None:
+                provider.limiter.acquire()
+            if on_start is not None:
+                on_start()
+            started = time.perf_counter()
+            try:
+                result = provider.query(query)
+            except Exception:
+                if breaker is not None:
+                    breaker.record(token, False)
+                with self._stats_lock:
+                    stats.calls += 1
+                    stats.errors += 1
+                    stats.latencies.append(time.perf_counter() - started)
+                raise
+            if breaker is not None:
+                breaker.record(token, True)
+            with self._stats_lock:
+                stats.calls += 1
+                stats.no_match += result is None
+                stats.latencies.append(time.perf_counter() - started)
+            return result
+
+    def query(self, query):
+        waiting = list(self.providers)
+        in_flight = {}
+        errors = []
+        # Set whenever a call starts upstream or finishes, so the loop re-checks
+        changed = threading.Event()
+        # Set once the lookup is decided: calls still queued locally are dropped
+        abandoned = threading.Event()
+        latest = {}  # "call": start record of the most recently launched call
+
+        def launch(hedged=False):
+            provider = waiting.pop(0)
+            if hedged:
+                with self._stats_lock:
+                    self._stats[id(provider)].hedged += 1
+            started = {}
+            latest.clear()
+            latest["call"] = started
+
+            def on_start():
+                started["at"] = time.perf_counter()
+                changed.set()
+
+            future = self._pool.submit(self._call, provider, query, on_start, abandoned)
+            future.add_done_callback(lambda f: changed.set())
+            in_flight[future] = provider
+
+        try:
+            launch()
+            while in_flight:
+                done = [future for future in in_flight if future.done()]
+                if not done:
+                    # The hedge clock starts once the call holds its slot and rate-limit
+                    # token, so waiting in our own queue never counts as a slow upstream
+                    timeout = None
+                    started_at = latest["call"].get("at")
+                    if waiting and started_at is not None:
+                        timeout = started_at + self.hedge_delay - time.perf_counter()
+                        if timeout <= 0:
+                            launch(hedged=True)
+                            continue
+                    changed.wait(timeout)
+                    changed.clear()
+                    continue
+
+                for future in done:
+                    provider = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        errors.append(e)
+                        continue
+                    if result is not None:
+                        with self._stats_lock:
+                            self._stats[id(provider)].wins += 1
+                        return result
+                # Empty or failed answer: move on to the next provider right away
+                if waiting:
+                    launch()
+        finally:
+            abandoned.set()
+            for future in in_flight:
+                future.cancel()
+
+        if errors:
+            # A real upstream error wins over "circuit open"
+            raise next((e for e in errors if not isinstance(e, CircuitOpenError)), errors[0])
+        return None
+
+    def geocode(self, query):
+        # Rate limits are applied per provider inside _call
+        return self.query(query)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "hedge_delay": self.hedge_delay,
+                "providers": [
+                    dict(self._stats[id(p)].snapshot(), name=p.name, max_concurrency=p.max_concurrency)
+                    for p in self.providers
+                ],
+            }
@@ -0,0 +1,60 @@
+import numpy as np
+
+# Hard ceiling: the DP table holds 2^n * n entries (~40 MB at 18 stops)
+MAX_SUPPORTED_STOPS = 18
+
+def solve_held_karp(cost, closed=False):
+    """
+    Exact shortest path through every node of a small cost matrix.
+    Node 0 is the fixed start. If closed is True the path must also return
+    to node 0 (the return leg is priced but not included in the result).
+    cost may be asymmetric.
+
+    Returns (order, total_cost) where order starts with 0.
+    """
+    cost = np.asarray(cost, dtype=float)
+    m = cost.shape[0] - 1 # stops besides the start
+    if m <= 0:
+        return [0], 0.0
+    if m > MAX_SUPPORTED_STOPS:
+        raise ValueError(f"Held-Karp supports up to {MAX_SUPPORTED_STOPS} stops, got {m}")
+
+    stops = cost[1:, 1:]
+    full = (1 << m) - 1
+    masks = np.arange(1 << m)
+    popcount = np.zeros(1 << m, dtype=np.int8)
+    for j in range(m):
+        popcount += ((masks >> j) & 1).astype(np.int8)
+
+    # dp[S, j]: cheapest path from the start through subset S ending at stop j
+    dp = np.full((1 << m, m), np.inf)
+    parent = np.full((1 << m, m), -1, dtype=np.int8)
+    singles = 1 << np.arange(m)
+    dp[singles, np.arange(m)] = cost[0, 1:]
+
+    for size in range(2, m + 1):
+        layer = masks[popcount == size]
+        for j in range(m):
+            bit = 1 << j
+            subsets = layer[(layer & bit) != 0]
+            prev = subsets ^ bit
+            candidates = dp[prev] + stops[:, j]
+            best = np.argmin(candidates, axis=1)
+            dp[subsets, j] = candidates[np.arange(len(subsets)), best]
+            parent[subsets, j] = best
+
+    final = dp[full] + (cost[1:, 0] if closed else 0.0)
+    last = int(np.argmin(final))
+    total = float(final[last])
+
+    # Walk the parents back from the full set
+    order = []
+    mask, j = full, last
+    while j != -1:
+        order.append(j + 1)
+        prev_j = int(parent[mask, j])
+        mask ^= 1 << j
+        j = prev_j
+    order.append(0)
+    order.reverse()
+    return order, total
@@ -0,0 +1,255 @@
+import atexit
+import json
+import os
+import threading
+from collections.abc import MutableMapping
+
+# Writes are buffered and appended + fsynced in batches by a background thread
+FLUSH_INTERVAL = float(os.getenv("CACHE_JOURNAL_FLUSH_INTERVAL", "1.0"))
+FLUSH_BATCH = int(os.getenv("CACHE_JOURNAL_FLUSH_BATCH", "64"))
+# The journal is rewritten with live records only once it holds at least this
+# many records and this fraction of them are superseded or deleted
+COMPACT_MIN_RECORDS = int(os.getenv("CACHE_JOURNAL_COMPACT_MIN_RECORDS", "1000"))
+COMPACT_STALE_RATIO = float(os.getenv("CACHE_JOURNAL_COMPACT_STALE_RATIO", "0.5"))
+
+_DELETED = object()
+
+class JournalCache(MutableMapping):
+    """
+    Persistent key -> JSON value mapping stored as an append-only journal.
+
+    Every line is `<json key>\\t<json value>\\n` (an empty value is a
+    deletion). Loading only decodes the keys and keeps an offset index; values
+    are read from disk on access. A torn line at the tail (crash mid-write) is
+    cut off, corrupt lines in the middle are skipped, so a crash never loses
+    the rest of the cache.
+
+    Writes go to an in-memory buffer and are appended and fsynced in batches
+    by a background thread, which also compacts the file when it is mostly
+    stale records. One process should own a journal file.
+
+    legacy_path: a plain JSON dict file (the old cache format) imported once
+    when the journal does not exist yet.
+    """
+
+    def __init__(self, path, legacy_path=None):
+        self.path = path
+        self.legacy_path = legacy_path
+        self._index = None      # key -> (offset, length) of its line in the journal
+        self._pending = {}      # key -> value (or _DELETED) not written yet
+        self._records = 0       # lines in the journal, live or stale
+        self._fd = None
+        self._lock = threading.RLock()      # index, pending and fd swaps
+        self._io_lock = threading.Lock()    # appends and compaction
+        self._wake = threading.Event()
+        self._flusher = None
+        self.corrupt_records = 0
+
+    # --- loading ---
+
+    def _load(self):
+        if self._index is not None:
+            return
+        with self._lock:
+            if self._index is not None:
+                return
+            if not os.path.exists(self.path) and self.legacy_path and os.path.exists(self.legacy_path):
+                self._import_legacy()
+
+            index, records, valid_end = {}, 0, 0
+            if os.path.exists(self.path):
+                with open(self.path, "rb") as f:
+                    offset = 0
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break  # torn write at the tail
+                        raw_key, sep, value = line.partition(b"\t")
+                        try:
+                            key = json.loads(raw_key) if sep else None
+                        except ValueError:
+                            key = None
+                        if key is None:
+                            self.corrupt_records += 1
+                        elif value == b"\n":
+                            index.pop(key, None)
+                        else:
+                            index[key] = (offset, len(line))
+                        records += 1
+                        offset += len(line)
+                    valid_end = offset
+
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+            if os.fstat(self._fd).st_size > valid_end:
+                os.ftruncate(self._fd, valid_end)
+            self._index = index
+            self._records = records
+
+    def _import_legacy(self):
+        try:
+            with open(self.legacy_path, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Cache journal: could not import {self.legacy_path}: {e}")
+            return
+        tmp = self.path + ".import"
+        with open(tmp, "wb") as out:
+            out.write(b"".join(self._encode(k, v) for k, v in legacy.items()))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, self.path)
+
+    @staticmethod
+    def _encode(key, value):
+        raw = b"" if value is _DELETED else json.dumps(value, ensure_ascii=False).encode("utf-8")
+        return json.dumps(key, ensure_ascii=False).encode("utf-8") + b"\t" + raw + b"\n"
+
+    # --- mapping interface ---
+
+    def __getitem__(self, key):
+        self._load()
+        with self._lock:
+            if key in self._pending:
+                value = self._pending[key]
+                if value is _DELETED:
+                    raise KeyError(key)
+                return value
+            offset, length = self._index[key]
+            line = os.pread(self._fd, length, offset)
+        try:
+            return json.loads(line.partition(b"\t")[2])
+        except ValueError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        self._load()
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key] is not _DELETED
+            return key in self._index
+
+    def __setitem__(self, key, value):
+        self._load()
+        with self._lock:
+            self._pending[key] = value
+            self._schedule_flush()
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        with self._lock:
+            self._pending[key] = _DELETED
+            self._schedule_flush()
+
+    def __iter__(self):
+        self._load()
+        with self._lock:
+            keys = set(self._index)
+            for key, value in self._pending.items():
+                if value is _DELETED:
+                    keys.discard(key)
+                else:
+                    keys.add(key)
+        return iter(list(keys))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def keys_by_age(self):
+        """Live keys, least recently written first (buffered writes count as newest)."""
+        self._load()
+        with self._lock:
+            written = sorted(
+                (offset, key) for key, (offset, _) in self._index.items() if key not in self._pending
+            )
+            return [key for _, key in written] + [
+                key for key, value in self._pending.items() if value is not _DELETED
+            ]
+
+    def get_many(self, keys):
+        """Returns {key: value} for the keys that are present."""
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    # --- write-behind ---
+
+    def _schedule_flush(self):
+        if self._flusher is None:
+            # Started on first write, so it lives in the worker process rather than a pre-fork parent
+            self._flusher = threading.Thread(target=self._run, name="cache-journal", daemon=True)
+            self._flusher.start()
+            atexit.register(self.flush)
+        if len(self._pending) >= FLUSH_BATCH:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+                if self._needs_compaction():
+                    self.compact()
+            except OSError as e:
+                print(f"Cache journal error: {e}")
+
+    def flush(self):
+        """Appends buffered writes to the journal with a single write + fsync."""
+        if self._index is None:
+            return
+        with self._io_lock:
+            with self._lock:
+                batch = dict(self._pending)
+            if not batch:
+                return
+
+            lines = [(key, value, self._encode(key, value)) for key, value in batch.items()]
+            offset = os.fstat(self._fd).st_size
+            os.write(self._fd, b"".join(line for _, _, line in lines))
+            os.fsync(self._fd)
+
+            with self._lock:
+                for key, value, line in lines:
+                    if value is _DELETED:
+                        self._index.pop(key, None)
+                    else:
+                        self._index[key] = (offset, len(line))
+                    offset += len(line)
+                    # A newer write for the key stays pending for the next batch
+                    if self._pending.get(key, None) is value:
+                        del self._pending[key]
+                self._records += len(lines)
+
+    def _needs_compaction(self):
+        with self._lock:
+            stale = self._records - len(self._index)
+            return self._records >= COMPACT_MIN_RECORDS and stale >= self._records * COMPACT_STALE_RATIO
+
+    def compact(self):
+        """Rewrites the journal with one line per live key and swaps it in atomically."""
+        self._load()
+        with self._io_lock:
+            # Only flush() and compact() touch the file, both under _io_lock,
+            # so the index cannot change while the copy is written
+            with self._lock:
+                snapshot = list(self._index.items())
+            new_index, offset = {}, 0
+            tmp = self.path + ".compact"
+            with open(tmp, "wb") as out:
+                for key, (old_offset, length) in snapshot:
+                    out.write(os.pread(self._fd, length, old_offset))
+                    new_index[key] = (offset, length)
+                    offset += length
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp, self.path)
+
+            new_fd = os.open(self.path, os.O_RDWR | os.O_APPEND)
+            with self._lock:
+                old_fd, self._fd = self._fd, new_fd
+                self._index = new_index
+                self._records = len(new_index)
+            os.close(old_fd)
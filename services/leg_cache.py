@@ -0,0 +1,284 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import delete, func, select, update
+from services.journal_cache import JournalCache
+from services.memory_cache import BoundedCache
+
+# Persistent leg store:
+#   "database": shared table (models.OSRMLegCacheEntry), safe with several workers
+#   "journal": local append-only file, one process only
+#   "none": memory tier only
+LEG_CACHE_BACKEND = os.getenv("OSRM_LEG_CACHE_BACKEND", "database")
+# Decimals kept in the cache key (5 = about 1 m), so re-geocoded stops still hit
+LEG_KEY_PRECISION = int(os.getenv("OSRM_LEG_KEY_PRECISION", "5"))
+# Least recently used legs are evicted from the persistent store beyond this many entries
+LEG_CACHE_MAX_ENTRIES = int(os.getenv("OSRM_LEG_CACHE_MAX_ENTRIES", "100000"))
+# Persistent writes between size checks
+EVICT_CHECK_EVERY = 1000
+# Hits are written back to the database (updated_at) in batches of this many
+# legs, or after this many seconds
+TOUCH_BATCH = 500
+TOUCH_INTERVAL = 60.0
+# Bounded in-process tier in front of the persistent store
+LEG_MEMORY_CACHE_ENTRIES = int(os.getenv("OSRM_LEG_MEMORY_CACHE_ENTRIES", "20000"))
+LEG_MEMORY_CACHE_BYTES = int(os.getenv("OSRM_LEG_MEMORY_CACHE_BYTES", str(32 * 1024 * 1024)))
+
+CACHE_DIR = "/tmp" if os.path.exists("/tmp") else "."
+LEG_CACHE_PATH = os.path.join(CACHE_DIR, "osrm_leg_cache.jsonl")
+
+def leg_key(origin, destination, precision=LEG_KEY_PRECISION):
+    """Cache key of the leg between two (lon, lat) points."""
+    return ";".join(f"{round(lon, precision)},{round(lat, precision)}" for lon, lat in (origin, destination))
+
+def leg_size(value):
+    # Legs are dicts with a coordinate list: count the points, not just the containers
+    if not isinstance(value, dict):
+        return sys.getsizeof(value)
+    coordinates = value.get("coordinates") or []
+    return sys.getsizeof(value) + sys.getsizeof(coordinates) + len(coordinates) * 120
+
+class JournalLegStore:
+    """
+    Legs in a local JournalCache; the least recently used legs are deleted
+    beyond max_entries. Recency is tracked in memory (the journal is owned by
+    one process): legs not used since startup rank by write order, before any
+    leg used or written since.
+    """
+
+    def __init__(self, path, max_entries):
+        self.max_entries = max_entries
+        self._journal = JournalCache(path)
+        self._recent = OrderedDict()  # keys used or written since startup, least recent first
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.evictions = 0
+
+    def get_many(self, keys):
+        return self._journal.get_many(keys)
+
+    def touch(self, keys):
+        with self._lock:
+            for key in keys:
+                self._recent[key] = None
+                self._recent.move_to_end(key)
+
+    def set_many(self, legs):
+        for key, value in legs.items():
+            self._journal[key] = value
+        self.touch(legs)
+        self._writes += len(legs)
+        if self._writes >= EVICT_CHECK_EVERY:
+            self._writes = 0
+            with self._lock:
+                recent = list(self._recent)
+            live = self._journal.keys_by_age()
+            used = set(recent)
+            order = [key for key in live if key not in used] + [key for key in recent if key in self._journal]
+            for key in order[:max(len(order) - self.max_entries, 0)]:
+                del self._journal[key]
+                with self._lock:
+                    self._recent.pop(key, None)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._journal)
+
+class DatabaseLegStore:
+    """
+    Legs in models.OSRMLegCacheEntry. updated_at is refreshed on writes and,
+    in batches, on hits, so eviction drops the least recently used legs.
+    Database errors degrade to cache misses.
+    """
+
+    def __init__(self, max_entries, session_factory=None):
+        import database
+        self.max_entries = max_entries
+        self.session_factory = session_factory or database.SessionLocal
+        self._writes = 0
+        self._touched = set()
+        self._last_touch_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get_many(self, keys):
+        import models
+        from services.geocode_db_cache import READ_BATCH, key_hash
+        table = models.OSRMLegCacheEntry
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        try:
+            with self.session_factory() as db:
+                for start in range(0, len(keys), READ_BATCH):
+                    by_hash = {key_hash(key): key for key in keys[start:start + READ_BATCH]}
+                    rows = db.execute(
+                        select(table.key_hash, table.distance, table.duration, table.geometry)
+                        .where(table.key_hash.in_(list(by_hash)))
+                    )
+                    for h, distance, duration, geometry in rows:
+                        found[by_hash[h]] = {
+                            "distance": distance,
+                            "duration": duration,
+                            "coordinates": json.loads(geometry) if geometry else None,
+                        }
+        except Exception as e:
+            print(f"OSRM leg cache DB error: {e}")
+        return found
+
+    def set_many(self, legs):
+        import models
+        from services.geocode_db_cache import key_hash, upsert
+        now = datetime.utcnow()
+        rows = [{
+            "key_hash": key_hash(key),
+            "leg_key": key[:100],
+            "distance": value["distance"],
+            "duration": value["duration"],
+            "geometry": json.dumps(value.get("coordinates")),
+            "updated_at": now,
+        } for key, value in legs.items()]
+        try:
+            with self.session_factory() as db:
+                upsert(db, models.OSRMLegCacheEntry, rows, ("distance", "duration", "geometry", "updated_at"))
+                db.commit()
+        except Exception as e:
+            print(f"OSRM leg cache DB error: {e}")
+            return
+
+        with self._lock:
+            self._writes += len(rows)
+            check = self._writes >= EVICT_CHECK_EVERY
+            if check:
+                self._writes = 0
+        if check:
+            self._evict()
+
+    def touch(self, keys):
+        """Marks legs as used; their updated_at is refreshed with the next batch."""
+        from services.geocode_db_cache import key_hash
+        with self._lock:
+            self._touched.update(key_hash(key) for key in keys)
+            due = len(self._touched) >= TOUCH_BATCH or time.monotonic() - self._last_touch_flush >= TOUCH_INTERVAL
+        if due:
+            self.flush_touched()
+
+    def flush_touched(self):
+        import models
+        from services.geocode_db_cache import READ_BATCH
+        with self._lock:
+            hashes, self._touched = list(self._touched), set()
+            self._last_touch_flush = time.monotonic()
+        if not hashes:
+            return
+        table = models.OSRMLegCacheEntry
+        now = datetime.utcnow()
+        try:
+            with self.session_factory() as db:
+                for start in range(0, len(hashes), READ_BATCH):
+                    db.execute(update(table).where(table.key_hash.in_(hashes[start:start + READ_BATCH]))
+                               .values(updated_at=now))
+                db.commit()
+        except Exception as e:
+            print(f"OSRM leg cache DB error: {e}")
+
+    def _evict(self):
+        import models
+        table = models.OSRMLegCacheEntry
+        # Recent hits must count before the oldest rows are picked
+        self.flush_touched()
+        try:
+            with self.session_factory() as db:
+                excess = db.scalar(select(func.count()).select_from(table)) - self.max_entries
+                if excess <= 0:
+                    return
+                # Newest id among the oldest `excess` rows; everything up to it goes
+                cutoff = db.scalar(select(table.id).order_by(table.updated_at, table.id).offset(excess - 1).limit(1))
+                oldest = db.scalar(select(table.updated_at).where(table.id == cutoff))
+                result = db.execute(delete(table).where(
+                    (table.updated_at < oldest) | ((table.updated_at == oldest) & (table.id <= cutoff))
+                ))
+                db.commit()
+                self.evictions += result.rowcount or 0
+        except Exception as e:
+            print(f"OSRM leg cache DB error: {e}")
+
+    def __len__(self):
+        import models
+        with self.session_factory() as db:
+            return db.scalar(select(func.count()).select_from(models.OSRMLegCacheEntry))
+
+class LegCache:
+    """
+    Road legs (distance m, duration s, [lon, lat] coordinates) keyed on the
+    rounded (origin, destination) pair, so routes over known customers are
+    assembled without asking OSRM again. A bounded memory tier sits in front
+    of the persistent store.
+    """
+
+    def __init__(self, store, memory=None):
+        self.store = store
+        self.memory = memory or BoundedCache(LEG_MEMORY_CACHE_ENTRIES, LEG_MEMORY_CACHE_BYTES, sizeof=leg_size)
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.persistent_hits = 0
+
+    def get_many(self, keys):
+        """{key: leg} for the keys found in memory or in the persistent store."""
+        found, missing = {}, []
+        for key in dict.fromkeys(keys):
+            value = self.memory.get(key)
+            if value is not None:
+                found[key] = value
+            else:
+                missing.append(key)
+        if missing and self.store is not None:
+            stored = self.store.get_many(missing)
+            for key, value in stored.items():
+                if value.get("coordinates") is None:
+                    continue
+                self.memory.set(key, value)
+                found[key] = value
+        with self._lock:
+            self.lookups += len(dict.fromkeys(keys))
+            self.persistent_hits += len(found) - (len(dict.fromkeys(keys)) - len(missing))
+        if found and self.store is not None:
+            # Memory hits count too, or the legs used most would age out of the store
+            self.store.touch(found)
+        return found
+
+    def set_many(self, legs):
+        for key, value in legs.items():
+            self.memory.set(key, value)
+        if legs and self.store is not None:
+            self.store.set_many(legs)
+
+    def stats(self):
+        with self._lock:
+            lookups, persistent_hits = self.lookups, self.persistent_hits
+        memory = self.memory.stats()
+        hits = memory["hits"] + persistent_hits
+        return {
+            "backend": LEG_CACHE_BACKEND,
+            "key_precision": LEG_KEY_PRECISION,
+            "lookups": lookups,
+            "hits": hits,
+            "misses": lookups - hits,
+            "hit_rate": hits / lookups if lookups else None,
+            "persistent_hits": persistent_hits,
+            "persistent_max_entries": LEG_CACHE_MAX_ENTRIES,
+            "persistent_evictions": self.store.evictions if self.store is not None else 0,
+            "memory": memory,
+        }
+
+def create_leg_cache(backend=LEG_CACHE_BACKEND):
+    if backend == "database":
+        return LegCache(DatabaseLegStore(LEG_CACHE_MAX_ENTRIES))
+    if backend == "journal":
+        return LegCache(JournalLegStore(LEG_CACHE_PATH, LEG_CACHE_MAX_ENTRIES))
+    if backend == "none":
+        return LegCache(None)
+    raise ValueError(f"Unknown OSRM_LEG_CACHE_BACKEND: {backend}")
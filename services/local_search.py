@@ -0,0 +1,190 @@
+import time
+import numpy as np
+
+# Moves accepted by improve_path (also the suffixes allowed in the "strategy" field)
+AVAILABLE_MOVES = ("2opt", "oropt")
+
+# Longest segment Or-opt tries to relocate
+OR_OPT_MAX_SEGMENT = 3
+
+# Default time budget (seconds) when the caller sets neither limit
+DEFAULT_TIME_LIMIT = 2.0
+
+EPSILON = 1e-9
+
+def path_cost(path, cost):
+    """
+    Total cost of walking the path in order.
+    cost: square matrix (or anything indexable as cost[rows, cols]).
+    """
+    path = np.asarray(path)
+    if len(path) < 2:
+        return 0.0
+    return float(np.sum(cost[path[:-1], path[1:]]))
+
+def _prefix_costs(p, cost):
+    # F[k]: cost of walking p[0..k] forwards, R[k]: cost of walking it backwards
+    forward = np.concatenate(([0.0], np.cumsum(cost[p[:-1], p[1:]])))
+    backward = np.concatenate(([0.0], np.cumsum(cost[p[1:], p[:-1]])))
+    return forward, backward
+
+def _two_opt_pass(p, cost, closed, deadline, budget=None):
+    """
+    One sweep of 2-opt. For each i, every reversal p[i..j] is evaluated at once.
+    Reversed segments are priced with their backward cost, so asymmetric
+    matrices are handled correctly. Stops after `budget` moves (None: no limit).
+    Returns (path, moves_applied).
+    """
+    n = len(p)
+    last_movable = n - 2 if closed else n - 1
+    applied = 0
+    forward, backward = _prefix_costs(p, cost)
+
+    for i in range(1, last_movable):
+        if budget is not None and applied >= budget:
+            break
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+        j = np.arange(i + 1, last_movable + 1)
+        prev, first = p[i - 1], p[i]
+
+        delta = cost[prev, p[j]] - cost[prev, first] \
+            + (backward[j] - backward[i]) - (forward[j] - forward[i])
+
+        has_next = j + 1 < n
+        nxt = p[np.minimum(j + 1, n - 1)]
+        delta += np.where(has_next, cost[first, nxt] - cost[p[j], nxt], 0.0)
+
+        best = int(np.argmin(delta))
+        if delta[best] < -EPSILON:
+            end = int(j[best])
+            p[i:end + 1] = p[i:end + 1][::-1]
+            forward, backward = _prefix_costs(p, cost)
+            applied += 1
+
+    return p, applied
+
+def _or_opt_pass(p, cost, closed, deadline, budget=None):
+    """
+    One sweep of Or-opt: relocate segments of 1..OR_OPT_MAX_SEGMENT stops to
+    the cheapest other edge, optionally reversed. Stops after `budget` moves
+    (None: no limit).
+    Returns (path, moves_applied).
+    """
+    applied = 0
+    for size in range(1, OR_OPT_MAX_SEGMENT + 1):
+        i = 1
+        while True:
+            n = len(p)
+            last_movable = n - 2 if closed else n - 1
+            end = i + size - 1
+            if end > last_movable or n - size < 2:
+                break
+            if budget is not None and applied >= budget:
+                return p, applied
+            if deadline is not None and time.perf_counter() > deadline:
+                return p, applied
+
+            seg_first, seg_last = p[i], p[end]
+            prev = p[i - 1]
+            has_next = end + 1 < n
+            forward, backward = _prefix_costs(p, cost)
+            seg_forward = forward[end] - forward[i]
+            seg_backward = backward[end] - backward[i]
+
+            # Gain from cutting the segment out and closing the gap
+            removal = cost[prev, seg_first] + seg_forward
+            if has_next:
+                nxt = p[end + 1]
+                removal += cost[seg_last, nxt] - cost[prev, nxt]
+
+            # Candidate edges (p[k], p[k+1]) outside the segment
+            k = np.arange(n - 1)
+            valid = (k < i - 1) | (k > end)
+            a, b = p[k], p[k + 1]
+            base = cost[a, b]
+            ins_fwd = cost[a, seg_first] + seg_forward + cost[seg_last, b] - base
+            ins_rev = cost[a, seg_last] + seg_backward + cost[seg_first, b] - base
+            ins_fwd = np.where(valid, ins_fwd, np.inf)
+            ins_rev = np.where(valid, ins_rev, np.inf)
+
+            options = [ins_fwd, ins_rev]
+            if not closed and has_next:
+                # Open routes may also append the segment at the very end
+                tail = p[-1]
+                options.append(np.array([cost[tail, seg_first] + seg_forward]))
+                options.append(np.array([cost[tail, seg_last] + seg_backward]))
+
+            best_delta, best_opt, best_k = np.inf, None, None
+            for opt_idx, values in enumerate(options):
+                idx = int(np.argmin(values))
+                if values[idx] < best_delta:
+                    best_delta, best_opt, best_k = values[idx], opt_idx, idx
+
+            if best_delta - removal < -EPSILON:
+                segment = p[i:end + 1].copy()
+                if best_opt % 2 == 1:
+                    segment = segment[::-1]
+                rest = np.concatenate((p[:i], p[end + 1:]))
+                if best_opt >= 2:
+                    insert_at = len(rest)
+                else:
+                    # Position in "rest" right after p[best_k]
+                    insert_at = best_k + 1 if best_k < i else best_k + 1 - size
+                p = np.concatenate((rest[:insert_at], segment, rest[insert_at:]))
+                applied += 1
+            else:
+                i += 1
+
+    return p, applied
+
+def improve_path(path, cost, closed=False, moves=AVAILABLE_MOVES, time_limit=None, max_iterations=None):
+    """
+    Local search over a path of matrix indices.
+    path[0] is never moved (depot / route start). If closed is True, path[-1]
+    is the return stop and is kept fixed too.
+    moves: any of AVAILABLE_MOVES, applied in alternation until no move improves
+    the path, the time budget runs out or max_iterations moves were applied.
+
+    Returns (path, stats) where stats contains initial/final cost,
+    improvement percentage, elapsed seconds and moves applied.
+    """
+    started = time.perf_counter()
+    if time_limit is None and max_iterations is None:
+        time_limit = DEFAULT_TIME_LIMIT
+    deadline = started + time_limit if time_limit is not None else None
+
+    p = np.array(path, dtype=int)
+    initial = path_cost(p, cost)
+    iterations = 0
+
+    improved = len(p) > 3
+    while improved:
+        improved = False
+        for move in moves:
+            if max_iterations is not None and iterations >= max_iterations:
+                break
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            budget = max_iterations - iterations if max_iterations is not None else None
+            if move == "2opt":
+                p, applied = _two_opt_pass(p, cost, closed, deadline, budget)
+            else:
+                p, applied = _or_opt_pass(p, cost, closed, deadline, budget)
+            iterations += applied
+            improved = improved or applied > 0
+
+        if max_iterations is not None and iterations >= max_iterations:
+            break
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+
+    final = path_cost(p, cost)
+    stats = {
+        "initial_cost": initial,
+        "final_cost": final,
+        "improvement_pct": (initial - final) / initial * 100 if initial > 0 else 0.0,
+        "improvement_time": time.perf_counter() - started,
+        "iterations": iterations,
+    }
+    return p.tolist(), stats
@@ -0,0 +1,89 @@
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from services.journal_cache import JournalCache
+
+class JournalNegativeCache:
+    """
+    Addresses that no query variant could resolve, with the time they failed.
+    Entries older than ttl seconds are ignored (and dropped when seen).
+    """
+
+    def __init__(self, path, ttl):
+        self.ttl = ttl
+        self._journal = JournalCache(path)
+
+    def get_many(self, keys):
+        """Returns the subset of keys with a fresh negative entry."""
+        cutoff = time.time() - self.ttl
+        fresh = set()
+        for key in keys:
+            failed_at = self._journal.get(key)
+            if failed_at is None:
+                continue
+            if failed_at >= cutoff:
+                fresh.add(key)
+            else:
+                self._journal.pop(key, None)
+        return fresh
+
+    def add(self, key):
+        self._journal[key] = time.time()
+
+    def invalidate(self, keys=None):
+        """Drops the given keys, or every entry when keys is None. Returns how many were removed."""
+        keys = list(self._journal) if keys is None else [key for key in keys if key in self._journal]
+        for key in keys:
+            del self._journal[key]
+        return len(keys)
+
+class DatabaseNegativeCache:
+    """Same as JournalNegativeCache, stored in models.GeocodeNegativeEntry so every worker shares it."""
+
+    def __init__(self, ttl, session_factory=None):
+        import database
+        self.ttl = ttl
+        self.session_factory = session_factory or database.SessionLocal
+
+    def get_many(self, keys):
+        import models
+        from services.geocode_db_cache import READ_BATCH, key_hash
+        keys = list(dict.fromkeys(keys))
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+        fresh = set()
+        try:
+            with self.session_factory() as db:
+                for start in range(0, len(keys), READ_BATCH):
+                    by_hash = {key_hash(key): key for key in keys[start:start + READ_BATCH]}
+                    rows = db.execute(
+                        select(models.GeocodeNegativeEntry.key_hash)
+                        .where(models.GeocodeNegativeEntry.key_hash.in_(list(by_hash)))
+                        .where(models.GeocodeNegativeEntry.created_at >= cutoff)
+                    )
+                    fresh.update(by_hash[h] for (h,) in rows)
+        except Exception as e:
+            print(f"Negative geocode cache DB error: {e}")
+        return fresh
+
+    def add(self, key):
+        import models
+        from services.geocode_db_cache import key_hash
+        h = key_hash(key)
+        try:
+            with self.session_factory() as db:
+                db.execute(delete(models.GeocodeNegativeEntry).where(models.GeocodeNegativeEntry.key_hash == h))
+                db.add(models.GeocodeNegativeEntry(key_hash=h, address_key=key[:500], created_at=datetime.utcnow()))
+                db.commit()
+        except Exception as e:
+            print(f"Negative geocode cache DB error: {e}")
+
+    def invalidate(self, keys=None):
+        import models
+        from services.geocode_db_cache import key_hash
+        stmt = delete(models.GeocodeNegativeEntry)
+        if keys is not None:
+            stmt = stmt.where(models.GeocodeNegativeEntry.key_hash.in_([key_hash(key) for key in keys]))
+        with self.session_factory() as db:
+            removed = db.execute(stmt).rowcount
+            db.commit()
+        return removed
@@ -0,0 +1,275 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import LargeBinary, delete, func, insert, literal, select, update
+from sqlalchemy.exc import OperationalError
+import database
+import models
+
+# Jobs run at the same time in each process
+JOB_WORKERS = int(os.getenv("OPTIMIZATION_JOB_WORKERS", "2"))
+# Submissions are refused while this many jobs are waiting (all workers together)
+JOB_MAX_QUEUE = int(os.getenv("OPTIMIZATION_JOB_MAX_QUEUE", "50"))
+# Seconds between checks for jobs queued by other workers
+JOB_POLL_INTERVAL = float(os.getenv("OPTIMIZATION_JOB_POLL_INTERVAL", "2"))
+# Running jobs get a heartbeat this often; one without a heartbeat for JOB_LEASE
+# seconds lost its worker (restart, crash) and is queued again
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("OPTIMIZATION_JOB_HEARTBEAT_INTERVAL", "10"))
+JOB_LEASE = float(os.getenv("OPTIMIZATION_JOB_LEASE", "60"))
+# Claims per job; a job whose worker was lost this many times is failed
+JOB_MAX_ATTEMPTS = int(os.getenv("OPTIMIZATION_JOB_MAX_ATTEMPTS", "3"))
+# A job still running after this many seconds (heartbeat or not) is failed
+JOB_TIMEOUT = float(os.getenv("OPTIMIZATION_JOB_TIMEOUT", "3600"))
+# Finished jobs and their results are deleted after this many seconds
+JOB_RETENTION = float(os.getenv("OPTIMIZATION_JOB_RETENTION", str(7 * 86400)))
+
+QUEUED, RUNNING, COMPLETED, FAILED = "queued", "running", "completed", "failed"
+
+class QueueFullError(Exception):
+    pass
+
+class OptimizationJobQueue:
+    """
+    Background optimization jobs persisted in models.OptimizationJob, so the
+    upload, status and result are visible to every worker process.
+
+    The table is the queue: each process runs a dispatcher thread that claims
+    the oldest queued job (a conditional UPDATE, so only one worker wins it)
+    whenever one of its `workers` slots is free, and runs
+    handler(job_id, filename, file_data, options) on a thread pool. The
+    handler returns a JSON-serializable result or raises; an exception's
+    status_code/detail (e.g. HTTPException) are kept for the client.
+
+    Running jobs hold a lease kept alive by the dispatcher's heartbeat. A job
+    whose lease expired is queued again, up to JOB_MAX_ATTEMPTS claims; the
+    attempt number fences off a late finish from the worker that lost it.
+    """
+
+    def __init__(self, handler, workers=JOB_WORKERS, max_queue=JOB_MAX_QUEUE, session_factory=database.SessionLocal):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.session_factory = session_factory
+        self.worker_name = f"{socket.gethostname()}:{os.getpid()}"[:100]
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._wake = threading.Event()
+        self._pool = None
+        self._dispatcher = None
+        self._lock = threading.Lock()
+        self._running = {}  # job_id -> attempt, for the heartbeat
+        self._last_heartbeat = 0.0
+        self._last_expire = 0.0
+
+    def start(self):
+        """Starts the dispatcher (once per process; call after forking)."""
+        with self._lock:
+            if self._dispatcher is not None:
+                return
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="optimization-job")
+            self._dispatcher = threading.Thread(target=self._dispatch, name="optimization-dispatcher", daemon=True)
+            self._dispatcher.start()
+
+    # --- submission and polling ---
+
+    def submit(self, user_id, filename, file_data, options):
+        """
+        Queues a job and returns its id. Raises QueueFullError when max_queue
+        jobs are waiting. The count and the insert are one INSERT ... SELECT,
+        so concurrent submissions cannot overshoot max_queue.
+        """
+        table = models.OptimizationJob
+        job_id = uuid.uuid4().hex
+        waiting = select(func.count().label("n")).select_from(table).where(table.status == QUEUED).subquery()
+        values = {
+            "id": literal(job_id),
+            "user_id": literal(user_id),
+            "status": literal(QUEUED),
+            "filename": literal(filename[:255]),
+            "options": literal(json.dumps(options)),
+            "file_data": literal(file_data, LargeBinary),
+            "attempts": literal(0),
+            "created_at": literal(datetime.utcnow(), table.created_at.type),
+        }
+        stmt = insert(table).from_select(
+            list(values), select(*values.values()).select_from(waiting).where(waiting.c.n < self.max_queue)
+        )
+        for attempt in range(3):
+            try:
+                with self.session_factory() as db:
+                    inserted = db.execute(stmt).rowcount
+                    db.commit()
+                break
+            except OperationalError:
+                # InnoDB resolves two racing submissions as a deadlock: retry the loser
+                if attempt == 2:
+                    raise
+        if inserted != 1:
+            raise QueueFullError(f"{self.max_queue} jobs waiting")
+        self.start()
+        self._wake.set()
+        return job_id
+
+    def get(self, job_id):
+        """Status of a job (without its result) as a dict, or None."""
+        table = models.OptimizationJob
+        with self.session_factory() as db:
+            job = db.execute(
+                select(table.id, table.user_id, table.status, table.filename, table.error, table.error_status,
+                       table.created_at, table.started_at, table.finished_at).where(table.id == job_id)
+            ).first()
+            if job is None:
+                return None
+            position = None
+            if job.status == QUEUED:
+                position = db.scalar(select(func.count()).select_from(table).where(
+                    table.status == QUEUED, table.created_at <= job.created_at
+                ))
+        return {
+            "job_id": job.id,
+            "user_id": job.user_id,
+            "status": job.status,
+            "filename": job.filename,
+            "queue_position": position,
+            "error": job.error,
+            "error_status": job.error_status,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+        }
+
+    def result(self, job_id):
+        """Decoded result of a completed job, or None."""
+        with self.session_factory() as db:
+            raw = db.scalar(select(models.OptimizationJob.result).where(models.OptimizationJob.id == job_id))
+        return json.loads(raw) if raw else None
+
+    def stats(self):
+        table = models.OptimizationJob
+        with self.session_factory() as db:
+            counts = dict(db.execute(select(table.status, func.count()).group_by(table.status)).all())
+        return {"workers_per_process": self.workers, "max_queue": self.max_queue, "jobs": counts}
+
+    # --- processing ---
+
+    def _dispatch(self):
+        while True:
+            try:
+                self._heartbeat()
+                self._expire()
+                while self._slots.acquire(blocking=False):
+                    try:
+                        claimed = self._claim()
+                    except Exception:
+                        self._slots.release()
+                        raise
+                    if claimed is None:
+                        self._slots.release()
+                        break
+                    self._pool.submit(self._run, *claimed)
+            except Exception as e:
+                print(f"Optimization job dispatcher error: {e}")
+            self._wake.wait(JOB_POLL_INTERVAL)
+            self._wake.clear()
+
+    def _claim(self):
+        """Marks the oldest queued job as running for this worker. Returns (job_id, attempt), or None."""
+        table = models.OptimizationJob
+        with self.session_factory() as db:
+            candidates = db.execute(
+                select(table.id, table.attempts).where(table.status == QUEUED)
+                .order_by(table.created_at).limit(self.workers)
+            ).all()
+            for job_id, attempts in candidates:
+                now = datetime.utcnow()
+                claimed = db.execute(
+                    update(table).where(table.id == job_id, table.status == QUEUED, table.attempts == attempts)
+                    .values(status=RUNNING, worker=self.worker_name, attempts=attempts + 1,
+                            started_at=now, heartbeat_at=now)
+                )
+                db.commit()
+                if claimed.rowcount == 1:
+                    with self._lock:
+                        self._running[job_id] = attempts + 1
+                    return job_id, attempts + 1
+        return None
+
+    def _heartbeat(self):
+        """Renews the lease of the jobs running in this process."""
+        if time.monotonic() - self._last_heartbeat < JOB_HEARTBEAT_INTERVAL:
+            return
+        self._last_heartbeat = time.monotonic()
+        with self._lock:
+            running = dict(self._running)
+        if not running:
+            return
+        table = models.OptimizationJob
+        now = datetime.utcnow()
+        with self.session_factory() as db:
+            for job_id, attempt in running.items():
+                db.execute(update(table).where(
+                    table.id == job_id, table.status == RUNNING, table.attempts == attempt
+                ).values(heartbeat_at=now))
+            db.commit()
+
+    def _run(self, job_id, attempt):
+        table = models.OptimizationJob
+        try:
+            with self.session_factory() as db:
+                job = db.get(table, job_id)
+                filename, file_data, options = job.filename, job.file_data, json.loads(job.options)
+
+            values = {"status": COMPLETED}
+            try:
+                values["result"] = json.dumps(self.handler(job_id, filename, file_data, options))
+            except Exception as e:
+                values = {
+                    "status": FAILED,
+                    "error": str(getattr(e, "detail", e)),
+                    "error_status": getattr(e, "status_code", 500),
+                }
+
+            with self.session_factory() as db:
+                # Only while this claim still holds it: the job may have been requeued meanwhile
+                db.execute(update(table).where(
+                    table.id == job_id, table.status == RUNNING, table.attempts == attempt
+                ).values(file_data=None, finished_at=datetime.utcnow(), **values))
+                db.commit()
+        except Exception as e:
+            print(f"Optimization job {job_id} error: {e}")
+        finally:
+            with self._lock:
+                self._running.pop(job_id, None)
+            self._slots.release()
+            self._wake.set()
+
+    def _expire(self):
+        """
+        Requeues jobs whose lease expired (or fails them after JOB_MAX_ATTEMPTS
+        claims), fails jobs past JOB_TIMEOUT and deletes finished jobs past
+        JOB_RETENTION. Runs every half lease.
+        """
+        if time.monotonic() - self._last_expire < JOB_LEASE / 2:
+            return
+        self._last_expire = time.monotonic()
+        table = models.OptimizationJob
+        now = datetime.utcnow()
+        lost = (table.status == RUNNING) & (table.heartbeat_at < now - timedelta(seconds=JOB_LEASE))
+        with self.session_factory() as db:
+            db.execute(update(table).where(lost, table.attempts < JOB_MAX_ATTEMPTS)
+                       .values(status=QUEUED, worker=None, started_at=None, heartbeat_at=None))
+            db.execute(update(table).where(lost).values(
+                status=FAILED, error="Worker lost before finishing", error_status=500,
+                file_data=None, finished_at=now))
+            db.execute(update(table).where(
+                table.status == RUNNING, table.started_at < now - timedelta(seconds=JOB_TIMEOUT)
+            ).values(status=FAILED, error="Job timed out", error_status=504,
+                     file_data=None, finished_at=now))
+            db.execute(delete(table).where(
+                table.status.in_((COMPLETED, FAILED)), table.finished_at < now - timedelta(seconds=JOB_RETENTION)
+            ))
+            db.commit()
@@ -1,8 +1,25 @@
 import math
+import os
+import time
+import numpy as np
+from services.local_search import AVAILABLE_MOVES, improve_path, path_cost
+from services.held_karp import MAX_SUPPORTED_STOPS, solve_held_karp
+
+EARTH_RADIUS_KM = 6371
+
+# Above this many nodes the greedy uses the spatial grid instead of a dense matrix
+SPATIAL_INDEX_MIN_STOPS = 1000
+
+# Largest manifest for which the local search still gets a precomputed matrix
+DENSE_MATRIX_MAX_STOPS = 3000
+
+# Routes with at most this many stops are solved exactly (Held-Karp). 0 disables it.
+# See benchmark_optimizer.py for the crossover measurements.
+HELD_KARP_MAX_STOPS = int(os.getenv("HELD_KARP_MAX_STOPS", "15"))
 
 def calculate_distance(lat1, lon1, lat2, lon2):
     # Haversine formula
-    R = 6371  # Earth radius in km
+    R = EARTH_RADIUS_KM  # Earth radius in km
     dlat = math.radians(lat2 - lat1)
     dlon = math.radians(lon2 - lon1)
     a = math.sin(dlat / 2) * math.sin(dlat / 2) + \
@@ -11,87 +28,250 @@ def calculate_distance(lat1, lon1, lat2, lon2):
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
     return R * c
 
-def optimize_route(locations, start_location=None, max_distance_km=None, round_trip=False, strategy="nearest"):
+def haversine_pairs(lats1, lons1, lats2, lons2):
+    """
+    Element-wise haversine distance (km) between coordinate arrays.
+    Inputs broadcast like any NumPy expression.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=float)) for x in (lats1, lons1, lats2, lons2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + \
+        np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(np.clip(1 - a, 0, None)))
+
+def haversine_matrix(lats_a, lons_a, lats_b=None, lons_b=None):
+    """
+    Pairwise haversine. Returns a (len(a), len(b)) array of distances in km.
+    If the second set is omitted, the matrix is computed for set A against itself.
+    """
+    lats_a = np.asarray(lats_a, dtype=float)
+    lons_a = np.asarray(lons_a, dtype=float)
+    if lats_b is None:
+        lats_b, lons_b = lats_a, lons_a
+    lats_b = np.asarray(lats_b, dtype=float)
+    lons_b = np.asarray(lons_b, dtype=float)
+    return haversine_pairs(lats_a[:, None], lons_a[:, None], lats_b[None, :], lons_b[None, :])
+
+def build_distance_matrix(points):
+    """
+    Full pairwise distance matrix (km) for a list of dicts with 'lat'/'lon'.
+    Row/column i corresponds to points[i].
+    """
+    lats = [p['lat'] for p in points]
+    lons = [p['lon'] for p in points]
+    return haversine_matrix(lats, lons)
+
+def leg_distances(points):
+    """
+    Straight-line distance (km) of each consecutive leg of an ordered route.
+    Element i is the distance from points[i] to points[i+1].
+    """
+    lats = np.array([p['lat'] for p in points], dtype=float)
+    lons = np.array([p['lon'] for p in points], dtype=float)
+    return haversine_pairs(lats[:-1], lons[:-1], lats[1:], lons[1:])
+
+class HaversineCosts:
+    """
+    Matrix-like view that computes haversine distances on demand.
+    Supports the same cost[rows, cols] fancy indexing as a dense matrix, so
+    the local search can run on manifests too large to materialize.
+    """
+
+    def __init__(self, points):
+        self.lats = np.array([p['lat'] for p in points], dtype=float)
+        self.lons = np.array([p['lon'] for p in points], dtype=float)
+
+    def __getitem__(self, key):
+        rows, cols = key
+        return haversine_pairs(self.lats[rows], self.lons[rows], self.lats[cols], self.lons[cols])
+
+def _greedy_from_matrix(dist, visited, base_strategy):
+    # Nearest-neighbour walk reading whole rows of the dense matrix
+    order = [0]
+    current = 0
+    remaining = int((~visited).sum())
+
+    # Strategy Implementation
+    if base_strategy == "furthest" and remaining:
+        # 1. Find the point furthest from start
+        row = np.where(visited, -np.inf, dist[0])
+        furthest_idx = int(np.argmax(row))
+
+        # Move to furthest first
+        visited[furthest_idx] = True
+        order.append(furthest_idx)
+        current = furthest_idx
+        remaining -= 1
+
+        # Continue with Nearest Neighbor from there (essentially working backwards)
+        # This works well for "Go far, deliver on way back"
+
+    # Standard Nearest Neighbor Loop (greedy)
+    while remaining:
+        row = np.where(visited, np.inf, dist[current])
+        nearest_idx = int(np.argmin(row))
+
+        visited[nearest_idx] = True
+        order.append(nearest_idx)
+        current = nearest_idx
+        remaining -= 1
+
+    return order
+
+def _greedy_from_index(nodes, max_distance_km, base_strategy):
+    # Same walk as _greedy_from_matrix, but each lookup is a grid query
+    from services.spatial_index import GridIndex
+
+    index = GridIndex([p['lat'] for p in nodes], [p['lon'] for p in nodes])
+    index.remove(0)
+
+    # Depot radius filter as a range query on the same index
+    if max_distance_km is not None and max_distance_km > 0:
+        keep = set(index.within(nodes[0]['lat'], nodes[0]['lon'], max_distance_km))
+        for i in range(1, len(nodes)):
+            if i not in keep:
+                index.remove(i)
+
+    order = [0]
+    current = 0
+
+    if base_strategy == "furthest" and len(index):
+        alive = np.array(sorted(index.alive))
+        dists = haversine_pairs(index.lats[0], index.lons[0], index.lats[alive], index.lons[alive])
+        current = int(alive[int(np.argmax(dists))])
+        index.remove(current)
+        order.append(current)
+
+    while len(index):
+        current = index.nearest(index.lats[current], index.lons[current])
+        index.remove(current)
+        order.append(current)
+
+    return order
+
+def parse_strategy(strategy):
+    """
+    Splits a strategy string like "nearest+2opt+oropt" into the base
+    construction heuristic and the list of improvement moves.
+    """
+    parts = [p.strip().lower() for p in (strategy or "nearest").split("+") if p.strip()]
+    base = parts[0] if parts else "nearest"
+    moves = parts[1:]
+
+    if base not in ("nearest", "furthest"):
+        raise ValueError(f"Unknown strategy: {base}")
+    for move in moves:
+        if move not in AVAILABLE_MOVES:
+            raise ValueError(f"Unknown improvement step: {move}. Use one of {', '.join(AVAILABLE_MOVES)}")
+    return base, moves
+
+def _solve_exact(dist, order, round_trip):
+    # Held-Karp over the nodes of the greedy tour (start first)
+    sub_order, _ = solve_held_karp(dist[np.ix_(order, order)], closed=round_trip)
+    return [order[i] for i in sub_order]
+
+def optimize_route(locations, start_location=None, max_distance_km=None, round_trip=False, strategy="nearest",
+                   improve_time_limit=None, improve_max_iterations=None, stats=None, exact_max_stops=None,
+                   cost_matrix=None):
     """
     Optimizes the route based on strategy.
-    strategy: "nearest" (default) or "furthest".
+    strategy: "nearest" (default) or "furthest", optionally followed by local
+              search steps, e.g. "nearest+2opt" or "furthest+2opt+oropt".
     round_trip: If True, adds the start location as the final destination.
+    improve_time_limit / improve_max_iterations: budget for the local search.
+    stats: optional dict, filled with the local search report when it runs.
+    exact_max_stops: "nearest" routes with at most this many stops are solved
+                     exactly instead (defaults to HELD_KARP_MAX_STOPS, 0 disables).
+    cost_matrix: optional square matrix of travel costs (e.g. OSRM durations)
+                 to optimize on instead of straight-line distance. Row/column 0
+                 is start_location (if given), followed by locations in order.
+                 max_distance_km is still measured in straight-line km.
+
+    Up to SPATIAL_INDEX_MIN_STOPS nodes, distances are read from a single
+    pairwise matrix computed up front. Larger manifests use a spatial grid
+    for the nearest-unvisited lookup and the max_distance filter.
     """
+    base_strategy, moves = parse_strategy(strategy)
+
     if not locations:
         return []
-    
-    # Make a copy to not mutate original list
-    pending = locations.copy()
-    route = []
-    
-    # Determine the starting point
-    current = None
-    start_node = None
-    
+
+    # Node list used for the matrix: index 0 is the starting point
     if start_location:
-        current = start_location
-        start_node = start_location # Keep reference for return trip
-        route.append(current)
-        
-        # Filter by max_distance if set
-        if max_distance_km is not None and max_distance_km > 0:
-            filtered_pending = []
-            for point in pending:
-                dist = calculate_distance(current['lat'], current['lon'], point['lat'], point['lon'])
-                if dist <= max_distance_km:
-                    filtered_pending.append(point)
-            pending = filtered_pending
-            
+        nodes = [start_location] + list(locations)
     else:
         # If no start location, just pick the first one from the list (only for nearest)
         # For 'furthest', we theoretically need a start node context, but if none, we just pick textually first.
-        if pending:
-            current = pending.pop(0)
-            route.append(current)
-            start_node = current # Approx start
-    
-    if not current:
-         return route
+        nodes = list(locations)
 
-    # Strategy Implementation
-    if strategy == "furthest" and start_node and pending:
-        # 1. Find the point furthest from start
-        furthest_idx = -1
-        max_dist = -1
-        
-        for i, point in enumerate(pending):
-            dist = calculate_distance(start_node['lat'], start_node['lon'], point['lat'], point['lon'])
-            if dist > max_dist:
-                max_dist = dist
-                furthest_idx = i
-                
-        if furthest_idx != -1:
-            # Move to furthest first
-            next_point = pending.pop(furthest_idx)
-            route.append(next_point)
-            current = next_point
-            
-            # Continue with Nearest Neighbor from there (essentially working backwards)
-            # This works well for "Go far, deliver on way back"
-            
-    # Standard Nearest Neighbor Loop (greedy)
-    while pending:
-        nearest_idx = -1
-        min_dist = float('inf')
-        
-        for i, point in enumerate(pending):
-            dist = calculate_distance(current['lat'], current['lon'], point['lat'], point['lon'])
-            if dist < min_dist:
-                min_dist = dist
-                nearest_idx = i
-        
-        if nearest_idx != -1:
-            next_point = pending.pop(nearest_idx)
-            route.append(next_point)
-            current = next_point
+    start_node = nodes[0]
+    has_filter = bool(start_location) and max_distance_km is not None and max_distance_km > 0
+
+    if cost_matrix is not None and np.shape(cost_matrix) != (len(nodes), len(nodes)):
+        raise ValueError(f"cost_matrix must be {len(nodes)}x{len(nodes)}, got {np.shape(cost_matrix)}")
+
+    if cost_matrix is not None or len(nodes) <= SPATIAL_INDEX_MIN_STOPS:
+        if cost_matrix is not None:
+            dist = np.asarray(cost_matrix, dtype=float)
         else:
-            break
-            
+            dist = build_distance_matrix(nodes)
+
+        # visited[i] marks nodes already in the route (or excluded by the distance filter)
+        visited = np.zeros(len(nodes), dtype=bool)
+        visited[0] = True
+
+        # Filter by max_distance if set
+        if has_filter:
+            depot_km = dist[0] if cost_matrix is None else haversine_matrix(
+                [start_node['lat']], [start_node['lon']],
+                [p['lat'] for p in nodes], [p['lon'] for p in nodes]
+            )[0]
+            visited |= depot_km > max_distance_km
+
+        order = _greedy_from_matrix(dist, visited, base_strategy)
+
+        if exact_max_stops is None:
+            exact_max_stops = HELD_KARP_MAX_STOPS
+        exact_max_stops = min(exact_max_stops, MAX_SUPPORTED_STOPS)
+        pending_stops = len(order) - 1
+        if base_strategy == "nearest" and 1 < pending_stops <= exact_max_stops:
+            # Small route: the optimal order is cheap, no need for local search
+            started = time.perf_counter()
+            greedy_cost = path_cost(order + [0] if round_trip else order, dist)
+            order = _solve_exact(dist, order, round_trip)
+            exact_cost = path_cost(order + [0] if round_trip else order, dist)
+            moves = []
+            if stats is not None:
+                stats.update({
+                    "strategy": "exact",
+                    "initial_cost": greedy_cost,
+                    "final_cost": exact_cost,
+                    "improvement_pct": (greedy_cost - exact_cost) / greedy_cost * 100 if greedy_cost > 0 else 0.0,
+                    "improvement_time": time.perf_counter() - started,
+                    "iterations": 0,
+                })
+    else:
+        # Large manifests: a dense matrix would cost O(n^2) memory, use the grid
+        order = _greedy_from_index(nodes, max_distance_km if has_filter else None, base_strategy)
+        if moves and len(nodes) <= DENSE_MATRIX_MAX_STOPS:
+            dist = build_distance_matrix(nodes)
+        else:
+            dist = HaversineCosts(nodes)
+
+    # Optional improvement stage (2-opt / Or-opt) on top of the greedy tour.
+    # The start stays first and, for round trips, the depot stays last.
+    if moves:
+        path = order + [0] if round_trip else order
+        path, search_stats = improve_path(
+            path, dist, closed=round_trip, moves=moves,
+            time_limit=improve_time_limit, max_iterations=improve_max_iterations
+        )
+        order = path[:-1] if round_trip else path
+        if stats is not None:
+            stats.update(search_stats)
+            stats["strategy"] = "+".join([base_strategy] + moves)
+
+    route = [nodes[i] for i in order]
+
     # Round Trip: Return to start
     if round_trip and start_node:
         # We append a COPY of start node so it appears as a distinct stop in the list
@@ -101,5 +281,5 @@ def optimize_route(locations, start_location=None, max_distance_km=None, round_t
         return_stop['id'] = 9999 # Special ID or just re-use
         return_stop['name'] = "RETORNO A DEPÓSITO"
         route.append(return_stop)
-        
+
     return route
@@ -1,40 +1,349 @@
 import requests
 import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from requests.adapters import HTTPAdapter
+from services.circuit_breaker import CircuitOpenError, get_breaker
+from services.leg_cache import create_leg_cache, leg_key
 
-OSRM_BASE_URL = "http://router.project-osrm.org/route/v1/driving"
+# Point OSRM_URL at a self-hosted OSRM (or osrm_standin.py) to avoid the public demo server
+OSRM_URL = os.getenv("OSRM_URL", "http://router.project-osrm.org").rstrip("/")
+OSRM_PROFILE = os.getenv("OSRM_PROFILE", "driving")
+
+# Max coordinates per /table request (osrm-routed --max-table-size, 100 by default)
+OSRM_TABLE_MAX_COORDS = int(os.getenv("OSRM_TABLE_MAX_COORDS", "100"))
+# Tiles fetched at the same time when a matrix has to be split
+OSRM_TABLE_CONCURRENCY = int(os.getenv("OSRM_TABLE_CONCURRENCY", "4"))
+
+# Max waypoints per /route request (osrm-routed --max-viaroute-size, and URL length);
+# longer routes are split into overlapping chunks
+OSRM_ROUTE_MAX_COORDS = int(os.getenv("OSRM_ROUTE_MAX_COORDS", "100"))
+# Route chunks fetched at the same time
+OSRM_ROUTE_CONCURRENCY = int(os.getenv("OSRM_ROUTE_CONCURRENCY", "4"))
+
+# Seconds to open a connection / to wait for the response (/table tiles get OSRM_TABLE_READ_TIMEOUT)
+OSRM_CONNECT_TIMEOUT = float(os.getenv("OSRM_CONNECT_TIMEOUT", "3"))
+OSRM_READ_TIMEOUT = float(os.getenv("OSRM_READ_TIMEOUT", "10"))
+OSRM_TABLE_READ_TIMEOUT = float(os.getenv("OSRM_TABLE_READ_TIMEOUT", "30"))
+# Extra attempts after a connection error, timeout, 429 or 5xx
+OSRM_RETRIES = int(os.getenv("OSRM_RETRIES", "2"))
+# Exponential backoff with full jitter: sleep uniform(0, min(max, base * 2**attempt))
+OSRM_BACKOFF_BASE = float(os.getenv("OSRM_BACKOFF_BASE", "0.25"))
+OSRM_BACKOFF_MAX = float(os.getenv("OSRM_BACKOFF_MAX", "4"))
+# Keep-alive connections kept per host (should cover the request threads plus table/chunk concurrency)
+OSRM_POOL_SIZE = int(os.getenv("OSRM_POOL_SIZE", "16"))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Estimates used for pairs OSRM cannot route (null cells)
+FALLBACK_SPEED_KMH = 30.0
+FALLBACK_DETOUR_FACTOR = 1.5
+
+class OSRMClient:
+    """
+    Long-lived HTTP client for one OSRM server: a pooled keep-alive session,
+    connect/read timeouts and retries with jittered exponential backoff.
+    All OSRM services used here are plain GETs, so every failure that is not
+    a definitive answer from the server (connection errors, timeouts, 429,
+    5xx) is retried; 4xx answers such as NoRoute or TooBig are returned as is.
+    With a breaker, a call whose retries are exhausted counts as one failure,
+    and calls fail fast with CircuitOpenError while the breaker is open, so
+    callers drop to their straight-line fallback at once.
+    """
+
+    def __init__(self, base_url=OSRM_URL, profile=OSRM_PROFILE, connect_timeout=OSRM_CONNECT_TIMEOUT,
+                 read_timeout=OSRM_READ_TIMEOUT, retries=OSRM_RETRIES, backoff_base=OSRM_BACKOFF_BASE,
+                 backoff_max=OSRM_BACKOFF_MAX, pool_size=OSRM_POOL_SIZE, breaker=None):
+        self.base_url = base_url.rstrip("/")
+        self.profile = profile
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.breaker = breaker
+        self.retried = 0
+        self._lock = threading.Lock()
+
+    def url(self, service, coordinates):
+        # Format coords: "lon1,lat1;lon2,lat2"
+        coord_str = ";".join([f"{lon},{lat}" for lon, lat in coordinates])
+        return f"{self.base_url}/{service}/v1/{self.profile}/{coord_str}"
+
+    def get(self, service, coordinates, params="", read_timeout=None):
+        """
+        GET /<service>/v1/<profile>/<coordinates>?<params>. Returns the
+        response of the last attempt; raises the last error if every attempt
+        failed without one.
+        """
+        url = f"{self.url(service, coordinates)}?{params}" if params else self.url(service, coordinates)
+        timeout = (self.connect_timeout, read_timeout or self.read_timeout)
+        if self.breaker is None:
+            return self._get_with_retries(url, timeout)
+
+        token = self.breaker.allow()
+        if token is None:
+            raise CircuitOpenError(self.breaker.name)
+        try:
+            response = self._get_with_retries(url, timeout)
+        except Exception:
+            self.breaker.record(token, False)
+            raise
+        self.breaker.record(token, response.status_code not in RETRY_STATUS)
+        return response
+
+    def _get_with_retries(self, url, timeout):
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.get(url, timeout=timeout)
+                if response.status_code not in RETRY_STATUS or attempt == self.retries:
+                    return response
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+            with self._lock:
+                self.retried += 1
+            time.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
+
+client = OSRMClient(breaker=get_breaker("osrm"))
+
+# Legs between rounded coordinate pairs, shared by get_osrm_route and get_osrm_legs
+leg_cache = create_leg_cache()
+
+# Snapped waypoints are vertices of the overview line; this absorbs polyline6 rounding
+WAYPOINT_MATCH_TOLERANCE = 2e-6
+
+def _split_overview(line, waypoints):
+    """
+    Cuts the overview line into one coordinate list per leg at the snapped
+    waypoint locations. Each cut is searched forward from the previous one:
+    the first vertex on the waypoint, or the closest vertex if none matches.
+    """
+    points = np.asarray(line, dtype=float).reshape(-1, 2)
+    cuts = [0]
+    for location in waypoints[1:-1]:
+        start = cuts[-1]
+        dist = np.abs(points[start:] - np.asarray(location, dtype=float)).max(axis=1)
+        on_point = dist <= WAYPOINT_MATCH_TOLERANCE
+        cuts.append(start + int(np.argmax(on_point) if on_point.any() else np.argmin(dist)))
+    cuts.append(len(points) - 1)
+    return [line[a:b + 1] for a, b in zip(cuts, cuts[1:])]
+
+def _fetch_route(coordinates):
+    """
+    One /route call; raises on any failure. Only the compact overview line is
+    requested (no per-step geometry) and cut into legs at the waypoints.
+    """
+    from services.geometry import decode_polyline
+    response = client.get("route", coordinates, "overview=full&geometries=polyline6")
+    response.raise_for_status()
+    data = response.json()
+    if data.get('code') != 'Ok' or not data.get('routes'):
+        raise RuntimeError(f"OSRM route error: {data.get('code')} {data.get('message', '')}")
+    route = data['routes'][0]
+    line = decode_polyline(route.get('geometry') or "", 6)
+    waypoints = [wp['location'] for wp in data.get('waypoints', [])]
+    if len(waypoints) == len(coordinates) and line:
+        pieces = _split_overview(line, waypoints)
+    else:
+        pieces = [[] for _ in route['legs']]
+    return [
+        {
+            "distance": leg['distance'],
+            "duration": leg['duration'],
+            # A leg that collapsed to one vertex (same snapped point twice) keeps both ends
+            "coordinates": piece if len(piece) >= 2 else [list(a), list(b)],
+        }
+        for leg, piece, a, b in zip(route['legs'], pieces, coordinates, coordinates[1:])
+    ]
+
+def route_chunks(n, size):
+    """
+    (start, end) index ranges, end inclusive, covering n waypoints in chunks
+    of at most size waypoints. Consecutive chunks share their boundary
+    waypoint, so every leg belongs to exactly one chunk.
+    """
+    size = max(size, 2)
+    chunks = []
+    start = 0
+    while start < n - 1:
+        end = min(start + size - 1, n - 1)
+        chunks.append((start, end))
+        start = end
+    return chunks
+
+def _fetch_path(coordinates):
+    """
+    Legs along a waypoint path. Paths with more than OSRM_ROUTE_MAX_COORDS
+    waypoints are fetched as overlapping chunks, up to OSRM_ROUTE_CONCURRENCY
+    at a time. Raises on any failure.
+    """
+    chunks = route_chunks(len(coordinates), OSRM_ROUTE_MAX_COORDS)
+    with ThreadPoolExecutor(max_workers=max(1, min(OSRM_ROUTE_CONCURRENCY, len(chunks)))) as pool:
+        results = pool.map(lambda chunk: _fetch_route(coordinates[chunk[0]:chunk[1] + 1]), chunks)
+        return [leg for legs in results for leg in legs]
+
+def _resolve_legs(pairs):
+    """
+    Legs for ((lon, lat), (lon, lat)) pairs: cached ones from leg_cache, the
+    rest in one batched path. Missing pairs that do not continue the previous
+    one are joined by a bridge leg, which is fetched and discarded (the same
+    trick as get_osrm_legs used to do for every pair). Raises on failure.
+    """
+    keys = [leg_key(a, b) for a, b in pairs]
+    cached = leg_cache.get_many(keys)
+    legs = [cached.get(key) for key in keys]
+
+    waypoints = []
+    owners = []  # pair index of every fetched leg, None for bridges
+    for i, (origin, destination) in enumerate(pairs):
+        if legs[i] is not None:
+            continue
+        if not waypoints:
+            waypoints.append(origin)
+        elif waypoints[-1] != origin:
+            waypoints.append(origin)
+            owners.append(None)
+        waypoints.append(destination)
+        owners.append(i)
+
+    if waypoints:
+        fetched = {}
+        for owner, leg in zip(owners, _fetch_path(waypoints)):
+            if owner is not None:
+                legs[owner] = leg
+                fetched[keys[owner]] = leg
+        leg_cache.set_many(fetched)
+    return legs
 
 def get_osrm_route(coordinates):
     """
     coordinates: List of (lon, lat) tuples. NOTE: OSRM uses Lon,Lat order.
+    Legs already in the leg cache are reused; only the missing ones are
+    requested, in as few (chunked) requests as possible.
     Returns:
         {
-            "geometry": str (encoded polyline),
+            "geometry": dict (GeoJSON LineString),
             "duration": float (seconds),
-            "distance": float (meters)
+            "distance": float (meters),
+            "legs": list (one per consecutive pair of coordinates)
         }
     or None if failed.
     """
     if not coordinates or len(coordinates) < 2:
         return None
 
-    # Format coords: "lon1,lat1;lon2,lat2"
-    coord_str = ";".join([f"{lon},{lat}" for lon, lat in coordinates])
-    
-    url = f"{OSRM_BASE_URL}/{coord_str}?overview=full&geometries=geojson"
-    
     try:
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            if data['code'] == 'Ok' and data['routes']:
-                route = data['routes'][0]
-                return {
-                    "geometry": route['geometry'], # GeoJSON format
-                    "duration": route['duration'],
-                    "distance": route['distance'],
-                    "legs": route['legs'] # Per step details
-                }
+        legs = _resolve_legs(list(zip(coordinates, coordinates[1:])))
+    except Exception as e:
+        print(f"OSRM Error: {e}")
+        return None
+
+    line = []
+    for leg in legs:
+        # Each leg starts where the previous one ended
+        line.extend(leg['coordinates'][1:] if line else leg['coordinates'])
+
+    return {
+        "geometry": {"type": "LineString", "coordinates": line}, # GeoJSON format
+        "duration": sum(leg['duration'] for leg in legs),
+        "distance": sum(leg['distance'] for leg in legs),
+        "legs": legs # Per leg details
+    }
+
+def get_osrm_legs(pairs):
+    """
+    Road distance, duration and geometry for independent legs.
+    pairs: List of ((lon, lat), (lon, lat)) tuples.
+    Cached legs are reused; the rest are chained into a single (chunked)
+    /route path, so N legs cost one round trip.
+    Returns a list of {"distance" (m), "duration" (s), "coordinates" ([lon, lat] list)}
+    aligned with pairs, or None if failed.
+    """
+    if not pairs:
+        return []
+
+    try:
+        return _resolve_legs(pairs)
     except Exception as e:
         print(f"OSRM Error: {e}")
-        
-    return None
+        return None
+
+def leg_cache_stats():
+    return leg_cache.stats()
+
+def _fetch_table_tile(coordinates, sources, destinations):
+    # One /table call for the sources x destinations block of the full matrix
+    if sources == destinations:
+        tile_coords = [coordinates[i] for i in sources]
+        params = ""
+    else:
+        tile_coords = [coordinates[i] for i in sources] + [coordinates[j] for j in destinations]
+        src_idx = ";".join(str(i) for i in range(len(sources)))
+        dst_idx = ";".join(str(len(sources) + j) for j in range(len(destinations)))
+        params = f"&sources={src_idx}&destinations={dst_idx}"
+
+    response = client.get("table", tile_coords, f"annotations=duration,distance{params}",
+                          read_timeout=OSRM_TABLE_READ_TIMEOUT)
+    response.raise_for_status()
+    data = response.json()
+    if data.get('code') != 'Ok':
+        raise RuntimeError(f"OSRM table error: {data.get('code')} {data.get('message', '')}")
+    return data['durations'], data['distances']
+
+def get_osrm_table(coordinates):
+    """
+    Full duration/distance matrix between all coordinates via OSRM /table.
+    coordinates: List of (lon, lat) tuples.
+    Manifests above OSRM_TABLE_MAX_COORDS are fetched as tiles
+    (sources x destinations blocks) and assembled.
+    Unroutable pairs are filled with a straight-line estimate.
+    Returns:
+        {
+            "durations": ndarray (seconds),
+            "distances": ndarray (meters)
+        }
+    or None if failed.
+    """
+    n = len(coordinates) if coordinates else 0
+    if n < 2:
+        return None
+
+    durations = np.full((n, n), np.nan)
+    distances = np.full((n, n), np.nan)
+
+    # Diagonal tiles only carry one block of coordinates, off-diagonal ones carry two
+    block = OSRM_TABLE_MAX_COORDS if n <= OSRM_TABLE_MAX_COORDS else max(OSRM_TABLE_MAX_COORDS // 2, 1)
+    blocks = [list(range(start, min(start + block, n))) for start in range(0, n, block)]
+    tiles = [(src, dst) for src in blocks for dst in blocks]
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(OSRM_TABLE_CONCURRENCY, len(tiles)))) as pool:
+            results = pool.map(lambda tile: _fetch_table_tile(coordinates, *tile), tiles)
+            for (src, dst), (tile_durations, tile_distances) in zip(tiles, results):
+                rows, cols = np.ix_(src, dst)
+                durations[rows, cols] = np.array(tile_durations, dtype=float)
+                distances[rows, cols] = np.array(tile_distances, dtype=float)
+    except Exception as e:
+        print(f"OSRM Table Error: {e}")
+        return None
+
+    # null cells come back as NaN: fall back to a straight-line estimate
+    missing = np.isnan(durations) | np.isnan(distances)
+    if missing.any():
+        from services.optimizer import haversine_matrix
+        lons = [lon for lon, _ in coordinates]
+        lats = [lat for _, lat in coordinates]
+        est_km = haversine_matrix(lats, lons) * FALLBACK_DETOUR_FACTOR
+        durations = np.where(missing, est_km / FALLBACK_SPEED_KMH * 3600, durations)
+        distances = np.where(missing, est_km * 1000, distances)
+
+    return {"durations": durations, "distances": distances}
@@ -3,7 +3,8 @@ import re
 
 def parse_pdf(file_path):
     """
-    Parses a PDF file and extracts a list of dicts with 'name' and 'address'.
+    Parses a PDF file and extracts a list of dicts with 'name' and 'address'
+    (plus 'quantity' when the "Cant. Bultos" column can be read).
     Supports:
     1. Specific format: "Code 0 Address" (e.g., "7145 0 AV GAONA 2759")
     2. Fallback: "Name - Address" or comma separated.
@@ -105,17 +106,29 @@ def parse_pdf(file_path):
                     address_clean = re.sub(r'\s+\d{1,2}:\d{2}.*$', '', address_clean)
                     # Remove simplified time range "9 a 14" or "9 A 14"
                     address_clean = re.sub(r'\s+\d{1,2}\s+[aA]\s+\d{1,2}.*$', '', address_clean)
+                    # Remove empty schedule placeholder "-"
+                    address_clean = re.sub(r'\s+-+$', '', address_clean)
                     
                     # Remove dangling small number at the end (Bultos) if previous token is also a number (Address Number)
                     # Pattern: "Text Number Number" -> "Text Number"
                     # e.g. "GAONA 2759 14" -> "GAONA 2759"
                     # But be careful of "Av 9 de Julio". "9" is number, "Julio" is text.
                     # Regex: `(\D+\d+)\s+\d+$`
-                    match_bultos = re.search(r'^(.+\d+)\s+\d+$', address_clean)
+                    quantity = None
+                    match_bultos = re.search(r'^(.+\d+)\s+(\d+)$', address_clean)
                     if match_bultos:
                         address_clean = match_bultos.group(1)
-                    
-                    extracted_data.append({"name": f"Cliente {len(extracted_data)+1}", "address": address_clean})
+                        quantity = int(match_bultos.group(2))
+                    elif len(parts) > 1:
+                        # Columns were kept apart: "Cant. Bultos" is the next one
+                        match_qty = re.match(r'^(\d{1,4})\b(?!:)', parts[1])
+                        if match_qty:
+                            quantity = int(match_qty.group(1))
+                    
+                    item = {"name": f"Cliente {len(extracted_data)+1}", "address": address_clean}
+                    if quantity is not None:
+                        item["quantity"] = quantity # Package count (Bultos), used by multi-vehicle routing
+                    extracted_data.append(item)
                     continue
 
                 # Method 2: Fallback (existing logic)
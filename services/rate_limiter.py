@@ -0,0 +1,109 @@
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: buckets stay per process
+    fcntl = None
+
+# Requests per second and burst size per upstream provider.
+# Override with <PROVIDER>_RATE_PER_SEC / <PROVIDER>_BURST, e.g. NOMINATIM_RATE_PER_SEC=20
+# for a self-hosted Nominatim. The public instance allows at most 1 request per second.
+DEFAULT_RATES = {
+    "nominatim": (1.0, 1),
+    "photon": (2.0, 2),
+}
+FALLBACK_RATE = (1.0, 1)
+
+# Bucket state files shared by every worker process on this host (flock'ed),
+# so the provider sees the configured rate and burst however many workers run
+RATE_LIMIT_DIR = os.getenv("RATE_LIMIT_DIR", "/tmp" if os.path.exists("/tmp") else ".")
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. acquire() reserves the next token and sleeps
+    outside the lock until it is due, so callers are served in arrival order
+    and one slow caller never holds up the bucket.
+    """
+
+    def __init__(self, rate, burst=1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        # Returns how long the caller has to wait for its token
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+class SharedTokenBucket(TokenBucket):
+    """
+    TokenBucket whose state (tokens, last update) lives in a small file locked
+    with flock, so every process on the host draws from the same bucket. The
+    lock is held only while reserving; the wait happens outside it.
+    """
+
+    _STATE = struct.Struct("dd")
+
+    def __init__(self, path, rate, burst=1):
+        super().__init__(rate, burst)
+        self.path = path
+
+    def _reserve(self):
+        # Opened per call: flock belongs to the open file, and a descriptor
+        # inherited across a fork would not exclude the other worker
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            raw = os.pread(fd, self._STATE.size, 0)
+            now = time.time()
+            if len(raw) == self._STATE.size:
+                tokens, updated = self._STATE.unpack(raw)
+            else:
+                tokens, updated = float(self.burst), now
+            tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate) - 1
+            os.pwrite(fd, self._STATE.pack(tokens, now), 0)
+        finally:
+            os.close(fd)
+        return 0.0 if tokens >= 0 else -tokens / self.rate
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(provider):
+    """
+    Bucket for a provider, created on first use from DEFAULT_RATES and the
+    environment, and shared by all worker processes on this host. Several
+    hosts (dynos) each get the full rate: set <PROVIDER>_RATE_PER_SEC to the
+    host's share when scaling out.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            rate, burst = DEFAULT_RATES.get(provider, FALLBACK_RATE)
+            prefix = provider.upper()
+            rate = float(os.getenv(f"{prefix}_RATE_PER_SEC", rate))
+            burst = int(os.getenv(f"{prefix}_BURST", burst))
+            if fcntl is not None:
+                path = os.path.join(RATE_LIMIT_DIR, f"rate_limit_{provider}.bucket")
+                limiter = SharedTokenBucket(path, rate, burst)
+            else:
+                limiter = TokenBucket(rate, burst)
+            _limiters[provider] = limiter
+        return limiter
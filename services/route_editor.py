@@ -0,0 +1,159 @@
+import numpy as np
+from services.optimizer import haversine_pairs
+
+# id used by optimize_route for the round-trip return stop
+RETURN_STOP_ID = 9999
+
+# Straight-line estimate for legs OSRM could not refresh (same as the optimize endpoint)
+FALLBACK_SPEED_KMH = 30.0
+
+# When the old geometry passes near a stop more than once, take the first pass
+# that is within this many km of the closest one
+SPLIT_TOLERANCE_KM = 0.025
+
+def is_round_trip(locations):
+    return len(locations) > 1 and locations[-1].get("id") == RETURN_STOP_ID
+
+def split_geometry(coordinates, locations):
+    """
+    Cuts a route geometry ([lon, lat] list) into one piece per leg, by
+    locating each stop on the line in order.
+    Returns a list aligned with locations: element i is the geometry of the
+    leg arriving at locations[i] (element 0 is None).
+    """
+    coords = np.asarray(coordinates, dtype=float)
+    if len(coords) < 2 or len(locations) < 2:
+        return [None] * len(locations)
+
+    pieces = [None]
+    start = 0
+    for loc in locations[1:]:
+        dists = haversine_pairs(loc["lat"], loc["lon"], coords[start:, 1], coords[start:, 0])
+        close = np.flatnonzero(dists <= dists.min() + SPLIT_TOLERANCE_KM)
+        end = start + int(close[0])
+        pieces.append(coords[start:end + 1].tolist())
+        start = end
+    return pieces
+
+def remove_stops(locations, remove_ids, dirty):
+    """
+    Drops the stops with the given ids. The start and the return stop are
+    never removed. The leg into the next surviving stop is marked dirty.
+    Returns (locations, removed).
+    """
+    remove_ids = set(remove_ids)
+    last_fixed = len(locations) - 1 if is_round_trip(locations) else None
+    kept, removed = [], []
+    pending_dirty = False
+    for i, loc in enumerate(locations):
+        if i != 0 and i != last_fixed and loc.get("id") in remove_ids:
+            removed.append(loc)
+            pending_dirty = True
+            continue
+        if pending_dirty:
+            dirty.add(id(loc))
+            pending_dirty = False
+        kept.append(loc)
+    return kept, removed
+
+def insert_stop(locations, stop, dirty):
+    """
+    Cheapest insertion: puts stop on the leg where it adds the least
+    straight-line distance (or at the end of an open route). The legs into the
+    new stop and into its successor are marked dirty.
+    """
+    round_trip = is_round_trip(locations)
+    lats = np.array([loc["lat"] for loc in locations], dtype=float)
+    lons = np.array([loc["lon"] for loc in locations], dtype=float)
+
+    to_stop = haversine_pairs(lats, lons, stop["lat"], stop["lon"])
+    # Inserting between k and k+1 costs d(k, stop) + d(stop, k+1) - d(k, k+1)
+    deltas = to_stop[:-1] + to_stop[1:] - haversine_pairs(lats[:-1], lons[:-1], lats[1:], lons[1:])
+    if not round_trip:
+        deltas = np.append(deltas, to_stop[-1])
+
+    position = int(np.argmin(deltas)) + 1 if len(deltas) else len(locations)
+    locations.insert(position, stop)
+    dirty.add(id(stop))
+    if position + 1 < len(locations):
+        dirty.add(id(locations[position + 1]))
+    return position
+
+def refresh_legs(locations, dirty, leg_pieces):
+    """
+    Recomputes distance_stop/duration_stop for dirty legs only, with a single
+    OSRM request, and rebuilds the route geometry from the untouched leg
+    pieces plus the refreshed ones.
+    leg_pieces: dict id(location) -> geometry of the leg arriving at it.
+    Returns (total_distance km, total_duration s, geometry coordinates or None).
+    """
+    from services.osrm_service import get_osrm_legs
+
+    positions = [i for i in range(1, len(locations)) if id(locations[i]) in dirty]
+    pairs = [
+        ((locations[i - 1]["lon"], locations[i - 1]["lat"]), (locations[i]["lon"], locations[i]["lat"]))
+        for i in positions
+    ]
+    legs = get_osrm_legs(pairs) if pairs else []
+
+    if legs is None:
+        # OSRM unavailable: straight-line estimate for the affected legs only
+        km = haversine_pairs(
+            [locations[i - 1]["lat"] for i in positions], [locations[i - 1]["lon"] for i in positions],
+            [locations[i]["lat"] for i in positions], [locations[i]["lon"] for i in positions]
+        )
+        legs = [
+            {"distance": d * 1000, "duration": d / FALLBACK_SPEED_KMH * 3600, "coordinates": [list(a), list(b)]}
+            for d, (a, b) in zip(km, pairs)
+        ]
+
+    for i, leg in zip(positions, legs):
+        loc = locations[i]
+        loc["distance_stop"] = leg["distance"] / 1000.0
+        loc["duration_stop"] = leg["duration"]
+        leg_pieces[id(loc)] = leg["coordinates"]
+
+    if locations:
+        locations[0]["distance_stop"] = 0.0
+        locations[0]["duration_stop"] = 0.0
+
+    geometry = []
+    for loc in locations[1:]:
+        piece = leg_pieces.get(id(loc))
+        if piece is None:
+            geometry = None
+            break
+        geometry.extend(piece[1:] if geometry else piece)
+
+    total_distance = sum(loc.get("distance_stop", 0.0) for loc in locations)
+    total_duration = sum(loc.get("duration_stop", 0.0) for loc in locations)
+    return total_distance, total_duration, geometry or None
+
+def edit_route(locations, geometry_coords=None, remove_ids=(), insert=()):
+    """
+    Applies removals then cheapest insertions to an optimized route without
+    re-optimizing it, refreshing only the legs that changed.
+    locations: the route as returned by the optimize endpoint (list of dicts)
+    geometry_coords: the route geometry as a [lon, lat] list, if available
+    insert: geocoded stops (dicts with name/address/lat/lon) to add
+    Returns (locations, removed, totals) where totals is
+    (total_distance, total_duration, geometry coordinates or None).
+    """
+    locations = [dict(loc) for loc in locations]
+    pieces = split_geometry(geometry_coords, locations) if geometry_coords else [None] * len(locations)
+    leg_pieces = {id(loc): piece for loc, piece in zip(locations, pieces) if piece is not None}
+
+    dirty = set()
+    locations, removed = remove_stops(locations, remove_ids, dirty)
+
+    next_id = max([loc.get("id", 0) for loc in locations if loc.get("id") != RETURN_STOP_ID] + [0]) + 1
+    for stop in insert:
+        stop = dict(stop)
+        if next_id == RETURN_STOP_ID:
+            next_id += 1
+        stop.setdefault("id", next_id)
+        next_id = max(next_id, stop["id"]) + 1
+        insert_stop(locations, stop, dirty)
+
+    totals = refresh_legs(locations, dirty, leg_pieces)
+    return locations, removed, totals
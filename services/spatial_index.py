@@ -0,0 +1,142 @@
+import math
+from collections import defaultdict
+import numpy as np
+from services.optimizer import EARTH_RADIUS_KM, haversine_pairs
+
+class GridIndex:
+    """
+    Uniform grid over an equirectangular projection of the points (km).
+    Supports deletion, nearest-alive lookup and radius queries, which is all
+    the greedy route builder needs. Points are referenced by their position
+    in the lat/lon arrays passed to the constructor.
+    """
+
+    def __init__(self, lats, lons, cell_km=None):
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        n = len(self.lats)
+
+        # Project around the mean latitude; distortion is negligible at city scale
+        lat0 = math.radians(float(self.lats.mean())) if n else 0.0
+        self.kx = EARTH_RADIUS_KM * math.pi / 180 * math.cos(lat0)
+        self.ky = EARTH_RADIUS_KM * math.pi / 180
+        xs = self.lons * self.kx
+        ys = self.lats * self.ky
+
+        if cell_km is None:
+            cell_km = self._auto_cell_size(xs, ys)
+        self.cell = max(cell_km, 0.01)
+
+        self.xs = xs.tolist()
+        self.ys = ys.tolist()
+        self.cells = defaultdict(set)
+        self.cell_of = []
+        for i in range(n):
+            key = (int(self.xs[i] // self.cell), int(self.ys[i] // self.cell))
+            self.cells[key].add(i)
+            self.cell_of.append(key)
+        self.alive = set(range(n))
+
+    @staticmethod
+    def _auto_cell_size(xs, ys, target_per_cell=2.0):
+        # Start from the uniform-density estimate, then shrink the cells while
+        # clustered data still piles many points into each occupied cell
+        n = len(xs)
+        if n == 0:
+            return 1.0
+        width = float(xs.max() - xs.min())
+        height = float(ys.max() - ys.min())
+        cell = math.sqrt(max(width * height, 1e-6) * target_per_cell / n)
+        for _ in range(8):
+            occupied = np.unique(np.stack((xs // cell, ys // cell)), axis=1).shape[1]
+            if n / occupied <= target_per_cell * 2 or cell <= 0.01:
+                break
+            cell /= 2
+        return cell
+
+    def __len__(self):
+        return len(self.alive)
+
+    def remove(self, i):
+        if i in self.alive:
+            self.alive.discard(i)
+            key = self.cell_of[i]
+            bucket = self.cells[key]
+            bucket.discard(i)
+            if not bucket:
+                del self.cells[key]
+
+    def _project(self, lat, lon):
+        return lon * self.kx, lat * self.ky
+
+    def nearest(self, lat, lon):
+        """
+        Alive point closest to (lat, lon), or None if the index is empty.
+        Ties resolve to the lowest index, like a linear scan would.
+        """
+        if not self.alive:
+            return None
+        x, y = self._project(lat, lon)
+        cx, cy = int(x // self.cell), int(y // self.cell)
+        xs, ys, cells = self.xs, self.ys, self.cells
+
+        best, best_d2 = None, float("inf")
+        visited_cells = 0
+        r = 0
+        while True:
+            # Once the ring walk costs more than scanning what is left, scan instead
+            if visited_cells > len(self.alive):
+                return self._scan(x, y)
+
+            if r == 0:
+                ring = ((cx, cy),)
+            else:
+                ring = [(cx + dx, cy - r) for dx in range(-r, r + 1)]
+                ring += [(cx + dx, cy + r) for dx in range(-r, r + 1)]
+                ring += [(cx - r, cy + dy) for dy in range(-r + 1, r)]
+                ring += [(cx + r, cy + dy) for dy in range(-r + 1, r)]
+
+            for key in ring:
+                bucket = cells.get(key)
+                if not bucket:
+                    continue
+                for i in bucket:
+                    d2 = (xs[i] - x) ** 2 + (ys[i] - y) ** 2
+                    if d2 < best_d2 or (d2 == best_d2 and i < best):
+                        best, best_d2 = i, d2
+            visited_cells += len(ring)
+
+            # Anything beyond ring r is at least r cells away
+            if best is not None and best_d2 <= (r * self.cell) ** 2:
+                return best
+            r += 1
+
+    def _scan(self, x, y):
+        xs, ys = self.xs, self.ys
+        return min(self.alive, key=lambda i: ((xs[i] - x) ** 2 + (ys[i] - y) ** 2, i))
+
+    def within(self, lat, lon, radius_km):
+        """
+        Alive points whose haversine distance to (lat, lon) is <= radius_km,
+        sorted by index.
+        """
+        x, y = self._project(lat, lon)
+        # Pad the box a little: the projection is only exact at the reference latitude
+        reach = int(math.ceil(radius_km * 1.05 / self.cell))
+        cx, cy = int(x // self.cell), int(y // self.cell)
+
+        candidates = []
+        if (2 * reach + 1) ** 2 > len(self.cells):
+            candidates = list(self.alive)
+        else:
+            for dx in range(-reach, reach + 1):
+                for dy in range(-reach, reach + 1):
+                    bucket = self.cells.get((cx + dx, cy + dy))
+                    if bucket:
+                        candidates.extend(bucket)
+        if not candidates:
+            return []
+
+        candidates = np.array(sorted(candidates))
+        dists = haversine_pairs(lat, lon, self.lats[candidates], self.lons[candidates])
+        return candidates[dists <= radius_km].tolist()
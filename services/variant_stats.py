@@ -0,0 +1,229 @@
+import atexit
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import select
+from services.journal_cache import JournalCache
+
+# A variant is skipped once it has been tried this many times in a context...
+MIN_TRIALS = int(os.getenv("GEOCODE_VARIANT_MIN_TRIALS", "20"))
+# ...and succeeded less often than this
+SKIP_RATE = float(os.getenv("GEOCODE_VARIANT_SKIP_RATE", "0.05"))
+# Share of lookups that still try skipped variants (last), so their stats keep updating
+EXPLORE_RATE = float(os.getenv("GEOCODE_VARIANT_EXPLORE_RATE", "0.05"))
+# Seconds between flushes of the new counts to the store (which also picks up
+# the counts of the other workers)
+FLUSH_INTERVAL = float(os.getenv("GEOCODE_VARIANT_FLUSH_INTERVAL", "30"))
+
+class JournalVariantStore:
+    """Counts in a local JournalCache under "region|pattern|variant" keys; one process only."""
+
+    def __init__(self, path):
+        self._journal = JournalCache(path)
+
+    def load(self):
+        counts = {}
+        for key in list(self._journal):
+            value = self._journal.get(key)
+            if value is None:
+                continue
+            region, pattern, variant = key.split("|", 2)
+            counts.setdefault((region, pattern), {})[variant] = list(value)
+        return counts
+
+    def add(self, deltas):
+        for (region, pattern), variants in deltas.items():
+            for variant, (tried, succeeded) in variants.items():
+                key = f"{region}|{pattern}|{variant}"
+                current = self._journal.get(key) or [0, 0]
+                self._journal[key] = [current[0] + tried, current[1] + succeeded]
+
+class DatabaseVariantStore:
+    """Counts in models.GeocodeVariantStat, shared by every worker; increments are added in one upsert."""
+
+    def __init__(self, session_factory=None):
+        import database
+        self.session_factory = session_factory or database.SessionLocal
+
+    def load(self):
+        import models
+        table = models.GeocodeVariantStat
+        counts = {}
+        with self.session_factory() as db:
+            rows = db.execute(select(table.region_bias, table.pattern, table.variant, table.tried, table.succeeded))
+            for region, pattern, variant, tried, succeeded in rows:
+                counts.setdefault((region, pattern), {})[variant] = [tried, succeeded]
+        return counts
+
+    def add(self, deltas):
+        import models
+        from services.geocode_db_cache import key_hash, upsert
+        now = datetime.utcnow()
+        rows = [{
+            "key_hash": key_hash(f"{region}|{pattern}|{variant}"),
+            "region_bias": region[:255],
+            "pattern": pattern[:100],
+            "variant": variant[:20],
+            "tried": tried,
+            "succeeded": succeeded,
+            "updated_at": now,
+        } for (region, pattern), variants in deltas.items() for variant, (tried, succeeded) in variants.items()]
+        if not rows:
+            return
+        with self.session_factory() as db:
+            upsert(db, models.GeocodeVariantStat, rows, ("updated_at",), increment=("tried", "succeeded"))
+            db.commit()
+
+def create_variant_store(backend, path=None):
+    if backend == "database":
+        return DatabaseVariantStore()
+    if backend == "journal":
+        return JournalVariantStore(path)
+    if backend == "none":
+        return None
+    raise ValueError(f"Unknown variant stats backend: {backend}")
+
+class VariantStats:
+    """
+    Success counts of the geocoder query variants ("bias", "raw", "argentina",
+    "caba") per context (region bias, address pattern), used to try the
+    historically best variant first and to drop the ones that almost never
+    resolve anything.
+
+    With a store (JournalVariantStore / DatabaseVariantStore) the counts are
+    loaded on first use and new counts are added to it in batches by a
+    background thread, which then reloads the totals, so they survive deploys
+    and every worker orders variants on the same numbers.
+    """
+
+    def __init__(self, min_trials=MIN_TRIALS, skip_rate=SKIP_RATE, explore_rate=EXPLORE_RATE, rng=None,
+                 store=None, flush_interval=FLUSH_INTERVAL):
+        self.min_trials = min_trials
+        self.skip_rate = skip_rate
+        self.explore_rate = explore_rate
+        self.rng = rng or random.Random()
+        self.store = store
+        self.flush_interval = flush_interval
+        self._counts = {}  # context -> {variant: [tried, succeeded]}, store totals plus pending
+        self._pending = {}  # context -> {variant: [tried, succeeded]} not in the store yet
+        self._loaded = store is None
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._flusher = None
+        self.skipped = 0
+
+    def _load(self):
+        if self._loaded:
+            return
+        with self._io_lock:
+            if self._loaded:
+                return
+            try:
+                stored = self.store.load()
+            except Exception as e:
+                print(f"Variant stats load error: {e}")
+                stored = {}
+            with self._lock:
+                self._counts = _merged(stored, self._pending)
+                self._loaded = True
+
+    def record(self, context, variant, success):
+        self._load()
+        with self._lock:
+            for table in (self._counts, self._pending):
+                counts = table.setdefault(context, {}).setdefault(variant, [0, 0])
+                counts[0] += 1
+                counts[1] += bool(success)
+            if self.store is not None and self._flusher is None:
+                # Started on first record, so it lives in the worker process rather than a pre-fork parent
+                self._flusher = threading.Thread(target=self._run, name="variant-stats", daemon=True)
+                self._flusher.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Adds the pending counts to the store and reloads the totals. Failed batches stay pending."""
+        if self.store is None:
+            return
+        with self._io_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            try:
+                if batch:
+                    self.store.add(batch)
+                stored = self.store.load()
+            except Exception as e:
+                print(f"Variant stats flush error: {e}")
+                with self._lock:
+                    self._pending = _merged(batch, self._pending)
+                return
+            with self._lock:
+                self._counts = _merged(stored, self._pending)
+
+    def _rate(self, counts):
+        # Laplace-smoothed success rate: untried variants start at 0.5
+        tried, succeeded = counts
+        return (succeeded + 1) / (tried + 2)
+
+    def order(self, context, attempts):
+        """
+        attempts: [(variant, query)] in the default order.
+        Returns them sorted by success rate in this context (ties keep the
+        default order), without the variants that rarely succeed.
+        """
+        self._load()
+        with self._lock:
+            stats = {variant: list(counts) for variant, counts in self._counts.get(context, {}).items()}
+
+        ranked = sorted(attempts, key=lambda attempt: -self._rate(stats.get(attempt[0], [0, 0])))
+        keep, skip = [], []
+        for attempt in ranked:
+            tried, succeeded = stats.get(attempt[0], [0, 0])
+            if tried >= self.min_trials and succeeded / tried < self.skip_rate:
+                skip.append(attempt)
+            else:
+                keep.append(attempt)
+
+        if not keep or (skip and self.rng.random() < self.explore_rate):
+            return keep + skip
+        with self._lock:
+            self.skipped += len(skip)
+        return keep
+
+    def stats(self):
+        self._load()
+        with self._lock:
+            return {
+                "skipped_attempts": self.skipped,
+                "contexts": [
+                    {
+                        "region_bias": region,
+                        "pattern": pattern,
+                        "variants": {
+                            variant: {
+                                "tried": tried,
+                                "succeeded": succeeded,
+                                "success_rate": succeeded / tried if tried else None,
+                            }
+                            for variant, (tried, succeeded) in counts.items()
+                        },
+                    }
+                    for (region, pattern), counts in self._counts.items()
+                ],
+            }
+
+def _merged(a, b):
+    # Sum of two context -> {variant: [tried, succeeded]} tables, as a new table
+    merged = {context: {variant: list(counts) for variant, counts in variants.items()} for context, variants in a.items()}
+    for context, variants in b.items():
+        for variant, (tried, succeeded) in variants.items():
+            counts = merged.setdefault(context, {}).setdefault(variant, [0, 0])
+            counts[0] += tried
+            counts[1] += succeeded
+    return merged
@@ -0,0 +1,24 @@
+import pytest
+from services.address_normalizer import cache_key, canonicalize
+
+@pytest.mark.parametrize("variant", [
+    "AV CORRIENTES 1234, C.A.B.A.",
+    "Avenida Corrientes N° 1234, CABA",
+    "av.  corrientes nro. 1.234 ,  Ciudad Autónoma de Buenos Aires",
+    "Av. Corrientes #1234, Capital Federal, Argentina",
+])
+def test_spellings_of_one_address_share_a_key(variant):
+    assert cache_key(variant, "CABA") == cache_key("Av. Corrientes 1234, CABA", "CABA")
+
+def test_region_bias_is_part_of_the_key():
+    assert cache_key("San Martín 100", "Mendoza") != cache_key("San Martín 100", "Córdoba")
+
+def test_different_house_numbers_do_not_merge():
+    assert cache_key("Florida 100", "CABA") != cache_key("Florida 1000", "CABA")
+
+def test_accents_and_leading_calle_are_folded():
+    assert canonicalize("Calle Güemes 450") == canonicalize("GUEMES 450")
+
+def test_empty_address():
+    assert canonicalize("") == ""
+    assert cache_key("", None) == "|"
@@ -0,0 +1,101 @@
+import pytest
+from services import circuit_breaker
+from services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    return clock
+
+def make_breaker(**kwargs):
+    options = dict(failure_rate=0.5, min_calls=4, window=4, open_seconds=30, half_open_probes=1)
+    options.update(kwargs)
+    return CircuitBreaker("test", **options)
+
+def fail(breaker, times):
+    for _ in range(times):
+        token = breaker.allow()
+        assert token is not None
+        breaker.record(token, False)
+
+def test_opens_once_failure_rate_reached(clock):
+    breaker = make_breaker()
+    fail(breaker, 3)
+    assert breaker.state == CLOSED  # fewer than min_calls
+    fail(breaker, 1)
+    assert breaker.state == OPEN
+    assert breaker.allow() is None
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: None)
+
+def test_successes_keep_it_closed(clock):
+    breaker = make_breaker()
+    for success in (True, False, True, True, True, False):
+        breaker.record(breaker.allow(), success)
+    assert breaker.state == CLOSED
+
+def test_half_open_probe_closes_on_success(clock):
+    breaker = make_breaker()
+    fail(breaker, 4)
+    clock.now += 30
+    assert breaker.state == HALF_OPEN
+    probe = breaker.allow()
+    assert probe is not None
+    assert breaker.allow() is None  # one probe at a time
+    breaker.record(probe, True)
+    assert breaker.state == CLOSED
+
+def test_half_open_probe_failure_reopens(clock):
+    breaker = make_breaker()
+    fail(breaker, 4)
+    clock.now += 30
+    breaker.record(breaker.allow(), False)
+    assert breaker.state == OPEN
+    assert breaker.snapshot()["retry_in_seconds"] == pytest.approx(30)
+
+def test_reset_clears_all_state(clock):
+    breaker = make_breaker(half_open_probes=2)
+    fail(breaker, 4)
+    clock.now += 30
+    breaker.record(breaker.allow(), True)  # one of two probe successes
+    breaker.reset()
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()["retry_in_seconds"] is None
+    # A later half-open period needs both probes again
+    fail(breaker, 4)
+    clock.now += 30
+    breaker.record(breaker.allow(), True)
+    assert breaker.state == HALF_OPEN
+
+@pytest.mark.parametrize("late_success", [True, False])
+def test_late_call_admitted_while_closed_does_not_decide_half_open(clock, late_success):
+    breaker = make_breaker()
+    slow = breaker.allow()  # admitted while closed, still in flight
+    fail(breaker, 4)
+    clock.now += 30
+    probe = breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # The slow call finishes now: it is not the probe and must not close or reopen the breaker
+    breaker.record(slow, late_success)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() is None  # the probe slot is still taken
+    breaker.record(probe, True)
+    assert breaker.state == CLOSED
+
+def test_late_probe_outcome_ignored_after_reopen(clock):
+    breaker = make_breaker(half_open_probes=2)
+    fail(breaker, 4)
+    clock.now += 30
+    first, second = breaker.allow(), breaker.allow()
+    breaker.record(first, False)
+    assert breaker.state == OPEN
+    breaker.record(second, True)
+    assert breaker.state == OPEN
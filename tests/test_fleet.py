@@ -0,0 +1,39 @@
+from services.fleet import split_by_capacity, stop_quantity
+
+DEPOT = {"lat": -34.70, "lon": -58.50}
+
+def make_stops(quantities):
+    return [
+        {"id": i, "lat": -34.60 + 0.01 * i, "lon": -58.40 + 0.005 * i * i, "quantity": q}
+        for i, q in enumerate(quantities)
+    ]
+
+def loads(clusters):
+    return [sum(stop_quantity(loc) for loc in cluster) for cluster in clusters]
+
+def test_sweep_leftover_goes_to_vehicle_with_room():
+    # The sweep fills vehicle 1 with [6] and vehicle 2 with [6, 4]; the last 4 fits in vehicle 1
+    clusters, unassigned = split_by_capacity(make_stops([6, 6, 4, 4]), DEPOT, 2, 10)
+    assert unassigned == []
+    assert sorted(loads(clusters)) == [10, 10]
+
+def test_every_stop_assigned_once():
+    stops = make_stops([1, 3, 2, 5, 1, 4, 2, 2])
+    clusters, unassigned = split_by_capacity(stops, DEPOT, 3, 8)
+    ids = [loc["id"] for cluster in clusters for loc in cluster] + [loc["id"] for loc in unassigned]
+    assert sorted(ids) == [loc["id"] for loc in stops]
+    assert all(load <= 8 for load in loads(clusters))
+
+def test_unassigned_only_when_no_vehicle_has_room():
+    clusters, unassigned = split_by_capacity(make_stops([6, 6, 6]), DEPOT, 2, 10)
+    assert [loc["quantity"] for loc in unassigned] == [6]
+    assert loads(clusters) == [6, 6]
+
+def test_stop_larger_than_capacity_is_unassigned():
+    clusters, unassigned = split_by_capacity(make_stops([12, 2]), DEPOT, 2, 10)
+    assert [loc["quantity"] for loc in unassigned] == [12]
+
+def test_without_capacity_loads_are_balanced():
+    clusters, unassigned = split_by_capacity(make_stops([1] * 10), DEPOT, 2)
+    assert unassigned == []
+    assert loads(clusters) == [5, 5]
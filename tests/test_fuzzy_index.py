@@ -0,0 +1,72 @@
+import random
+import string
+import time
+import pytest
+from services.address_normalizer import cache_key
+from services.fuzzy_index import FuzzyStreetIndex
+
+KNOWN = ["Avenida Corrientes 1234", "Hipólito Yrigoyen 850", "Lavalle 500", "Santa Fe 3000"]
+
+@pytest.fixture
+def index():
+    index = FuzzyStreetIndex()
+    for address in KNOWN:
+        index.add(cache_key(address, "CABA"))
+    return index
+
+def lookup(index, address, region="CABA"):
+    return index.lookup(cache_key(address, region))
+
+@pytest.mark.parametrize("query, expected", [
+    ("Avenida Corrrientes 1234", "avenida corrientes 1234|caba"),  # typo
+    ("Hipolito Irigoyen 850", "hipolito yrigoyen 850|caba"),  # accent dropped, y/i swapped
+    ("Lavalle 500 3 bultos", "lavalle 500|caba"),  # trailing count
+])
+def test_near_misses_resolve_with_a_score(index, query, expected):
+    key, score = lookup(index, query)
+    assert key == expected
+    assert index.min_score <= score <= 1.0
+
+def test_exact_key_scores_one(index):
+    assert lookup(index, "Lavalle 500") == ("lavalle 500|caba", 1.0)
+
+@pytest.mark.parametrize("query", ["Cabildo 1234", "Corrientes 1234", "Santa Rosa 3000"])
+def test_different_streets_do_not_match(index, query):
+    assert lookup(index, query) is None
+
+def test_different_house_number_or_region_does_not_match(index):
+    assert lookup(index, "Lavalle 502") is None
+    assert lookup(index, "Avenida Corrrientes 1235") is None
+    assert lookup(index, "Lavalle 500", region="Cordoba") is None
+
+def test_incremental_adds_are_found(index):
+    assert lookup(index, "Tucuman 1500") is None
+    index.add(cache_key("Tucumán 1500", "CABA"))
+    assert lookup(index, "Tucuman 1500")[0] == "tucuman 1500|caba"
+    assert lookup(index, "Tucumam 1500")[0] == "tucuman 1500|caba"
+    assert len(index) == len(KNOWN) + 1
+
+def test_lookup_on_large_index_stays_fast():
+    rng = random.Random(0)
+
+    def word():
+        return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9)))
+
+    index = FuzzyStreetIndex()
+    streets = []
+    for i in range(20_000):
+        # A third share the "avenida" trigrams, like real street lists
+        street = ("avenida " if i % 3 == 0 else "") + " ".join(word() for _ in range(rng.randint(1, 2)))
+        streets.append(street)
+        for number in range(100, 600, 100):
+            index.add(f"{street} {number}|caba")
+    assert index.stats()["entries"] >= 99_000
+
+    sample = rng.sample(streets, 200)
+    queries = [f"{street[:-1]}x {number}|caba" for street in sample for number in (100, 150)]
+    started = time.perf_counter()
+    for query in queries:
+        index.lookup(query)
+    per_query_ms = (time.perf_counter() - started) * 1000 / len(queries)
+    assert per_query_ms < 5
+    assert all(index.lookup(f"{street} 300|caba") == (f"{street} 300|caba", 1.0) for street in sample)
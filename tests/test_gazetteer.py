@@ -0,0 +1,58 @@
+import pytest
+from services.geocoding_backends import GazetteerBackend
+
+HEADER = "street,number_from,number_to,lat_from,lon_from,lat_to,lon_to,city,state\n"
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    path = tmp_path / "gazetteer.csv"
+    path.write_text(HEADER + "\n".join([
+        "Corrientes,1000,2000,-34.600,-58.380,-34.600,-58.400,Buenos Aires,CABA",
+        "Corrientes,1500,,-34.700,-58.500,,,,",  # single point inside the segment's range
+        "Belgrano,100,200,-32.940,-60.640,-32.940,-60.660,Rosario,Santa Fe",
+        "Belgrano,100,200,-31.410,-64.180,-31.410,-64.200,Cordoba,Cordoba",
+        "Lavalle,500,,-34.601,-58.377,,,Buenos Aires,CABA",
+    ]) + "\n", encoding="utf-8")
+    return GazetteerBackend(str(path))
+
+def test_point_hit(gazetteer):
+    lat, lon, details = gazetteer.query("Lavalle 500")
+    assert (lat, lon) == (-34.601, -58.377)
+    assert details == {"city": "Buenos Aires", "state": "CABA"}
+    assert gazetteer.query("Lavalle 502") is None
+
+def test_interpolates_along_the_segment(gazetteer):
+    lat, lon, _ = gazetteer.query("Corrientes 1250, Buenos Aires")
+    assert lat == pytest.approx(-34.600)
+    assert lon == pytest.approx(-58.385)
+    lat, lon, _ = gazetteer.query("Corrientes 2000")
+    assert lon == pytest.approx(-58.400)
+
+def test_out_of_range_numbers_and_unknown_streets_return_none(gazetteer):
+    assert gazetteer.query("Corrientes 999") is None
+    assert gazetteer.query("Corrientes 2001") is None
+    assert gazetteer.query("Corrientes") is None
+    assert gazetteer.query("Florida 100") is None
+
+def test_segment_chosen_by_city(gazetteer):
+    lat, lon, details = gazetteer.query("Belgrano 150, Cordoba")
+    assert details["city"] == "Cordoba"
+    assert lon == pytest.approx(-64.190)
+    lat, lon, details = gazetteer.query("Belgrano 150 Rosario")
+    assert details["city"] == "Rosario"
+    assert lon == pytest.approx(-60.650)
+
+def test_malformed_rows_are_skipped(tmp_path, capsys):
+    path = tmp_path / "gazetteer.csv"
+    path.write_text(HEADER + "\n".join([
+        "Lavalle,500,,-34.601,-58.377,,,,",
+        "Lavalle,,,-34.601,-58.377,,,,",  # blank number
+        "Lavalle,s/n,,-34.601,-58.377,,,,",  # non-numeric number
+        "Lavalle,600,700,-34.601,-58.377,,,,",  # segment without an end point
+        ",100,,-34.601,-58.377,,,,",  # blank street
+        "Tucuman,100",  # short row
+    ]) + "\n", encoding="utf-8")
+    gazetteer = GazetteerBackend(str(path))
+    assert gazetteer.skipped_rows == 5
+    assert "skipped 5 malformed rows" in capsys.readouterr().out
+    assert gazetteer.query("Lavalle 500") is not None
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from services.geometry import decode_polyline, encode_polyline, format_geometry, parse_geometry, simplify
+
+def random_line(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0, 0.001, size=(n, 2))
+    return (np.array([-58.3816, -34.6037]) + np.cumsum(steps, axis=0)).tolist()
+
+def test_known_encoding():
+    # Example from the encoded polyline algorithm documentation (lat, lon order inside the encoding)
+    coords = [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]]
+    assert encode_polyline(coords) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    assert decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@") == coords
+
+@pytest.mark.parametrize("precision", [5, 6])
+def test_round_trip(precision):
+    line = random_line()
+    decoded = decode_polyline(encode_polyline(line, precision), precision)
+    assert len(decoded) == len(line)
+    assert np.abs(np.array(decoded) - np.array(line)).max() <= 0.5 / 10 ** precision + 1e-12
+
+@pytest.mark.parametrize("geometry_format", ["geojson", "polyline", "polyline6"])
+def test_format_and_parse(geometry_format):
+    line = random_line(50)
+    parsed = parse_geometry(format_geometry(line, geometry_format), geometry_format)
+    assert np.allclose(parsed, line, atol=1e-5)
+
+def test_parse_legacy_geojson_string_and_garbage():
+    assert parse_geometry('{"type": "LineString", "coordinates": [[1, 2], [3, 4]]}') == [[1, 2], [3, 4]]
+    assert parse_geometry("not json") is None
+    assert parse_geometry(None) is None
+
+def test_simplify_keeps_endpoints_and_drops_collinear_points():
+    line = [[-58.0 + i * 0.0001, -34.0] for i in range(11)]
+    assert simplify(line, 1.0) == [line[0], line[-1]]
+
+def test_simplify_keeps_points_beyond_tolerance():
+    line = [[-58.0, -34.0], [-57.999, -33.99], [-57.998, -34.0]]  # about 1.1 km detour
+    assert simplify(line, 100.0) == line
+    assert simplify(line, 5000.0) == [line[0], line[-1]]
+
+def test_simplified_line_stays_within_tolerance():
+    line = random_line(500, seed=3)
+    kept = simplify(line, 20.0)
+    assert 2 <= len(kept) < len(line)
+    assert kept[0] == line[0] and kept[-1] == line[-1]
+    assert all(point in line for point in kept)
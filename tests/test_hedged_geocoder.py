@@ -0,0 +1,110 @@
+import threading
+import time
+import pytest
+from services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from services.geocoding_backends import GeocoderBackend
+from services.hedged_geocoder import HedgedGeocoder
+
+class StubProvider(GeocoderBackend):
+    """Answers after `delay` seconds with `answer` (an exception instance is raised)."""
+
+    def __init__(self, name, answer, delay=0.0, limiter=None, max_concurrency=4, breaker=None):
+        self.name = name
+        self.answer = answer
+        self.delay = delay
+        self.limiter = limiter
+        self.max_concurrency = max_concurrency
+        self.breaker = breaker
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def query(self, query):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if isinstance(self.answer, Exception):
+            raise self.answer
+        return self.answer
+
+class SlowLimiter:
+    """Rate limiter stand-in: every token takes `wait` seconds."""
+
+    def __init__(self, wait):
+        self.wait = wait
+
+    def acquire(self):
+        time.sleep(self.wait)
+
+PRIMARY = (-34.60, -58.38, {"source": "primary"})
+SECONDARY = (-34.61, -58.39, {"source": "secondary"})
+
+def test_first_answer_wins_without_hedging():
+    primary = StubProvider("primary", PRIMARY, delay=0.01)
+    secondary = StubProvider("secondary", SECONDARY)
+    geocoder = HedgedGeocoder([primary, secondary], hedge_delay=0.5)
+    assert geocoder.query("Corrientes 1234") == PRIMARY
+    assert secondary.calls == 0
+
+def test_hedges_only_after_the_delay():
+    primary = StubProvider("primary", PRIMARY, delay=0.5)
+    secondary = StubProvider("secondary", SECONDARY, delay=0.01)
+    geocoder = HedgedGeocoder([primary, secondary], hedge_delay=0.1)
+    started = time.perf_counter()
+    assert geocoder.query("Corrientes 1234") == SECONDARY
+    elapsed = time.perf_counter() - started
+    assert 0.1 <= elapsed < 0.4
+    stats = {p["name"]: p for p in geocoder.stats()["providers"]}
+    assert stats["secondary"]["hedged"] == 1
+    assert stats["secondary"]["wins"] == 1
+
+def test_local_queueing_does_not_trigger_a_hedge():
+    # The token wait (0.3 s) is longer than hedge_delay, the upstream itself is fast
+    primary = StubProvider("primary", PRIMARY, delay=0.02, limiter=SlowLimiter(0.3), max_concurrency=1)
+    secondary = StubProvider("secondary", SECONDARY)
+    geocoder = HedgedGeocoder([primary, secondary], hedge_delay=0.1)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(geocoder.query("x"))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [PRIMARY] * 3
+    assert secondary.calls == 0
+
+@pytest.mark.parametrize("answer", [None, RuntimeError("upstream 500")])
+def test_empty_or_failed_answer_moves_on_at_once(answer):
+    primary = StubProvider("primary", answer)
+    secondary = StubProvider("secondary", SECONDARY)
+    geocoder = HedgedGeocoder([primary, secondary], hedge_delay=5.0)
+    started = time.perf_counter()
+    assert geocoder.query("x") == SECONDARY
+    assert time.perf_counter() - started < 1.0
+
+def test_all_empty_returns_none():
+    providers = [StubProvider("a", None), StubProvider("b", None)]
+    assert HedgedGeocoder(providers, hedge_delay=0.05).query("nowhere") is None
+    assert all(p.calls == 1 for p in providers)
+
+def test_errors_are_raised_not_treated_as_a_miss():
+    providers = [StubProvider("a", RuntimeError("timeout")), StubProvider("b", None)]
+    with pytest.raises(RuntimeError):
+        HedgedGeocoder(providers, hedge_delay=0.05).query("x")
+
+def test_every_provider_short_circuited_raises_circuit_open():
+    breakers = [CircuitBreaker(name, min_calls=1, window=1) for name in ("a", "b")]
+    for breaker in breakers:
+        breaker.record(breaker.allow(), False)
+    providers = [StubProvider(b.name, PRIMARY, breaker=b) for b in breakers]
+    with pytest.raises(CircuitOpenError):
+        HedgedGeocoder(providers, hedge_delay=0.05).query("x")
+    assert all(p.calls == 0 for p in providers)
+
+def test_latency_percentiles():
+    primary = StubProvider("primary", PRIMARY, delay=0.02)
+    geocoder = HedgedGeocoder([primary], hedge_delay=1.0)
+    for _ in range(5):
+        geocoder.query("x")
+    stats = geocoder.stats()["providers"][0]
+    assert stats["calls"] == 5 and stats["wins"] == 5
+    assert 20 <= stats["p50_ms"] < 200
+    assert stats["p99_ms"] >= stats["p50_ms"]
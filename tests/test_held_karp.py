@@ -0,0 +1,38 @@
+import itertools
+import numpy as np
+import pytest
+from services.held_karp import MAX_SUPPORTED_STOPS, solve_held_karp
+from services.local_search import path_cost
+
+def brute_force(cost, closed):
+    n = len(cost)
+    best = None
+    for perm in itertools.permutations(range(1, n)):
+        path = [0, *perm] + ([0] if closed else [])
+        total = path_cost(path, cost)
+        if best is None or total < best:
+            best = total
+    return best
+
+@pytest.mark.parametrize("n", [2, 3, 5, 8])
+@pytest.mark.parametrize("closed", [False, True])
+@pytest.mark.parametrize("seed", range(3))
+def test_matches_brute_force(n, closed, seed):
+    rng = np.random.default_rng(seed)
+    cost = rng.uniform(1, 100, size=(n, n))  # asymmetric
+    np.fill_diagonal(cost, 0.0)
+    order, total = solve_held_karp(cost, closed=closed)
+
+    assert order[0] == 0
+    assert sorted(order) == list(range(n))
+    walked = path_cost(order + ([0] if closed else []), cost)
+    assert total == pytest.approx(walked)
+    assert total == pytest.approx(brute_force(cost, closed))
+
+def test_single_node():
+    assert solve_held_karp(np.zeros((1, 1))) == ([0], 0.0)
+
+def test_too_many_stops():
+    n = MAX_SUPPORTED_STOPS + 2
+    with pytest.raises(ValueError):
+        solve_held_karp(np.ones((n, n)))
@@ -0,0 +1,26 @@
+from services import leg_cache
+from services.leg_cache import JournalLegStore, LegCache, leg_key
+
+LEG = {"distance": 100.0, "duration": 10.0, "coordinates": [[0, 0], [1, 1]]}
+
+def test_leg_key_rounds_coordinates():
+    assert leg_key((-58.381601, -34.603702), (-58.4, -34.6)) == leg_key((-58.3816, -34.6037), (-58.4, -34.6))
+    assert leg_key((0, 0), (1, 1)) != leg_key((1, 1), (0, 0))
+
+def test_journal_store_evicts_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(leg_cache, "EVICT_CHECK_EVERY", 1)
+    store = JournalLegStore(str(tmp_path / "legs.jsonl"), max_entries=3)
+    cache = LegCache(store)
+    for key in "abc":
+        cache.set_many({key: LEG})
+    cache.get_many(["a"])  # a is now the most recently used
+    cache.set_many({"d": LEG})
+    assert sorted(store.get_many(list("abcd"))) == ["a", "c", "d"]
+    assert store.evictions == 1
+
+def test_leg_geometry_column_is_mediumtext_on_mysql():
+    from sqlalchemy.dialects import mysql
+    from sqlalchemy.schema import CreateTable
+    import models
+    ddl = str(CreateTable(models.OSRMLegCacheEntry.__table__).compile(dialect=mysql.dialect()))
+    assert "geometry MEDIUMTEXT" in ddl
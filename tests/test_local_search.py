@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from services.local_search import improve_path, path_cost
+
+def random_costs(n, seed, symmetric=True):
+    rng = np.random.default_rng(seed)
+    points = rng.random((n, 2))
+    cost = np.linalg.norm(points[:, None] - points[None, :], axis=2)
+    if not symmetric:
+        cost = cost * rng.uniform(0.8, 1.2, size=cost.shape)
+        np.fill_diagonal(cost, 0.0)
+    return cost
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("closed", [False, True])
+@pytest.mark.parametrize("symmetric", [True, False])
+def test_never_increases_cost(seed, closed, symmetric):
+    cost = random_costs(30, seed, symmetric)
+    path = list(range(30)) + ([0] if closed else [])
+    improved, stats = improve_path(path, cost, closed=closed, max_iterations=10_000, time_limit=5)
+    assert path_cost(improved, cost) <= path_cost(path, cost) + 1e-9
+    assert stats["final_cost"] == pytest.approx(path_cost(improved, cost))
+
+@pytest.mark.parametrize("closed", [False, True])
+def test_keeps_fixed_endpoints_and_stops(closed):
+    cost = random_costs(25, 7)
+    path = list(range(25)) + ([0] if closed else [])
+    improved, _ = improve_path(path, cost, closed=closed, max_iterations=10_000, time_limit=5)
+    assert improved[0] == 0
+    assert sorted(improved) == sorted(path)
+    if closed:
+        assert improved[-1] == 0
+
+@pytest.mark.parametrize("moves", [("2opt",), ("oropt",), ("2opt", "oropt")])
+@pytest.mark.parametrize("limit", [1, 3])
+def test_max_iterations_caps_moves(moves, limit):
+    cost = random_costs(60, 3)
+    _, stats = improve_path(list(range(60)), cost, moves=moves, max_iterations=limit)
+    assert stats["iterations"] == limit
+
+def test_zero_time_limit_applies_no_moves():
+    cost = random_costs(60, 3)
+    path = list(range(60))
+    improved, stats = improve_path(path, cost, time_limit=0)
+    assert stats["iterations"] == 0
+    assert improved == path
@@ -0,0 +1,24 @@
+from services.osrm_service import _split_overview
+
+def test_split_overview_cuts_at_waypoints():
+    line = [[0, 0], [0, 1], [1, 1], [1, 2], [2, 2]]
+    waypoints = [[0, 0], [1, 1], [2, 2]]
+    assert _split_overview(line, waypoints) == [[[0, 0], [0, 1], [1, 1]], [[1, 1], [1, 2], [2, 2]]]
+
+def test_split_overview_searches_forward():
+    # The route passes the second waypoint's location before reaching it as a stop
+    line = [[0, 0], [1, 1], [2, 0], [1, 1], [0, 2]]
+    waypoints = [[0, 0], [2, 0], [1, 1], [0, 2]]
+    legs = _split_overview(line, waypoints)
+    assert legs == [[[0, 0], [1, 1], [2, 0]], [[2, 0], [1, 1]], [[1, 1], [0, 2]]]
+
+def test_split_overview_falls_back_to_closest_vertex():
+    line = [[0, 0], [0, 1], [0, 2]]
+    legs = _split_overview(line, [[0, 0], [0.001, 1.0001], [0, 2]])
+    assert legs == [[[0, 0], [0, 1]], [[0, 1], [0, 2]]]
+
+def test_route_chunks_share_boundaries():
+    from services.osrm_service import route_chunks
+    assert route_chunks(250, 100) == [(0, 99), (99, 198), (198, 249)]
+    assert route_chunks(100, 100) == [(0, 99)]
+    assert route_chunks(2, 100) == [(0, 1)]
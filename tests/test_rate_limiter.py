@@ -0,0 +1,30 @@
+import multiprocessing
+import time
+from services.rate_limiter import SharedTokenBucket, TokenBucket
+
+def test_token_bucket_spaces_calls():
+    bucket = TokenBucket(rate=20, burst=1)
+    started = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    # The first token is free, the other four come every 50 ms
+    assert time.monotonic() - started >= 0.19
+
+def _drain(path, count, queue):
+    bucket = SharedTokenBucket(path, rate=20, burst=1)
+    for _ in range(count):
+        bucket.acquire()
+    queue.put(time.time())
+
+def test_shared_bucket_is_one_budget_across_processes(tmp_path):
+    path = str(tmp_path / "bucket")
+    queue = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_drain, args=(path, 5, queue)) for _ in range(3)]
+    started = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    finished = max(queue.get() for _ in workers)
+    # 15 tokens at 20/s with a burst of 1: at least 14 waits of 50 ms
+    assert finished - started >= 0.65
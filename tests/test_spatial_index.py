@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from services.optimizer import haversine_pairs
+from services.spatial_index import GridIndex
+
+def random_points(n, seed, clustered=False):
+    rng = np.random.default_rng(seed)
+    spread = 0.01 if clustered else 0.2
+    lats = -34.6 + rng.normal(0, spread, n)
+    lons = -58.4 + rng.normal(0, spread, n)
+    return lats, lons
+
+def brute_nearest(lats, lons, alive, lat, lon, index):
+    # Same planar metric as the index
+    x, y = lon * index.kx, lat * index.ky
+    return min(alive, key=lambda i: ((lons[i] * index.kx - x) ** 2 + (lats[i] * index.ky - y) ** 2, i))
+
+@pytest.mark.parametrize("clustered", [False, True])
+def test_nearest_matches_linear_scan_while_removing(clustered):
+    lats, lons = random_points(300, 1, clustered)
+    index = GridIndex(lats, lons)
+    alive = set(range(300))
+    rng = np.random.default_rng(2)
+    for _ in range(299):
+        lat, lon = -34.6 + rng.normal(0, 0.2), -58.4 + rng.normal(0, 0.2)
+        found = index.nearest(lat, lon)
+        assert found == brute_nearest(lats, lons, alive, lat, lon, index)
+        index.remove(found)
+        alive.discard(found)
+    assert len(index) == 1
+
+def test_nearest_on_empty_index():
+    index = GridIndex([-34.6], [-58.4])
+    index.remove(0)
+    assert index.nearest(-34.6, -58.4) is None
+
+@pytest.mark.parametrize("radius_km", [0.5, 5, 50])
+def test_within_matches_haversine(radius_km):
+    lats, lons = random_points(400, 5)
+    index = GridIndex(lats, lons)
+    for i in range(0, 400, 40):
+        index.remove(i)
+    dists = haversine_pairs(-34.6, -58.4, lats, lons)
+    expected = [i for i in range(400) if dists[i] <= radius_km and i % 40 != 0]
+    assert list(index.within(-34.6, -58.4, radius_km)) == expected
@@ -0,0 +1,26 @@
+import random
+from services.variant_stats import JournalVariantStore, VariantStats
+
+CONTEXT = ("caba", "avenida+numero")
+ATTEMPTS = [("bias", "q1"), ("raw", "q2"), ("argentina", "q3")]
+
+def test_best_variant_first_and_rare_ones_dropped():
+    stats = VariantStats(min_trials=10, skip_rate=0.1, explore_rate=0.0, rng=random.Random(1))
+    for _ in range(10):
+        stats.record(CONTEXT, "bias", False)
+        stats.record(CONTEXT, "argentina", True)
+    assert stats.order(CONTEXT, ATTEMPTS) == [("argentina", "q3"), ("raw", "q2")]
+
+def test_counts_survive_a_restart(tmp_path):
+    path = str(tmp_path / "variants.jsonl")
+    first = VariantStats(store=JournalVariantStore(path), flush_interval=3600)
+    for _ in range(3):
+        first.record(CONTEXT, "raw", True)
+    first.flush()
+    first.store._journal.flush()
+
+    second = VariantStats(store=JournalVariantStore(path), flush_interval=3600)
+    second.record(CONTEXT, "raw", False)
+    second.flush()
+    assert second.stats()["contexts"][0]["variants"]["raw"]["tried"] == 4
+    assert second.stats()["contexts"][0]["variants"]["raw"]["succeeded"] == 3
@@ -0,0 +1,65 @@
+"""
+Geocodes a customer list into the persistent geocode cache ahead of time, so
+the morning uploads are served from cache instead of queueing on Nominatim.
+
+Runs under the same rate limits and cache backend as the API (same
+environment variables). Progress is saved after every chunk; an interrupted
+run is continued with --resume.
+
+    python warm_geocode_cache.py customers.xlsx --start-row 16 --address-col B --start-address "Av. Corrientes 1234, CABA"
+    python warm_geocode_cache.py customers.csv --csv-column direccion --region-bias "Buenos Aires, Argentina"
+    python warm_geocode_cache.py --resume 3f2a9c1b7e40
+"""
+import argparse
+import sys
+from services.cache_warmer import WarmupJob, read_addresses, resolve_region_bias
+from services.circuit_breaker import CircuitOpenError
+
+def print_progress(progress):
+    eta = f"{progress['eta_seconds']:.0f}s" if progress["eta_seconds"] is not None else "?"
+    rate = progress["throughput_per_second"] or 0
+    print(f"[{progress['job_id']}] {progress['processed']}/{progress['total']} "
+          f"hits={progress['hits']} misses={progress['misses']} failed={progress['failed']} "
+          f"{rate:.2f}/s ETA {eta}", flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", nargs="?", help="Excel (.xlsx) or CSV file with the addresses")
+    parser.add_argument("--start-row", type=int, default=1, help="first Excel row with data")
+    parser.add_argument("--address-col", default="A", help="Excel column with the address")
+    parser.add_argument("--csv-column", help="CSV header name or 0-based column index")
+    parser.add_argument("--region-bias", help="region bias used for the cache keys")
+    parser.add_argument("--start-address", help="derive the region bias from this start address, like the API does")
+    parser.add_argument("--resume", metavar="JOB_ID", help="continue an interrupted job")
+    args = parser.parse_args()
+
+    if args.resume:
+        job = WarmupJob.load(args.resume)
+        if job is None:
+            sys.exit(f"No warm-up job {args.resume}")
+    elif args.file:
+        addresses = read_addresses(args.file, args.start_row, args.address_col, args.csv_column)
+        try:
+            region_bias = resolve_region_bias(args.region_bias, args.start_address)
+        except CircuitOpenError as e:
+            sys.exit(f"Could not geocode the start address: {e}")
+        job = WarmupJob.create(addresses, region_bias, source=args.file)
+        print(f"Job {job.state['id']}: {job.state['total']} unique addresses, region bias {job.state['region_bias']!r}")
+    else:
+        parser.error("a file or --resume is required")
+
+    try:
+        progress = job.run(on_progress=print_progress)
+    except KeyboardInterrupt:
+        # The last finished chunk is already saved
+        job.state["status"] = "paused"
+        job.save()
+        sys.exit(f"Interrupted, continue with --resume {job.state['id']}")
+
+    if progress["error"]:
+        sys.exit(f"Stopped ({progress['status']}): {progress['error']}. Continue with --resume {job.state['id']}")
+    print(f"Done in {progress['elapsed_seconds']}s: {progress['hits']} already cached, "
+          f"{progress['misses']} geocoded, {progress['failed']} not found")
+
+if __name__ == "__main__":
+    main()